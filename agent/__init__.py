@@ -1,5 +1,6 @@
 """Agent module for DreamDiary AI."""
 
 from .dream_agent import DreamDiaryAgent
+from .resilience import FallbackReply
 
-__all__ = ['DreamDiaryAgent']
+__all__ = ['DreamDiaryAgent', 'FallbackReply']
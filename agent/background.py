@@ -0,0 +1,98 @@
+"""Bounded background job queue for work that must not delay the reply."""
+
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, List, Optional, Set
+
+from utils.metrics import ERRORS, QUEUE_DEPTH
+
+
+class BackgroundQueue:
+    """Run coroutine jobs on a fixed pool of asyncio workers.
+
+    ``submit`` waits while the queue is full, so a burst of dreams slows
+    down admission instead of piling up unbounded pending work. Jobs that
+    need another result first hand the rest of their work to ``after``,
+    which waits without holding a worker.
+
+    Workers run in an empty context, not in the one of the update that
+    happened to start them, so their spans and other context variables
+    never leak into later jobs. Call ``start`` from the application's
+    startup hook; ``submit`` starts them otherwise.
+    """
+
+    def __init__(self, maxsize: int = 100, workers: int = 4):
+        self.maxsize = maxsize
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._waiting: Set[asyncio.Task] = set()
+        QUEUE_DEPTH.set_function(self.qsize, queue="background")
+
+    def _ensure_started(self):
+        """Create the queue and workers on the running event loop."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._tasks = [
+                asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+            ]
+
+    async def start(self):
+        """Start the workers now, e.g. from Application.post_init."""
+        self._ensure_started()
+
+    @staticmethod
+    async def _run(job: Callable[[], Awaitable]):
+        try:
+            await job()
+        except Exception as e:
+            ERRORS.inc(stage="background")
+            logging.error(f"Background job failed: {e}", exc_info=True)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def submit(self, job: Callable[[], Awaitable]):
+        """Enqueue a job factory, waiting for a free slot if the queue is full."""
+        self._ensure_started()
+        await self._queue.put(job)
+
+    def after(self, future: asyncio.Future, job: Callable[[], Awaitable]):
+        """Run a job once ``future`` has a result, without occupying a worker meanwhile.
+
+        Nothing runs if the future is cancelled or fails.
+        """
+        async def wait_then_run():
+            await asyncio.wait({future})
+            if not future.cancelled() and future.exception() is None:
+                await self._run(job)
+
+        task = asyncio.get_running_loop().create_task(wait_then_run())
+        self._waiting.add(task)
+        task.add_done_callback(self._waiting.discard)
+
+    def qsize(self) -> int:
+        """Number of jobs waiting to be picked up."""
+        return self._queue.qsize() if self._queue else 0
+
+    async def join(self):
+        """Wait until every submitted job, and every job it deferred with ``after``, has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+        while self._waiting:
+            await asyncio.gather(*self._waiting, return_exceptions=True)
+
+    async def close(self):
+        """Drain pending jobs and stop the workers."""
+        await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
@@ -0,0 +1,139 @@
+"""Content-addressed cache for deterministic-enough LLM lookups."""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from db.repositories import ResponseCacheRepository
+
+
+def normalize_input(text: str) -> str:
+    """Case- and whitespace-insensitive form of a user input."""
+    return " ".join(text.lower().split())
+
+
+def cache_key(model: str, prompt_parts: Iterable[str]) -> str:
+    """Hash the model name and the full prompt into a cache key."""
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for part in prompt_parts:
+        digest.update(b"\x1f")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DatabaseCacheBackend:
+    """Persistent cache stored in the response_cache table."""
+
+    def __init__(self, ttl: float = 7 * 24 * 3600):
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        return ResponseCacheRepository.get(key)
+
+    def set(self, key: str, value: str):
+        ResponseCacheRepository.set(key, value, self.ttl)
+
+
+class ResponseCache:
+    """Two-level response cache: an in-process front and an optional persistent backend.
+
+    Memory hits are served synchronously; the persistent backend is only
+    consulted on a memory miss and its hits are promoted to memory.
+    """
+
+    def __init__(self, memory: MemoryCacheBackend = None, persistent=None):
+        self.memory = memory or MemoryCacheBackend()
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self._get_persistent(key)
+        self._count(value)
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = await asyncio.to_thread(self._get_persistent, key)
+        self._count(value)
+        return value
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self._set_persistent(key, value)
+
+    async def aset(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await asyncio.to_thread(self._set_persistent, key, value)
+
+    def _get_persistent(self, key: str) -> Optional[str]:
+        try:
+            value = self.persistent.get(key)
+        except Exception as e:
+            logging.warning(f"Response cache lookup failed: {e}")
+            return None
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def _set_persistent(self, key: str, value: str):
+        try:
+            self.persistent.set(key, value)
+        except Exception as e:
+            logging.warning(f"Response cache store failed: {e}")
+
+    def _count(self, value: Optional[str]):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self.memory),
+        }
@@ -1,70 +1,334 @@
-"""Dream Agent using Claude."""
+"""Dream Agent using Claude.
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from typing import List, Dict, Any
+langchain is imported on first use rather than at module import, so the
+bot process starts without paying for the LLM stack.
+"""
+
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+import asyncio
+import logging
 import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from config import Config
-from db.repositories import UserRepository, DreamRepository, ClassificationRepository, ChatHistoryRepository
+from db.repositories import DreamRecord, DreamRepository
+from db.writer import DreamWriter
+from db.database import init_db
 from db.mappers import EmotionMapper
+from utils.metrics import ERRORS, LLM_TOKENS, STAGE_SECONDS
+from utils.tracing import span
+from .background import BackgroundQueue
+from .sessions import SessionStore, aload_history_from_db
+from .history import HistoryManager, HistoryWindow, estimate_tokens
+from .cache import ResponseCache, MemoryCacheBackend, DatabaseCacheBackend, cache_key, normalize_input
+from .usage import TokenUsage
+from .resilience import CircuitBreaker, FallbackReply, LLMUnavailableError, ResilientCaller
+from .schema import ANALYSIS_TOOL, AnalysisValidationError, DreamAnalysis, analysis_from_message
 
 
 class DreamDiaryAgent:
     """AI agent for dream analysis and diary management."""
 
+    # Static system prompt, sent as a prompt-cache breakpoint on every analysis call
+    SYSTEM_PROMPT = (
+        "You are DreamDiary AI, a thoughtful and empathetic dream analyst "
+        "grounded in verified psychological and philosophical models "
+        "(e.g., Jungian archetypes, Freudian unconscious, existential philosophy, cognitive behavioral theories). "
+        "\n\n"
+        "Be moderately strict in interpretations—base all insights on scientific "
+        "evidence and established theories, avoiding speculation. Use chain-of-thought reasoning: "
+        "first analyze elements, then connect to theories, then provide interpretation. "
+        "\n\n"
+        "Adapt your tone to the user's style: if they are casual or open, respond "
+        "warmly and conversationally; if formal or reserved, be more structured and "
+        "precise. If no user info is provided, default to a balanced, professional "
+        "tone with clarity and accuracy. "
+        "\n\n"
+        "Always verify facts against psychological literature, explain concepts "
+        "simply yet rigorously, and ensure formulations are precise. Cite key theorists "
+        "briefly where relevant (e.g., 'As Jung noted...'). "
+        "\n\n"
+        "When analyzing dreams: "
+        "1. Break down key elements: symbols, emotions, narrative structure. "
+        "2. Identify primary emotions and their intensity (e.g., joy: high, fear: moderate). "
+        "3. Reference relevant psychological theories (Jung, Freud, CBT, etc.) with evidence. "
+        "4. Provide a balanced interpretation: personal meaning, universal insights. "
+        "5. Suggest a brief guided meditation (2-3 minutes) tailored to the emotions and symbols. "
+        "6. Offer actionable advice for reflection or journaling. "
+        "\n\n"
+        "Structure responses clearly: Use sections like 'Key Elements', 'Emotional Analysis', "
+        "'Psychological Interpretation', 'Guided Meditation', 'Reflection Tips'. "
+        "\n\n"
+        "Keep responses supportive, evidence-based, and comprehensive but concise (aim for 300-500 words)."
+        "\n\n"
+        "Respond in the same language as the user's input. If the input is in Russian, respond in Russian; if in English, respond in English."
+    )
+
+    # Anthropic caches no prompt prefix shorter than this (2048 tokens for Haiku, 1024 for
+    # Sonnet and Opus); a cache_control breakpoint before that point is silently ignored
+    MIN_CACHEABLE_TOKENS = 2048
+
+    # Reply when the model cannot be reached and the breaker serves the fallback
+    FALLBACK_REPLY = (
+        "I can't analyze dreams right now because the analysis service is unavailable. "
+        "Your dream was not saved; please send it again in a few minutes."
+    )
+    # Served instead when the user already got an analysis of the same dream
+    CACHED_FALLBACK_PREFIX = (
+        "The analysis service is unavailable right now, so here is the analysis you got "
+        "for this dream before:\n\n"
+    )
+
     def __init__(self, anthropic_api_key: str = None):
         """Initialize the agent with Claude."""
         self.api_key = anthropic_api_key or Config.ANTHROPIC_TOKEN
-        self.llm = ChatAnthropic(
-            temperature=0.92,
-            anthropic_api_key=self.api_key,
-            model="claude-3-haiku-20240307",
-            # max_tokens=600
+        self.model_name = "claude-3-haiku-20240307"
+        self._llm = None
+        self._structured_llm = None
+        self._emotion_classifier = None
+        self._dream_index = None
+        self._dream_index_lock = threading.Lock()  # writer threads and warm_up may open it at once
+        self.sessions = SessionStore(
+            max_sessions=Config.SESSION_MAX_USERS,
+            ttl=Config.SESSION_TTL_SECONDS,
+            max_chars=Config.SESSION_MAX_CHARS,
+            history=HistoryManager(
+                token_budget=Config.HISTORY_TOKEN_BUDGET,
+                summary_budget=Config.HISTORY_SUMMARY_TOKENS,
+                max_messages=Config.HISTORY_MAX_MESSAGES,
+            ),
+            async_loader=aload_history_from_db if Config.DB_ASYNC else None,
         )
-        self.chat_history: List = []
-        self.system_prompt = self._create_system_prompt()
-
-    def _create_system_prompt(self) -> str:
-        """Create the system prompt for the agent."""
-        return (
-            "You are DreamDiary AI, a thoughtful and empathetic dream analyst "
-            "grounded in verified psychological and philosophical models "
-            "(e.g., Jungian archetypes, Freudian unconscious, existential philosophy, cognitive behavioral theories). "
-            "\n\n"
-            "Be moderately strict in interpretations—base all insights on scientific "
-            "evidence and established theories, avoiding speculation. Use chain-of-thought reasoning: "
-            "first analyze elements, then connect to theories, then provide interpretation. "
-            "\n\n"
-            "Adapt your tone to the user's style: if they are casual or open, respond "
-            "warmly and conversationally; if formal or reserved, be more structured and "
-            "precise. If no user info is provided, default to a balanced, professional "
-            "tone with clarity and accuracy. "
-            "\n\n"
-            "Always verify facts against psychological literature, explain concepts "
-            "simply yet rigorously, and ensure formulations are precise. Cite key theorists "
-            "briefly where relevant (e.g., 'As Jung noted...'). "
-            "\n\n"
-            "When analyzing dreams: "
-            "1. Break down key elements: symbols, emotions, narrative structure. "
-            "2. Identify primary emotions and their intensity (e.g., joy: high, fear: moderate). "
-            "3. Reference relevant psychological theories (Jung, Freud, CBT, etc.) with evidence. "
-            "4. Provide a balanced interpretation: personal meaning, universal insights. "
-            "5. Suggest a brief guided meditation (2-3 minutes) tailored to the emotions and symbols. "
-            "6. Offer actionable advice for reflection or journaling. "
-            "\n\n"
-            "Structure responses clearly: Use sections like 'Key Elements', 'Emotional Analysis', "
-            "'Psychological Interpretation', 'Guided Meditation', 'Reflection Tips'. "
-            "\n\n"
-            "Keep responses supportive, evidence-based, and comprehensive but concise (aim for 300-500 words)."
-            "\n\n"
-            "Respond in the same language as the user's input. If the input is in Russian, respond in Russian; if in English, respond in English."
+        self.usage = TokenUsage()
+        self.resilience = ResilientCaller(
+            timeout=Config.LLM_TIMEOUT,
+            max_retries=Config.LLM_MAX_RETRIES,
+            backoff_base=Config.LLM_BACKOFF_BASE,
+            backoff_max=Config.LLM_BACKOFF_MAX,
+            hedge_after=Config.LLM_HEDGE_AFTER,
+            breaker=CircuitBreaker(Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_COOLDOWN),
+        )
+        self.history_tokens_saved = 0
+        self.response_cache = ResponseCache(
+            memory=MemoryCacheBackend(max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES, ttl=Config.RESPONSE_CACHE_TTL),
+            persistent=DatabaseCacheBackend(ttl=Config.RESPONSE_CACHE_TTL) if Config.RESPONSE_CACHE_PERSISTENT else None,
+        )
+        self.background = BackgroundQueue(maxsize=Config.BACKGROUND_QUEUE_SIZE, workers=Config.BACKGROUND_WORKERS)
+        self._executor = ThreadPoolExecutor(max_workers=Config.BACKGROUND_WORKERS)
+        self.writer = DreamWriter(
+            maxsize=Config.DB_WRITER_QUEUE_SIZE,
+            workers=Config.DB_WRITER_WORKERS,
+            batch_size=Config.DB_WRITER_BATCH_SIZE,
+            linger=Config.DB_WRITER_LINGER_MS / 1000,
+            on_saved=self._index_saved,
         )
 
-    def process_dream(self, dream_text: str, user_id: int = None) -> str:
-        """Process a dream text and return response. Also extract emotions."""
+    @property
+    def llm(self):
+        """Chat model, created on first use."""
+        if self._llm is None:
+            from langchain_anthropic import ChatAnthropic
+
+            options = {"base_url": Config.ANTHROPIC_BASE_URL} if Config.ANTHROPIC_BASE_URL else {}
+            self._llm = ChatAnthropic(
+                temperature=0.92,
+                anthropic_api_key=self.api_key,
+                model=self.model_name,
+                default_request_timeout=Config.LLM_TIMEOUT,
+                max_retries=0,  # retries are done by self.resilience
+                **options,
+                # max_tokens=600
+            )
+        return self._llm
+
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
+        self._structured_llm = None
+
+    @property
+    def structured_llm(self):
+        """Chat model forced to answer through ANALYSIS_TOOL."""
+        if self._structured_llm is None:
+            self._structured_llm = self.llm.bind_tools([ANALYSIS_TOOL], tool_choice=ANALYSIS_TOOL["name"])
+        return self._structured_llm
+
+    @property
+    def emotion_classifier(self):
+        """Local emotion classifier used when EMOTION_BACKEND is "local", loaded on first use."""
+        if self._emotion_classifier is None:
+            from ml.emotion_classifier import EmotionClassifier, MicroBatcher
+
+            self._emotion_classifier = MicroBatcher(
+                EmotionClassifier(Config.EMOTION_MODEL_DIR, max_length=Config.MAX_SEQ_LEN),
+                max_batch=Config.BATCH_SIZE,
+                linger=Config.EMOTION_BATCH_LINGER_MS / 1000,
+            )
+        return self._emotion_classifier
+
+    @property
+    def dream_index(self):
+        """Vector index of saved dreams used when SIMILAR_DREAMS is on, loaded on first use."""
+        if self._dream_index is None:
+            with self._dream_index_lock:
+                if self._dream_index is None:
+                    self._dream_index = self._open_dream_index()
+        return self._dream_index
+
+    @staticmethod
+    def _open_dream_index(slots: int = 64):
+        """Index in SIMILAR_INDEX_DIR, or in SIMILAR_INDEX_DIR-1, -2, ... if other processes (workers) hold it."""
+        from ml.dream_index import DreamIndex, HashingEmbedder, IndexLockedError
+
+        for slot in range(slots):
+            path = f"{Config.SIMILAR_INDEX_DIR}-{slot}" if slot else Config.SIMILAR_INDEX_DIR
+            try:
+                return DreamIndex(path, HashingEmbedder(Config.SIMILAR_DIM), nprobe=Config.SIMILAR_NPROBE)
+            except IndexLockedError:
+                continue
+        raise IndexLockedError(f"All {slots} dream index directories under {Config.SIMILAR_INDEX_DIR} are in use")
+
+    def warm_up(self):
+        """Import the LLM stack (and the local models) ahead of the first dream."""
+        import langchain_core.messages  # noqa: F401
+
+        if Config.EMOTION_BACKEND == "local":
+            self.emotion_classifier
+        if Config.SIMILAR_DREAMS:
+            self.dream_index.catch_up()
+        return self.llm
+
+    def _index_saved(self, records: List[DreamRecord], dream_ids: List[int]):
+        """DB writer callback: add freshly saved dreams to the vector index."""
+        if Config.SIMILAR_DREAMS:
+            self.dream_index.add(
+                (dream_id, record.telegram_id, record.text) for record, dream_id in zip(records, dream_ids)
+            )
+
+    def similar_dreams(self, dream_text: str, user_id: int = None, k: int = 3,
+                       exclude: Tuple[int, ...] = ()) -> List[Tuple[Any, float]]:
+        """(Dream, similarity) of the user's saved dreams closest to dream_text, best first."""
+        index = self.dream_index
+        index.catch_up(min_interval=Config.SIMILAR_SYNC_SECONDS)
+        hits = index.search(dream_text, k=k, owner=self._session_key(user_id), exclude=exclude)
+        dreams = DreamRepository.get_many([dream_id for dream_id, _ in hits])
+        return [
+            (dreams[dream_id], score) for dream_id, score in hits
+            if dream_id in dreams and score >= Config.SIMILAR_MIN_SCORE
+        ]
+
+    def _system_message(self, summary: str = ""):
+        """System prompt, marked as a cache breakpoint when it is long enough to be cached.
+
+        The per-user summary follows it uncached. The current prompt is far
+        below MIN_CACHEABLE_TOKENS, so the breakpoint only appears once the
+        prompt grows; until then the history breakpoint covers it.
+        """
+        from langchain_core.messages import SystemMessage
+
+        block = {"type": "text", "text": self.SYSTEM_PROMPT}
+        if estimate_tokens(self.SYSTEM_PROMPT) >= self.MIN_CACHEABLE_TOKENS:
+            block["cache_control"] = {"type": "ephemeral"}
+        blocks = [block]
+        if summary:
+            blocks.append({"type": "text", "text": "Summary of the user's earlier dreams:\n" + summary})
+        return SystemMessage(content=blocks)
 
-        messages = [SystemMessage(content=self.system_prompt)]
-        messages.extend(self.chat_history)
+    def _cacheable_history(self, system, messages: List) -> List:
+        """History with a cache breakpoint on its last message if the prefix can be cached.
+
+        The window stays the same between folds, so the next turn reads
+        the system prompt, summary and history from the prompt cache. A
+        prefix below MIN_CACHEABLE_TOKENS is never cached, so short
+        conversations get no breakpoint.
+        """
+        if not messages or not isinstance(messages[-1].content, str):
+            return list(messages)
+        prefix = sum(estimate_tokens(self._chunk_text(message)) for message in [system, *messages])
+        if prefix < self.MIN_CACHEABLE_TOKENS:
+            return list(messages)
+        last = messages[-1]
+        block = {"type": "text", "text": last.content, "cache_control": {"type": "ephemeral"}}
+        return list(messages[:-1]) + [last.model_copy(update={"content": [block]})]
+
+    def _invoke(self, llm, messages: List, fallback=None):
+        """Invoke a chat model under the retry policy and record its token usage."""
+        with span("llm.invoke", model=self.model_name), STAGE_SECONDS.time(stage="llm"):
+            try:
+                response = self.resilience.invoke(llm, messages, fallback)
+            except Exception:
+                ERRORS.inc(stage="llm")
+                raise
+        self._record_usage(response)
+        return response
+
+    async def _ainvoke(self, llm, messages: List, fallback=None):
+        """Async variant of _invoke."""
+        with span("llm.invoke", model=self.model_name), STAGE_SECONDS.time(stage="llm"):
+            try:
+                response = await self.resilience.ainvoke(llm, messages, fallback)
+            except Exception:
+                ERRORS.inc(stage="llm")
+                raise
+        self._record_usage(response)
+        return response
+
+    def _fallback_message(self):
+        """Stand-in response served while the model is unavailable."""
+        from langchain_core.messages import AIMessage
+
+        return AIMessage(content=self.FALLBACK_REPLY, response_metadata={"fallback": True})
+
+    def _fallback_reply(self, dream_text: str, telegram_id: int) -> FallbackReply:
+        """Earlier analysis of the same dream by this user, or FALLBACK_REPLY, marked as a fallback."""
+        try:
+            previous = DreamRepository.latest_analysis(telegram_id, dream_text)
+        except Exception as e:
+            logging.warning(f"Could not look up an earlier analysis: {e}")
+            previous = None
+        return FallbackReply(self.CACHED_FALLBACK_PREFIX + previous if previous else self.FALLBACK_REPLY)
+
+    @staticmethod
+    def _is_fallback(message) -> bool:
+        return bool(getattr(message, "response_metadata", {}).get("fallback"))
+
+    def _record_usage(self, response):
+        self.usage.record_call()
+        self._count_tokens(self.usage.record(response))
+
+    @staticmethod
+    def _count_tokens(counted: dict):
+        if not counted:
+            return
+        LLM_TOKENS.inc(counted["input"], direction="input")
+        LLM_TOKENS.inc(counted["output"], direction="output")
+        LLM_TOKENS.inc(counted["cache_read"], direction="cache_read")
+        LLM_TOKENS.inc(counted["cache_creation"], direction="cache_write")
+        logging.debug(
+            f"LLM usage: {counted['input']} input tokens "
+            f"({counted['cache_read']} cache read, {counted['cache_creation']} cache write), "
+            f"{counted['output']} output"
+        )
+
+    def _build_dream_messages(self, dream_text: str, window: HistoryWindow, structured: bool = False) -> List:
+        """Build the message list for the structured dream analysis.
+
+        With structured=True the model is asked to answer through
+        ANALYSIS_TOOL, including the emotion ratings.
+        """
+        from langchain_core.messages import HumanMessage
+
+        messages = [self._system_message(window.summary)]
+        messages.extend(self._cacheable_history(messages[0], window.messages))
+        if structured:
+            messages.append(HumanMessage(
+                content=(
+                    f"Analyze this dream in detail following the structured guidelines: {dream_text}. "
+                    f"Record the result with the {ANALYSIS_TOOL['name']} tool: fill every section, "
+                    "then rate each emotion from 0 (none) to 3 (high)."
+                )
+            ))
+            return messages
         messages.append(HumanMessage(
             content=(
                 f"Analyze this dream in detail following the structured guidelines: {dream_text}. "
@@ -73,127 +337,399 @@ class DreamDiaryAgent:
                 "Use chain-of-thought: first list elements, then analyze emotions, then interpret, etc."
             )
         ))
+        return messages
 
-        response = self.llm.invoke(messages)
+    def _build_emotion_messages(self, dream_text: str) -> List:
+        """Build the message list for the hidden emotion extraction task."""
+        from langchain_core.messages import SystemMessage, HumanMessage
 
-        # Extract emotions via hidden task with improved prompt
         emotion_prompt = (
             f"Extract emotions from this dream as multi-label binary with intensity: {dream_text}. "
             "Emotions: joy, fear, anger, sadness, calm, anxiety, excitement, confusion, love, disgust. "
             "Format: [joy:1 (high), fear:0 (none), anger:0 (none), sadness:0 (none), calm:1 (moderate), anxiety:1 (low)]. "
             "Only output the list in brackets, with intensity notes."
         )
-        emotion_messages = [SystemMessage(content="You are an emotion extractor. Analyze deeply and accurately."), HumanMessage(content=emotion_prompt)]
-        emotion_response = self.llm.invoke(emotion_messages)
-        emotions = emotion_response.content  # e.g., "[joy:1 (high), fear:0 (none), ...]"
+        return [SystemMessage(content="You are an emotion extractor. Analyze deeply and accurately."), HumanMessage(content=emotion_prompt)]
+
+    @staticmethod
+    def _session_key(user_id: int = None) -> int:
+        """Telegram id used for sessions and DB rows (1 for anonymous use)."""
+        return user_id if user_id else 1
 
-        # Update chat history
-        self.chat_history.append(HumanMessage(content=dream_text))
-        self.chat_history.append(AIMessage(content=response.content))
+    def _history_window(self, session, dream_text: str = None, user_id: int = None) -> HistoryWindow:
+        """Take the token-budgeted history of a session and account for it.
 
-        if len(self.chat_history) > 20:
-            self.chat_history = self.chat_history[-20:]
+        With SIMILAR_CONTEXT_K the user's most similar past dreams, as
+        one-line digests, replace the recent history.
+        """
+        window = self.sessions.window(session)
+        if dream_text is not None and Config.SIMILAR_DREAMS and Config.SIMILAR_CONTEXT_K:
+            window = self._similar_window(window, dream_text, user_id)
+        self.history_tokens_saved += window.tokens_saved
+        logging.info(f"History window: {window.tokens_used} tokens sent, {window.tokens_saved} saved")
+        return window
 
-        # Save to DB asynchronously (with emotions data)
-        self._save_to_db_async(dream_text, response.content, emotions, user_id)
+    async def _ahistory_window(self, telegram_id: int, dream_text: str) -> HistoryWindow:
+        """Async variant of _history_window that loads the session itself."""
+        session = await self.sessions.aget(telegram_id)
+        if Config.SIMILAR_DREAMS and Config.SIMILAR_CONTEXT_K:
+            return await asyncio.to_thread(self._history_window, session, dream_text, telegram_id)
+        return self._history_window(session)
+
+    def _similar_window(self, window: HistoryWindow, dream_text: str, user_id: int = None) -> HistoryWindow:
+        """Window made of digests of similar past dreams; the recent history if there are none."""
+        try:
+            similar = self.similar_dreams(dream_text, user_id, k=Config.SIMILAR_CONTEXT_K)
+        except Exception as e:
+            ERRORS.inc(stage="similar")
+            logging.warning(f"Similar-dream lookup failed, using recent history: {e}")
+            return window
+        if not similar:
+            return window
+        summary = "\n".join(
+            HistoryManager._summarize_turn(dream.text, (dream.raw_analysis or {}).get("content", ""))
+            for dream, _ in similar
+        )
+        tokens_used = estimate_tokens(summary)
+        return HistoryWindow(
+            messages=[],
+            summary=summary,
+            tokens_used=tokens_used,
+            tokens_saved=max(0, window.tokens_used + window.tokens_saved - tokens_used),
+        )
+
+    @staticmethod
+    def _retry_messages(messages: List, error: AnalysisValidationError) -> List:
+        """Repeat the request with the validation errors of the previous answer."""
+        from langchain_core.messages import HumanMessage
+
+        return messages[:-1] + [HumanMessage(content=(
+            f"{DreamDiaryAgent._chunk_text(messages[-1])}\n\nYour previous answer was rejected: {error}. "
+            f"Call {ANALYSIS_TOOL['name']} again with every field filled in."
+        ))]
+
+    def _invoke_structured(self, messages: List) -> DreamAnalysis:
+        """One tool call, re-asked up to STRUCTURED_RETRIES times on invalid input."""
+        for attempt in range(Config.STRUCTURED_RETRIES + 1):
+            try:
+                return analysis_from_message(self._invoke(self.structured_llm, messages))
+            except AnalysisValidationError as e:
+                logging.warning(f"Structured analysis rejected (attempt {attempt + 1}): {e}")
+                error = e
+                messages = self._retry_messages(messages, e)
+        raise error
+
+    async def _ainvoke_structured(self, messages: List) -> DreamAnalysis:
+        """Async variant of _invoke_structured."""
+        for attempt in range(Config.STRUCTURED_RETRIES + 1):
+            try:
+                return analysis_from_message(await self._ainvoke(self.structured_llm, messages))
+            except AnalysisValidationError as e:
+                logging.warning(f"Structured analysis rejected (attempt {attempt + 1}): {e}")
+                error = e
+                messages = self._retry_messages(messages, e)
+        raise error
+
+    def process_dream(self, dream_text: str, user_id: int = None) -> str:
+        """Process a dream text and return response. Also extract emotions.
+
+        With STRUCTURED_ANALYSIS one tool call returns both the analysis
+        and the emotions. Otherwise, or when its answers keep failing
+        validation, emotion extraction runs on the background executor
+        while the main analysis is generated, and is saved once both are
+        available.
+        """
+        telegram_id = self._session_key(user_id)
+        window = self._history_window(self.sessions.get(telegram_id), dream_text, telegram_id)
+        if Config.STRUCTURED_ANALYSIS:
+            try:
+                result = self._invoke_structured(self._build_dream_messages(dream_text, window, structured=True))
+            except LLMUnavailableError:
+                return self._fallback_reply(dream_text, telegram_id)
+            except AnalysisValidationError as e:
+                logging.warning(f"Falling back to separate emotion extraction: {e}")
+            else:
+                content = result.render()
+                self.writer.submit(self._build_record(dream_text, content, result.emotion_list(), user_id))
+                self.sessions.append(telegram_id, dream_text, content)
+                return content
+
+        analysis = Future()
+        self._executor.submit(self._extract_and_save, dream_text, analysis, user_id)
+        try:
+            response = self._invoke(self.llm, self._build_dream_messages(dream_text, window), self._fallback_message)
+        except BaseException as e:
+            analysis.set_exception(e)
+            raise
+        if self._is_fallback(response):
+            analysis.set_exception(LLMUnavailableError("analysis replaced by fallback"))
+            return self._fallback_reply(dream_text, telegram_id)
+        analysis.set_result(response.content)
+
+        self.sessions.append(telegram_id, dream_text, response.content)
 
         return response.content
 
-    def _save_to_db_async(self, dream_text: str, response_content: str, emotions: str, user_id: int = None):
-        """Save dream data to DB in a background thread with full error handling."""
-        def save():
-            print("Starting async DB save...")
+    async def aprocess_dream(self, dream_text: str, user_id: int = None) -> str:
+        """Async variant of process_dream that never blocks the event loop.
+
+        The emotion job is queued before the analysis call so both requests
+        run concurrently; the reply is returned as soon as the analysis is
+        ready and the job finishes the DB write in the background.
+        """
+        telegram_id = self._session_key(user_id)
+        window = await self._ahistory_window(telegram_id, dream_text)
+        if Config.STRUCTURED_ANALYSIS:
             try:
-                # Create or get user
-                telegram_id = user_id if user_id else 1
-                print(f"Saving for user {telegram_id}")
-                user = UserRepository.get_or_create(telegram_id=telegram_id, username=f"user_{telegram_id}")
-                if not user:
-                    print("Error: Could not create/find user")
-                    return
-                print(f"User created/found: {user.id}")
-
-                # Create dream record
-                print(f"Creating dream with user_id={user.id}, text_length={len(dream_text)}, analysis_length={len(response_content)}")
-                dream = DreamRepository.create(
-                    user_id=user.id,
-                    text=dream_text,
-                    analysis=response_content,
-                    language="en"  # Can be detected later
-                )
-                if not dream:
-                    print("Error: Could not create dream")
-                    return
-                print(f"Dream created: {dream.id}")
-
-                # Parse and save emotions as classifications
-                try:
-                    emotion_list = EmotionMapper.parse_emotions(emotions) if emotions else []
-                    print(f"Parsed {len(emotion_list)} emotions")
-                    for emo in emotion_list:
-                        if emo and emo.get("emotion"):
-                            ClassificationRepository.create(
-                                dream_id=dream.id,
-                                emotion=emo.get("emotion"),
-                                intensity=emo.get("intensity", 0),
-                                symbol=None
-                            )
-                except Exception as e:
-                    print(f"Error parsing/saving emotions: {e}")
-
-                # Save chat history
-                try:
-                    ChatHistoryRepository.add_message(
-                        user_id=user.id,
-                        message=dream_text,
-                        response=response_content
-                    )
-                except Exception as e:
-                    print(f"Error saving chat history: {e}")
-
-                print("DB save completed successfully.")
-            except Exception as e:
-                print(f"❌ Async DB save error: {e}")
-                import traceback
-                traceback.print_exc()
-
-        thread = threading.Thread(target=save, daemon=True)
-        thread.start()
-
-    def clear_history(self):
-        """Clear chat history."""
-        self.chat_history = []
+                result = await self._ainvoke_structured(self._build_dream_messages(dream_text, window, structured=True))
+            except LLMUnavailableError:
+                return await asyncio.to_thread(self._fallback_reply, dream_text, telegram_id)
+            except AnalysisValidationError as e:
+                logging.warning(f"Falling back to separate emotion extraction: {e}")
+            else:
+                content = result.render()
+                record = self._build_record(dream_text, content, result.emotion_list(), user_id)
+                await asyncio.to_thread(self.writer.submit, record)
+                self.sessions.append(telegram_id, dream_text, content)
+                return content
+
+        analysis = asyncio.get_running_loop().create_future()
+        await self.background.submit(lambda: self._aextract_and_save(dream_text, analysis, user_id))
+        try:
+            response = await self._ainvoke(self.llm, self._build_dream_messages(dream_text, window), self._fallback_message)
+        except BaseException:
+            analysis.cancel()
+            raise
+        if self._is_fallback(response):
+            analysis.cancel()
+            return await asyncio.to_thread(self._fallback_reply, dream_text, telegram_id)
+        analysis.set_result(response.content)
+
+        self.sessions.append(telegram_id, dream_text, response.content)
+
+        return response.content
+
+    async def astream_dream(self, dream_text: str, user_id: int = None) -> AsyncIterator[str]:
+        """Stream the dream analysis as text chunks while it is generated.
+
+        Emotion extraction and persistence work exactly as in aprocess_dream
+        and start once the full analysis has been streamed.
+        """
+        telegram_id = self._session_key(user_id)
+        window = await self._ahistory_window(telegram_id, dream_text)
+        analysis = asyncio.get_running_loop().create_future()
+        await self.background.submit(lambda: self._aextract_and_save(dream_text, analysis, user_id))
+        parts = []
+        self.usage.record_call()
+        started = time.perf_counter()
+        try:
+            messages = self._build_dream_messages(dream_text, window)
+            with span("llm.stream", model=self.model_name), STAGE_SECONDS.time(stage="llm_stream"):
+                async for chunk in self.resilience.astream(self.llm, messages, self._fallback_message):
+                    if self._is_fallback(chunk):
+                        analysis.cancel()
+                        yield await asyncio.to_thread(self._fallback_reply, dream_text, telegram_id)
+                        return
+                    self._count_tokens(self.usage.record(chunk))
+                    text = self._chunk_text(chunk)
+                    if text:
+                        if not parts:
+                            first_token = time.perf_counter() - started
+                            self.usage.record_first_token(first_token)
+                            STAGE_SECONDS.observe(first_token, stage="llm_first_token")
+                        parts.append(text)
+                        yield text
+        except BaseException as e:
+            if isinstance(e, Exception):
+                ERRORS.inc(stage="llm")
+            analysis.cancel()
+            raise
+        content = "".join(parts)
+        analysis.set_result(content)
+
+        self.sessions.append(telegram_id, dream_text, content)
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        """Text of a message or streamed chunk (content may be a list of blocks)."""
+        if isinstance(chunk.content, str):
+            return chunk.content
+        return "".join(
+            block.get("text", "") for block in chunk.content
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+
+    def _extract_emotions(self, dream_text: str) -> Tuple[List[Dict[str, Any]], str]:
+        """Emotions of a dream and the name of the model that produced them."""
+        if Config.EMOTION_BACKEND == "local":
+            from ml.emotion_classifier import to_emotions
+
+            scores = self.emotion_classifier.classify_sync(dream_text)
+            return to_emotions(scores, Config.EMOTION_THRESHOLD), self.emotion_classifier.model_name
+        # Extract emotions via hidden task with improved prompt
+        emotions = self._invoke(self.llm, self._build_emotion_messages(dream_text)).content
+        return self._parse_emotions(emotions), "claude-emotions"
+
+    async def _aextract_emotions(self, dream_text: str) -> Tuple[List[Dict[str, Any]], str]:
+        """Async variant of _extract_emotions; local predictions are micro-batched."""
+        if Config.EMOTION_BACKEND == "local":
+            from ml.emotion_classifier import to_emotions
+
+            scores = await self.emotion_classifier.classify(dream_text)
+            return to_emotions(scores, Config.EMOTION_THRESHOLD), self.emotion_classifier.model_name
+        emotion_response = await self._ainvoke(self.llm, self._build_emotion_messages(dream_text))
+        return self._parse_emotions(emotion_response.content), "claude-emotions"
+
+    async def aclassify_dream(self, dream_text: str,
+                              reanalyze: bool = False) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+        """Emotions, their model and, with reanalyze, a fresh analysis of a stored dream.
+
+        For batch re-processing: no conversation history is sent and
+        nothing is saved.
+        """
+        emotions, model = await self._aextract_emotions(dream_text)
+        analysis = None
+        if reanalyze:
+            window = HistoryWindow(messages=[], summary="", tokens_used=0, tokens_saved=0)
+            analysis = (await self._ainvoke(self.llm, self._build_dream_messages(dream_text, window))).content
+        return emotions, model, analysis
+
+    def _extract_and_save(self, dream_text: str, analysis: Future, user_id: int = None):
+        """Extract emotions and queue the dream for saving once the analysis is ready."""
+        try:
+            emotion_list, model = self._extract_emotions(dream_text)
+            response_content = analysis.result()
+        except Exception as e:
+            logging.warning(f"Skipping DB save, dream processing failed: {e}")
+            return
+        self.writer.submit(self._build_record(dream_text, response_content, emotion_list, user_id, model))
+
+    async def _aextract_and_save(self, dream_text: str, analysis: asyncio.Future, user_id: int = None):
+        """Async variant of _extract_and_save, run by the background queue.
+
+        The worker is freed once the emotions are extracted; the save waits
+        for the analysis through BackgroundQueue.after.
+        """
+        try:
+            emotion_list, model = await self._aextract_emotions(dream_text)
+        except Exception as e:
+            logging.warning(f"Skipping DB save, emotion extraction failed: {e}")
+            return
+
+        async def save():
+            record = self._build_record(dream_text, analysis.result(), emotion_list, user_id, model)
+            await asyncio.to_thread(self.writer.submit, record)
+
+        self.background.after(analysis, save)
+
+    @staticmethod
+    def _parse_emotions(emotions: str) -> List[Dict[str, Any]]:
+        """Parse the output of the emotion extraction prompt (bracket list, JSON or bullets)."""
+        try:
+            return EmotionMapper.parse_emotions(emotions) if emotions else []
+        except Exception as e:
+            logging.warning(f"Error parsing emotions: {e}")
+            return []
+
+    def _build_record(self, dream_text: str, response_content: str, emotion_list: List[Dict[str, Any]],
+                      user_id: int = None, model: str = "claude-emotions") -> DreamRecord:
+        """Turn a processed dream into a record for the DB writer."""
+        telegram_id = self._session_key(user_id)
+        return DreamRecord(
+            telegram_id=telegram_id,
+            username=f"user_{telegram_id}",
+            text=dream_text,
+            analysis=response_content,
+            emotions=emotion_list,
+            language="en",  # Can be detected later
+            model=model,
+        )
+
+    def close(self):
+        """Finish pending emotion jobs and flush queued DB writes."""
+        self._executor.shutdown(wait=True)
+        self.writer.close()
+
+    async def aclose(self):
+        """Async variant of close that also drains the background queue."""
+        await self.background.close()
+        if self._emotion_classifier is not None:
+            await self._emotion_classifier.close()
+        await asyncio.to_thread(self.close)
+
+    def clear_history(self, user_id: int = None):
+        """Clear chat history of one user, or of everyone."""
+        self.sessions.clear(self._session_key(user_id) if user_id else None)
+
+    def _build_analyze_emotions_messages(self, dream_text: str) -> List:
+        from langchain_core.messages import HumanMessage
 
-    def analyze_emotions(self, dream_text: str) -> Dict[str, Any]:
-        """Analyze emotions in a dream using Claude."""
         prompt = (
             f"Analyze the emotions in this dream: {dream_text}. "
             "List primary emotions with intensity and context from the dream narrative."
         )
-        messages = [
-            SystemMessage(content=self.system_prompt),
+        return [
+            self._system_message(),
             HumanMessage(content=prompt)
         ]
-        response = self.llm.invoke(messages)
-        return {"emotions": response.content}
 
-    def explain_symbol(self, symbol: str) -> str:
-        """Explain a dream symbol using psychological literature."""
+    def _build_symbol_messages(self, symbol: str) -> List:
+        from langchain_core.messages import HumanMessage
+
         prompt = (
             f"Explain the dream symbol '{symbol}' using only accurate information "
             "from verified psychological literature (e.g., Jung, Freud). "
             "Communicate in simple, understandable language."
         )
-        messages = [
-            SystemMessage(content=self.system_prompt),
+        return [
+            self._system_message(),
             HumanMessage(content=prompt)
         ]
-        response = self.llm.invoke(messages)
-        return response.content
+
+    def _response_cache_key(self, build_messages, text: str) -> str:
+        """Cache key over the model and the prompt built from the normalized input."""
+        messages = build_messages(normalize_input(text))
+        return cache_key(self.model_name, (self._chunk_text(m) for m in messages))
+
+    def _cached_invoke(self, build_messages, text: str) -> str:
+        key = self._response_cache_key(build_messages, text)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+        content = self._invoke(self.llm, build_messages(text)).content
+        self.response_cache.set(key, content)
+        return content
+
+    async def _cached_ainvoke(self, build_messages, text: str) -> str:
+        key = self._response_cache_key(build_messages, text)
+        cached = await self.response_cache.aget(key)
+        if cached is not None:
+            return cached
+        content = (await self._ainvoke(self.llm, build_messages(text))).content
+        await self.response_cache.aset(key, content)
+        return content
+
+    def analyze_emotions(self, dream_text: str) -> Dict[str, Any]:
+        """Analyze emotions in a dream using Claude."""
+        return {"emotions": self._cached_invoke(self._build_analyze_emotions_messages, dream_text)}
+
+    async def aanalyze_emotions(self, dream_text: str) -> Dict[str, Any]:
+        """Async variant of analyze_emotions."""
+        return {"emotions": await self._cached_ainvoke(self._build_analyze_emotions_messages, dream_text)}
+
+    def explain_symbol(self, symbol: str) -> str:
+        """Explain a dream symbol using psychological literature."""
+        return self._cached_invoke(self._build_symbol_messages, symbol)
+
+    async def aexplain_symbol(self, symbol: str) -> str:
+        """Async variant of explain_symbol."""
+        return await self._cached_ainvoke(self._build_symbol_messages, symbol)
 
 
 if __name__ == "__main__":
+    init_db()
     agent = DreamDiaryAgent()
     dream = "I was flying over a vast ocean, feeling both exhilarated and anxious."
     result = agent.process_dream(dream)
     print("Agent Response:", result)
+    agent.close()
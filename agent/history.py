@@ -0,0 +1,84 @@
+"""Token-budgeted history window with rolling per-user summaries."""
+
+import re
+import textwrap
+from typing import List
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for Claude models)."""
+    return len(text) // 4 + 1
+
+
+_INTERPRETATION_RE = re.compile(r"Psychological Interpretation\W*(.+?)(?:\n\s*\n|$)", re.IGNORECASE | re.DOTALL)
+
+
+class HistoryWindow:
+    """History to send with one request plus its token accounting."""
+
+    def __init__(self, messages: List, summary: str, tokens_used: int, tokens_saved: int):
+        self.messages = messages
+        self.summary = summary
+        self.tokens_used = tokens_used
+        self.tokens_saved = tokens_saved
+
+
+class HistoryManager:
+    """Trim conversation history by an estimated token budget.
+
+    Turns that no longer fit are folded into a compact running summary
+    stored on the session, so each turn is summarized exactly once and
+    the summary is updated incrementally as the conversation grows.
+    """
+
+    def __init__(self, token_budget: int = 1500, summary_budget: int = 300, max_messages: int = 20):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_messages = max_messages
+
+    @staticmethod
+    def _summarize_turn(message: str, response: str) -> str:
+        """One-line digest of a dream and its analysis."""
+        match = _INTERPRETATION_RE.search(response)
+        gist = match.group(1) if match else response
+        return (
+            f"- Dream: {textwrap.shorten(message, 160, placeholder='...')} "
+            f"| Insight: {textwrap.shorten(gist, 160, placeholder='...')}"
+        )
+
+    def fold(self, session):
+        """Fold the oldest turns of a session into its summary until it fits."""
+        while len(session.messages) > 2 and (
+            len(session.messages) > self.max_messages
+            or sum(estimate_tokens(m.content) for m in session.messages) > self.token_budget
+        ):
+            message, response = session.messages[0], session.messages[1]
+            session.messages = session.messages[2:]
+            session.summary_lines.append(self._summarize_turn(message.content, response.content))
+
+        while len(session.summary_lines) > 1 and (
+            sum(estimate_tokens(line) for line in session.summary_lines) > self.summary_budget
+        ):
+            session.summary_lines.pop(0)
+
+    def record_turn(self, session, message: str, response: str):
+        """Remember the raw size of a turn for tokens-saved reporting."""
+        session.turn_tokens.append(estimate_tokens(message) + estimate_tokens(response))
+
+    def build(self, session) -> HistoryWindow:
+        """Return the history to send and how many tokens the budget saved.
+
+        Savings are measured against sending the last ``max_messages``
+        messages verbatim, which is what the agent did before.
+        """
+        summary = "\n".join(session.summary_lines)
+        tokens_used = sum(estimate_tokens(m.content) for m in session.messages)
+        if summary:
+            tokens_used += estimate_tokens(summary)
+        tokens_full = sum(list(session.turn_tokens)[-(self.max_messages // 2):])
+        return HistoryWindow(
+            messages=list(session.messages),
+            summary=summary,
+            tokens_used=tokens_used,
+            tokens_saved=max(0, tokens_full - tokens_used),
+        )
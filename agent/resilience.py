@@ -0,0 +1,255 @@
+"""Deadlines, retries, hedging and a circuit breaker around chat model calls."""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable, List, Optional
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}  # 529: Anthropic overloaded
+RETRYABLE_ERRORS = {"APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError"}
+
+
+class LLMUnavailableError(RuntimeError):
+    """The model could not be reached within the retry budget, or the breaker is open."""
+
+
+class FallbackReply(str):
+    """Reply text served instead of a fresh answer while the model is unavailable.
+
+    Callers that remember replies (dedup, caches) must not keep it.
+    """
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient failures worth another attempt: overload, rate limits, 5xx, timeouts."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header, if the server sent one."""
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """Open after consecutive failures, fail fast while open, probe once after the cooldown."""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """A call ended without an outcome (cancelled, or its stream was closed early); let another probe."""
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown:
+                    logging.warning(f"LLM circuit breaker open after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class ResilientCaller:
+    """Run chat model calls with a per-attempt deadline and jittered exponential retries.
+
+    Async calls can also be hedged: if an attempt has not answered after
+    ``hedge_after`` seconds a second identical request is sent and the
+    first answer wins. When retries are exhausted or the breaker is open
+    the optional fallback is returned instead of raising.
+    """
+
+    def __init__(self, timeout: float = 60, max_retries: int = 3, backoff_base: float = 0.5,
+                 backoff_max: float = 8, hedge_after: float = 0, breaker: CircuitBreaker = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+        self.hedges = 0
+        self.fallbacks = 0
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, at least the server's Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, _retry_after(error) or 0.0)
+
+    def _give_up(self, error: Optional[BaseException], fallback: Optional[Callable]):
+        if fallback is not None:
+            self.fallbacks += 1
+            logging.warning(f"LLM unavailable, serving fallback: {error or 'circuit open'}")
+            return fallback()
+        raise LLMUnavailableError(str(error) if error else "circuit breaker open") from error
+
+    def invoke(self, llm, messages: List, fallback: Callable = None):
+        """Blocking call; the deadline is enforced by the client's request timeout."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                return self._give_up(error, fallback)
+            try:
+                response = llm.invoke(messages)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.success()  # the service answered; the request itself was bad
+                    raise
+                self.breaker.failure()
+                error = e
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    delay = self._backoff(attempt, e)
+                    logging.warning(f"LLM call failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+                    time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return response
+        return self._give_up(error, fallback)
+
+    async def _attempt(self, llm, messages: List):
+        """One deadline-bound attempt, hedged with a duplicate request if it is slow."""
+        deadline = time.monotonic() + self.timeout
+        tasks = {asyncio.ensure_future(llm.ainvoke(messages))}
+        try:
+            if self.hedge_after > 0:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+                if not done:
+                    self.hedges += 1
+                    tasks.add(asyncio.ensure_future(llm.ainvoke(messages)))
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError(f"no response within {self.timeout}s")
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def ainvoke(self, llm, messages: List, fallback: Callable = None):
+        """Async call with deadline, retries and optional hedging."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                return self._give_up(error, fallback)
+            try:
+                response = await self._attempt(llm, messages)
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.success()  # the service answered; the request itself was bad
+                    raise
+                self.breaker.failure()
+                error = e
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    delay = self._backoff(attempt, e)
+                    logging.warning(f"LLM call failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return response
+        return self._give_up(error, fallback)
+
+    async def astream(self, llm, messages: List, fallback: Callable = None) -> AsyncIterator:
+        """Stream chunks; the request is retried until its first chunk arrives."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                break
+            stream = llm.astream(messages).__aiter__()
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), self.timeout)
+            except StopAsyncIteration:
+                self.breaker.success()
+                return
+            except Exception as e:
+                await stream.aclose()
+                if not is_retryable(e):
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                error = e
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    delay = self._backoff(attempt, e)
+                    logging.warning(f"LLM stream failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release()
+                await stream.aclose()
+                raise
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            except Exception:
+                self.breaker.failure()
+                raise
+            except BaseException:  # cancelled, or the consumer stopped reading (GeneratorExit)
+                self.breaker.release()
+                await stream.aclose()
+                raise
+            self.breaker.success()
+            return
+        yield self._give_up(error, fallback)
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "fallbacks": self.fallbacks,
+            "breaker": self.breaker.state,
+        }
@@ -0,0 +1,111 @@
+"""Tool schema and validator for the single-call structured dream analysis."""
+
+from typing import Any, Dict, List
+
+from db.mappers import EMOTION_LABELS, INTENSITY_LEVELS
+
+SECTIONS = (
+    ("key_elements", "Key Elements"),
+    ("emotional_analysis", "Emotional Analysis"),
+    ("psychological_interpretation", "Psychological Interpretation"),
+    ("guided_meditation", "Guided Meditation"),
+    ("reflection_tips", "Reflection Tips"),
+)
+
+MAX_INTENSITY = max(INTENSITY_LEVELS.values())
+
+ANALYSIS_TOOL = {
+    "name": "record_dream_analysis",
+    "description": (
+        "Record the full dream analysis. Every section is shown to the user, written in the "
+        "user's language; emotions rate each of the ten emotions from 0 (none) to "
+        f"{MAX_INTENSITY} (high)."
+    ),
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            **{key: {"type": "string", "description": title} for key, title in SECTIONS},
+            "emotions": {
+                "type": "object",
+                "properties": {
+                    label: {"type": "integer", "minimum": 0, "maximum": MAX_INTENSITY}
+                    for label in EMOTION_LABELS
+                },
+                "required": list(EMOTION_LABELS),
+            },
+        },
+        "required": [key for key, _ in SECTIONS] + ["emotions"],
+    },
+}
+
+
+class AnalysisValidationError(ValueError):
+    """The model's tool input does not match ANALYSIS_TOOL."""
+
+
+class DreamAnalysis:
+    """Validated analysis sections plus the emotion vector."""
+
+    def __init__(self, sections: Dict[str, str], emotions: Dict[str, int]):
+        self.sections = sections
+        self.emotions = emotions
+
+    def render(self) -> str:
+        """Reply text with the usual section headings."""
+        return "\n\n".join(f"{title}\n{self.sections[key]}" for key, title in SECTIONS)
+
+    def emotion_list(self) -> List[Dict[str, Any]]:
+        """Emotions in the form DreamRecord stores as classifications."""
+        return [{"emotion": label, "intensity": self.emotions[label]} for label in EMOTION_LABELS]
+
+
+def _intensity(value: Any) -> int:
+    if isinstance(value, str):
+        value = INTENSITY_LEVELS.get(value.strip().lower(), value)
+    if isinstance(value, str):
+        value = float(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != int(value):
+        raise ValueError(value)
+    if not 0 <= value <= MAX_INTENSITY:
+        raise ValueError(value)
+    return int(value)
+
+
+def validate_analysis(data: Any) -> DreamAnalysis:
+    """Check tool input against the schema, collecting every problem."""
+    if not isinstance(data, dict):
+        raise AnalysisValidationError("tool input must be an object")
+    problems = []
+    sections = {}
+    for key, _ in SECTIONS:
+        value = data.get(key)
+        if not isinstance(value, str) or not value.strip():
+            problems.append(f"'{key}' must be a non-empty string")
+        else:
+            sections[key] = value.strip()
+
+    emotions = {}
+    raw = data.get("emotions")
+    if not isinstance(raw, dict):
+        problems.append("'emotions' must be an object")
+        raw = {}
+    for label in EMOTION_LABELS:
+        if label not in raw:
+            problems.append(f"emotion '{label}' is missing")
+            continue
+        try:
+            emotions[label] = _intensity(raw[label])
+        except (TypeError, ValueError):
+            problems.append(f"emotion '{label}' must be an integer from 0 to {MAX_INTENSITY}")
+
+    if problems:
+        raise AnalysisValidationError("; ".join(problems))
+    return DreamAnalysis(sections, emotions)
+
+
+def analysis_from_message(message) -> DreamAnalysis:
+    """Validate the ANALYSIS_TOOL call of a chat model response."""
+    for call in getattr(message, "tool_calls", None) or []:
+        if call.get("name") == ANALYSIS_TOOL["name"]:
+            return validate_analysis(call.get("args"))
+    raise AnalysisValidationError(f"response did not call {ANALYSIS_TOOL['name']}")
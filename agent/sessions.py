@@ -0,0 +1,185 @@
+"""Per-user conversation state for the dream agent."""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, List, Optional
+
+from db.repositories import UserRepository, ChatHistoryRepository
+from .history import HistoryManager
+
+
+def load_history_from_db(telegram_id: int, limit: int) -> List:
+    """Rebuild a user's recent chat history from the chat_history table."""
+    user_id = UserRepository.find_id(telegram_id)
+    if user_id is None:
+        return []
+    return _rows_to_messages(ChatHistoryRepository.get_by_user(user_id, limit=limit))
+
+
+async def aload_history_from_db(telegram_id: int, limit: int) -> List:
+    """Async variant of load_history_from_db on the async engine."""
+    user_id = await UserRepository.afind_id(telegram_id)
+    if user_id is None:
+        return []
+    return _rows_to_messages(await ChatHistoryRepository.aget_by_user(user_id, limit=limit))
+
+
+def _rows_to_messages(rows) -> List:
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    messages = []
+    for row in reversed(rows):  # rows come newest first
+        messages.append(HumanMessage(content=row.message))
+        messages.append(AIMessage(content=row.response))
+    return messages
+
+
+class ConversationSession:
+    """Chat history of a single user plus the summary of older turns."""
+
+    def __init__(self, messages: List = None):
+        self.messages: List = messages or []
+        self.summary_lines: List[str] = []
+        self.turn_tokens: deque = deque(maxlen=50)  # raw size of recent turns
+        self.last_access = time.monotonic()
+
+    def size(self) -> int:
+        """Approximate memory footprint in characters."""
+        return sum(len(m.content) for m in self.messages) + sum(len(line) for line in self.summary_lines)
+
+
+class SessionStore:
+    """LRU/TTL cache of conversation sessions keyed by telegram id.
+
+    Sessions are rehydrated lazily from the database on a miss, so memory
+    is bounded by active users while prompts only carry one user's history.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600, max_chars: int = 5_000_000,
+                 history: HistoryManager = None, loader: Callable[[int, int], List] = None,
+                 async_loader: Callable[[int, int], Awaitable[List]] = None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.history = history or HistoryManager()
+        self.loader = loader or load_history_from_db
+        self.async_loader = async_loader
+        self._sessions: "OrderedDict[int, ConversationSession]" = OrderedDict()
+        self._sizes = {}
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def total_chars(self) -> int:
+        return self._total_chars
+
+    def _lookup(self, telegram_id: int) -> Optional[ConversationSession]:
+        """Return a live cached session and mark it recently used."""
+        session = self._sessions.get(telegram_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.last_access > self.ttl:
+            self._drop(telegram_id)
+            return None
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(telegram_id)
+        return session
+
+    def _drop(self, telegram_id: int):
+        self._sessions.pop(telegram_id, None)
+        self._total_chars -= self._sizes.pop(telegram_id, 0)
+
+    def _store(self, telegram_id: int, session: ConversationSession):
+        """Insert or resize a session, then evict until within limits."""
+        self._total_chars -= self._sizes.get(telegram_id, 0)
+        self._sizes[telegram_id] = session.size()
+        self._total_chars += self._sizes[telegram_id]
+        self._sessions[telegram_id] = session
+        self._sessions.move_to_end(telegram_id)
+        self._evict(keep=telegram_id)
+
+    def _evict(self, keep: int = None):
+        # Insertion order is access order, so expired sessions sit at the front
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if oldest == keep or now - self._sessions[oldest].last_access <= self.ttl:
+                break
+            self._drop(oldest)
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions
+                                           or self._total_chars > self.max_chars):
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+
+    def get(self, telegram_id: int) -> ConversationSession:
+        """Return the user's session, loading it from the DB on a miss."""
+        with self._lock:
+            session = self._lookup(telegram_id)
+        if session is not None:
+            return session
+        return self._insert_loaded(telegram_id, self.loader(telegram_id, self.history.max_messages // 2))
+
+    def _insert_loaded(self, telegram_id: int, messages: List) -> ConversationSession:
+        loaded = ConversationSession()
+        for message, response in zip(messages[::2], messages[1::2]):
+            loaded.messages.extend((message, response))
+            self.history.record_turn(loaded, message.content, response.content)
+        self.history.fold(loaded)
+        with self._lock:
+            # Another caller may have loaded the session meanwhile
+            session = self._lookup(telegram_id)
+            if session is None:
+                session = loaded
+                self._store(telegram_id, session)
+            return session
+
+    async def aget(self, telegram_id: int) -> ConversationSession:
+        """Async variant of get; the DB load uses the async loader or a worker thread."""
+        with self._lock:
+            session = self._lookup(telegram_id)
+        if session is not None:
+            return session
+        if self.async_loader is None:
+            return await asyncio.to_thread(self.get, telegram_id)
+        messages = await self.async_loader(telegram_id, self.history.max_messages // 2)
+        return self._insert_loaded(telegram_id, messages)
+
+    def append(self, telegram_id: int, message: str, response: str):
+        """Record a finished exchange and fold old turns into the summary.
+
+        If the session was evicted meanwhile nothing is cached; the next
+        get rehydrates it from the database.
+        """
+        from langchain_core.messages import HumanMessage, AIMessage
+
+        with self._lock:
+            session = self._lookup(telegram_id)
+            if session is None:
+                return
+            session.messages.append(HumanMessage(content=message))
+            session.messages.append(AIMessage(content=response))
+            self.history.record_turn(session, message, response)
+            self.history.fold(session)
+            self._store(telegram_id, session)
+
+    def window(self, session: ConversationSession):
+        """Token-budgeted history of a session for the next request."""
+        with self._lock:
+            return self.history.build(session)
+
+    def clear(self, telegram_id: int = None):
+        """Forget one user's session, or all sessions."""
+        with self._lock:
+            if telegram_id is None:
+                self._sessions.clear()
+                self._sizes.clear()
+                self._total_chars = 0
+            else:
+                self._drop(telegram_id)
@@ -0,0 +1,62 @@
+"""Token usage of LLM responses, split into prompt-cache reads and writes."""
+
+import threading
+
+
+class TokenUsage:
+    """Running totals from the usage metadata of chat model responses.
+
+    ``input_tokens`` includes the cached part of each prompt; the share
+    read from the cache is what prompt caching saves.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+        self.first_token_seconds = 0.0
+        self.streams = 0
+        self._lock = threading.Lock()
+
+    def record(self, message) -> dict:
+        """Add the usage of a response or stream chunk; returns what was counted."""
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return {}
+        details = usage.get("input_token_details") or {}
+        counted = {
+            "input": usage.get("input_tokens") or 0,
+            "output": usage.get("output_tokens") or 0,
+            "cache_read": details.get("cache_read") or 0,
+            "cache_creation": details.get("cache_creation") or 0,
+        }
+        with self._lock:
+            self.input_tokens += counted["input"]
+            self.output_tokens += counted["output"]
+            self.cache_read_tokens += counted["cache_read"]
+            self.cache_creation_tokens += counted["cache_creation"]
+        return counted
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def record_first_token(self, seconds: float):
+        """Time from sending a streamed request to its first text chunk."""
+        with self._lock:
+            self.first_token_seconds += seconds
+            self.streams += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_read_tokens": self.cache_read_tokens,
+                "cache_creation_tokens": self.cache_creation_tokens,
+                "cache_read_ratio": self.cache_read_tokens / self.input_tokens if self.input_tokens else 0.0,
+                "avg_first_token_ms": self.first_token_seconds / self.streams * 1000 if self.streams else 0.0,
+            }
@@ -0,0 +1,89 @@
+"""Cold-start time and memory of the bot entry point.
+
+Each run starts a fresh interpreter with ``-X importtime``, imports
+bot.bot_handler and builds a TelegramBotHandler (no network access is
+needed), then reports the import time, the time until the handler is
+ready to poll, peak RSS and the heaviest imports.
+
+Usage:
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --save benchmarks/cold_start_baseline.json
+    python -m benchmarks.cold_start --compare benchmarks/cold_start_baseline.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+PROBE = (
+    "import time, resource\n"
+    "started = time.perf_counter()\n"
+    "import bot.bot_handler\n"
+    "imported = time.perf_counter()\n"
+    "bot.bot_handler.TelegramBotHandler()\n"
+    "ready = time.perf_counter()\n"
+    "print('PROBE', imported - started, ready - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def _run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+    env.setdefault("DATABASE_URL", "sqlite:///:memory:")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    top_level = {}
+    for match in _IMPORT_LINE.finditer(proc.stderr):
+        _, cumulative, indent, module = match.groups()
+        if len(indent) == 3:  # modules imported directly by the entry point
+            top_level[module] = int(cumulative) / 1e6
+    probe = next(line for line in proc.stdout.splitlines() if line.startswith("PROBE"))
+    _, import_s, ready_s, maxrss_kb = probe.split()
+    return {
+        "import_s": float(import_s),
+        "ready_s": float(ready_s),
+        "rss_mb": int(maxrss_kb) / 1024,
+        "heaviest": sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:5],
+        "langchain_loaded": "langchain_anthropic" in proc.stderr,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", help="write the medians to this JSON file")
+    parser.add_argument("--compare", help="compare the medians with this JSON file")
+    args = parser.parse_args()
+
+    runs = [_run_once() for _ in range(args.runs)]
+    result = {key: statistics.median(r[key] for r in runs) for key in ("import_s", "ready_s", "rss_mb")}
+
+    print(f"import bot.bot_handler: {result['import_s'] * 1000:.0f} ms (median of {args.runs})")
+    print(f"ready to poll:          {result['ready_s'] * 1000:.0f} ms")
+    print(f"peak RSS:               {result['rss_mb']:.1f} MB")
+    print(f"langchain_anthropic imported at startup: {runs[-1]['langchain_loaded']}")
+    print("heaviest second-level imports:")
+    for module, seconds in runs[-1]["heaviest"]:
+        print(f"  {module:<30} {seconds * 1000:.0f} ms")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for key, value in result.items():
+            change = (value - baseline[key]) / baseline[key] if baseline.get(key) else 0.0
+            print(f"{key}: {baseline[key]:.3f} -> {value:.3f} ({change:+.1%})")
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Emotion extractor output parsing: EmotionMapper.parse_vector vs the previous parser.
+
+Renders random emotion vectors the way the extraction prompt asks for
+("[joy:1 (high), fear:0 (none), ...]") and checks that the new parser
+agrees with the old one on them. Then renders the same vectors as the
+model sometimes answers instead (text before the list, a leading space,
+JSON, bullet lines, "joy: 1", capitalized labels) and checks that the
+new parser still recovers the vector, reporting how often the old one
+did. Random junk with labels sprinkled in must not raise. Finally
+times both parsers on the canonical ten-emotion string, and the new
+one on bullet lines, which miss its fast path.
+
+Usage:
+    python -m benchmarks.emotion_parser --cases 20000 --seed 7
+"""
+
+import argparse
+import json
+import random
+import string
+import sys
+import timeit
+from typing import Any, Dict, List
+
+from db.mappers import EMOTION_LABELS, INTENSITY_LEVELS, EmotionMapper
+
+NOTES = {level: note for note, level in INTENSITY_LEVELS.items()}
+
+
+def legacy_parse_emotions(emotions_str: str) -> List[Dict[str, Any]]:
+    """EmotionMapper.parse_emotions before the single-pass parser."""
+    if not emotions_str or not emotions_str.startswith("["):
+        return []
+    items = emotions_str.strip("[]").split(", ")
+    result = []
+    for item in items:
+        parts = item.split(":")
+        if len(parts) == 2:
+            emotion, rest = parts
+            intensity_part = rest.split(" ")
+            intensity = int(intensity_part[0]) if intensity_part[0].isdigit() else 0
+            note = intensity_part[1].strip("()") if len(intensity_part) > 1 else ""
+            result.append({"emotion": emotion, "intensity": intensity, "note": note})
+    return result
+
+
+def _legacy_vector(emotions_str: str):
+    """The old parser's output as a vector, scoring by the note like parse_vector."""
+    items = legacy_parse_emotions(emotions_str)
+    if not items:
+        return None
+    vector = [0] * len(EMOTION_LABELS)
+    for item in items:
+        if item["emotion"] in EMOTION_LABELS and item["intensity"]:
+            vector[EMOTION_LABELS.index(item["emotion"])] = INTENSITY_LEVELS.get(item["note"], item["intensity"])
+    return tuple(vector)
+
+
+def _random_vector(rng: random.Random):
+    """(vector, labels mentioned in output order); unmentioned labels are 0."""
+    labels = list(EMOTION_LABELS)
+    rng.shuffle(labels)
+    mentioned = labels[:rng.randint(1, len(labels))]
+    vector = [0] * len(EMOTION_LABELS)
+    for label in mentioned:
+        vector[EMOTION_LABELS.index(label)] = rng.choice((0, 0, 1, 2, 3))
+    return tuple(vector), mentioned
+
+
+def _canonical(vector, mentioned) -> str:
+    items = []
+    for label in mentioned:
+        level = vector[EMOTION_LABELS.index(label)]
+        items.append(f"{label}:{1 if level else 0} ({NOTES[level]})")
+    return "[" + ", ".join(items) + "]"
+
+
+def _variants(rng: random.Random, vector, mentioned) -> Dict[str, str]:
+    canonical = _canonical(vector, mentioned)
+    levels = {label: vector[EMOTION_LABELS.index(label)] for label in mentioned}
+    return {
+        "leading space": " " + canonical,
+        "preamble": "Here are the emotions I found in this dream:\n\n" + canonical + "\n\nLet me know if you need more.",
+        "json numbers": json.dumps(levels),
+        "json words": json.dumps({label: NOTES[level] for label, level in levels.items()}, indent=2),
+        "bullets": "\n".join(
+            f"- **{label.capitalize()}**: {1 if level else 0} ({NOTES[level]})" for label, level in levels.items()
+        ),
+        "spaced": canonical.replace(":", ": ").replace(", ", ",\n"),
+        "bare numbers": ", ".join(f"{label}: {level}" for label, level in levels.items()),
+        "upper case": canonical.upper(),
+    }
+
+
+def _junk(rng: random.Random) -> str:
+    alphabet = string.printable + "–—()[]{}:\"'"
+    parts = []
+    for _ in range(rng.randint(1, 30)):
+        if rng.random() < 0.3:
+            parts.append(rng.choice(EMOTION_LABELS) + rng.choice(("", ":", ": ", "=", " - ", ":(")))
+        parts.append("".join(rng.choices(alphabet, k=rng.randint(0, 8))))
+    return "".join(parts)
+
+
+def fuzz(cases: int, seed: int) -> int:
+    """Run the checks; returns the number of failures."""
+    rng = random.Random(seed)
+    failures = 0
+    agree = 0
+    recovered: Dict[str, List[int]] = {}
+    for _ in range(cases):
+        vector, mentioned = _random_vector(rng)
+        canonical = _canonical(vector, mentioned)
+        new, old = EmotionMapper.parse_vector(canonical), _legacy_vector(canonical)
+        if new == old == vector:
+            agree += 1
+        else:
+            failures += 1
+            if failures <= 5:
+                print(f"canonical mismatch: {canonical!r}: new={new} legacy={old} expected={vector}")
+        for name, text in _variants(rng, vector, mentioned).items():
+            counts = recovered.setdefault(name, [0, 0])
+            new = EmotionMapper.parse_vector(text)
+            counts[0] += new == vector
+            counts[1] += _legacy_vector(text) == vector
+            if new != vector:
+                failures += 1
+                if failures <= 5:
+                    print(f"{name} mismatch: {text!r}: new={new} expected={vector}")
+        junk = _junk(rng)
+        try:
+            result = EmotionMapper.parse_vector(junk)
+            if result is not None and (len(result) != len(EMOTION_LABELS) or not all(0 <= v <= 3 for v in result)):
+                raise ValueError(result)
+        except Exception as e:
+            failures += 1
+            print(f"junk {junk!r} failed: {e!r}")
+
+    print(f"canonical format: {agree}/{cases} agree with the previous parser")
+    print(f"{'variant':<14} {'new':>8} {'previous':>9}")
+    for name, (new, old) in recovered.items():
+        print(f"{name:<14} {new / cases:>8.1%} {old / cases:>9.1%}")
+    return failures
+
+
+def bench(number: int):
+    vector = (3, 0, 1, 0, 2, 1, 0, 0, 3, 0)
+    canonical = _canonical(vector, EMOTION_LABELS)
+    bullets = _variants(random.Random(0), vector, EMOTION_LABELS)["bullets"]
+    for name, parse, text in (("previous", legacy_parse_emotions, canonical),
+                              ("parse_vector", EmotionMapper.parse_vector, canonical),
+                              ("parse_emotions", EmotionMapper.parse_emotions, canonical),
+                              ("parse_vector on bullets", EmotionMapper.parse_vector, bullets)):
+        seconds = min(timeit.repeat(lambda: parse(text), number=number, repeat=5))
+        print(f"{name:<24} {seconds / number * 1e6:6.2f} us per call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=20_000)
+    parser.add_argument("--number", type=int, default=20_000, help="calls per timing repeat")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    failures = fuzz(args.cases, args.seed)
+    bench(args.number)
+    if failures:
+        print(f"{failures} failures")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Answers POST /v1/messages (plain and streaming) with a canned analysis
+after a random delay, and fails a configurable share of requests with
+429/529/500 so retries, hedging and the circuit breaker can be tried
+without network access or API cost. Point the agent at it with
+ANTHROPIC_BASE_URL.
+
+Usage:
+    python -m benchmarks.fake_anthropic_server --port 8089 --latency 0.5 --fail-rate 0.2
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 ANTHROPIC_API_KEY=fake python -m agent.dream_agent
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Key Elements\nFlying, the ocean, falling.\n\n"
+    "Emotional Analysis\njoy: high, fear: moderate.\n\n"
+    "Psychological Interpretation\nA wish for freedom meeting a fear of losing control.\n\n"
+    "Guided Meditation\nBreathe slowly and picture calm water for two minutes.\n\n"
+    "Reflection Tips\nWrite down where in life you feel both free and unsafe."
+)
+EMOTIONS = "[joy:1 (high), fear:1 (moderate), anger:0 (none), sadness:0 (none), calm:0 (none)]"
+
+ERRORS = {
+    429: ("rate_limit_error", "Number of requests has exceeded your rate limit"),
+    500: ("api_error", "Internal server error"),
+    529: ("overloaded_error", "Overloaded"),
+}
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    jitter = 0.5
+    fail_rate = 0.0
+    fail_statuses = (529,)
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        try:
+            self._respond()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up, e.g. the losing request of a hedge
+
+    def _respond(self):
+        if not self.path.rstrip("/").endswith("/v1/messages"):
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        type(self).requests += 1
+        time.sleep(max(0.0, random.gauss(self.latency, self.latency * self.jitter)))
+
+        if random.random() < self.fail_rate:
+            status = random.choice(self.fail_statuses)
+            kind, message = ERRORS.get(status, ERRORS[500])
+            self._json(status, {"type": "error", "error": {"type": kind, "message": message}},
+                       {"retry-after": "1"} if status == 429 else None)
+            return
+
+        prompt = json.dumps(request.get("messages", []))
+        text = EMOTIONS if "Extract emotions" in prompt else REPLY
+        usage = {"input_tokens": len(prompt) // 4 + 1, "output_tokens": len(text) // 4 + 1,
+                 "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+            "model": request.get("model", "fake"), "stop_reason": "end_turn", "stop_sequence": None,
+            "content": [{"type": "text", "text": text}], "usage": usage,
+        }
+        if not request.get("stream"):
+            self._json(200, message)
+            return
+
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+
+        def event(name: str, data: dict):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        event("message_start", {"type": "message_start", "message": {
+            **message, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 1}}})
+        event("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+        for i in range(0, len(text), 40):
+            event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": text[i:i + 40]}})
+            time.sleep(0.01)
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+        event("message_stop", {"type": "message_stop"})
+
+
+def serve(port: int = 8089, latency: float = 0.5, fail_rate: float = 0.0, fail_statuses=(529,)) -> ThreadingHTTPServer:
+    """Create the server; call serve_forever() on it (e.g. in a thread)."""
+    FakeAnthropicHandler.latency = latency
+    FakeAnthropicHandler.fail_rate = fail_rate
+    FakeAnthropicHandler.fail_statuses = tuple(fail_statuses)
+    return ThreadingHTTPServer(("127.0.0.1", port), FakeAnthropicHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--fail-status", type=int, nargs="+", default=[529])
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.fail_rate, args.fail_status)
+    print(f"Fake Anthropic API on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
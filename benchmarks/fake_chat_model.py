@@ -0,0 +1,168 @@
+"""In-process stand-in for ChatAnthropic with configurable latency and token counts.
+
+Unlike fake_anthropic_server.py nothing goes over HTTP, so the agent's
+own overhead is what gets measured. Each call draws a time to first
+token and an output length from log-normal distributions, then
+"generates" at a fixed token rate; streaming yields chunks at that pace.
+Emotion-extraction prompts get a bracketed emotion list, tool-bound
+calls get a valid ANALYSIS_TOOL call, everything else a canned analysis.
+Usage metadata is filled in, including prompt-cache writes and reads
+the way Anthropic accounts them: only a prefix ending at a cache_control
+block and at least min_cacheable_tokens long is cached, the first call
+writes it and later calls within the cache TTL read it.
+"""
+
+import asyncio
+import hashlib
+import math
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent.history import estimate_tokens
+from agent.schema import ANALYSIS_TOOL, SECTIONS
+from db.mappers import EMOTION_LABELS
+from .fake_anthropic_server import EMOTIONS, REPLY
+
+
+def _lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    return median * math.exp(rng.gauss(0.0, sigma)) if sigma > 0 else median
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps like an LLM and answers like the agent expects."""
+
+    ttft_median: float = 0.4        # seconds to the first token
+    ttft_sigma: float = 0.35
+    output_tokens_median: int = 450
+    output_tokens_sigma: float = 0.25
+    tokens_per_second: float = 120.0
+    chunk_tokens: int = 8           # tokens per streamed chunk
+    seed: Optional[int] = None
+    min_cacheable_tokens: int = 2048  # claude-3-haiku; shorter prefixes are not cached
+    cache_ttl: float = 300.0        # seconds a cached prefix lives after its last use
+    calls: int = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+        self._prompt_cache: Dict[str, float] = {}  # prefix digest -> expiry
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-anthropic"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(tools=tools, tool_choice=tool_choice, **kwargs)
+
+    @staticmethod
+    def _prompt_text(messages: List[BaseMessage]) -> str:
+        parts = []
+        for message in messages:
+            content = message.content
+            if isinstance(content, list):
+                content = " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+            parts.append(content)
+        return "\n".join(parts)
+
+    def _breakpoints(self, messages: List[BaseMessage]) -> List[Tuple[str, int]]:
+        """(prefix digest, tokens) at each cache_control block long enough to be cached."""
+        digest = hashlib.sha256()
+        points, total = [], 0
+        for message in messages:
+            blocks = message.content if isinstance(message.content, list) else [{"text": message.content}]
+            for block in blocks:
+                if isinstance(block, dict):
+                    text = block.get("text", "")
+                    digest.update(text.encode("utf-8"))
+                    total += estimate_tokens(text)
+                    if "cache_control" in block and total >= self.min_cacheable_tokens:
+                        points.append((digest.hexdigest(), total))
+        return points
+
+    def _cache_tokens(self, messages: List[BaseMessage]) -> Tuple[int, int]:
+        """(cache read, cache write) tokens for one call; updates the simulated cache."""
+        points = self._breakpoints(messages)
+        if not points:
+            return 0, 0
+        now = time.monotonic()
+        read = 0
+        for key, tokens in reversed(points):
+            if self._prompt_cache.get(key, 0.0) > now:
+                read = tokens
+                break
+        for key, _ in points:
+            if key in self._prompt_cache or key == points[-1][0]:
+                self._prompt_cache[key] = now + self.cache_ttl
+        return read, points[-1][1] - read
+
+    def _plan(self, messages: List[BaseMessage], tools) -> tuple:
+        """(reply text or tool input, output tokens, ttft) for one call."""
+        self.calls += 1
+        prompt = self._prompt_text(messages)
+        ttft = _lognormal(self._rng, self.ttft_median, self.ttft_sigma)
+        if tools:
+            args = {key: f"{title} of the dream." for key, title in SECTIONS}
+            args["emotions"] = {label: self._rng.randint(0, 3) for label in EMOTION_LABELS}
+            return args, max(1, int(_lognormal(self._rng, self.output_tokens_median, self.output_tokens_sigma))), ttft
+        if "Extract emotions" in prompt:
+            return EMOTIONS, estimate_tokens(EMOTIONS), ttft
+        tokens = max(1, int(_lognormal(self._rng, self.output_tokens_median, self.output_tokens_sigma)))
+        text = (REPLY + "\n\n") * (tokens * 4 // len(REPLY) + 1)
+        return text[:tokens * 4], tokens, ttft
+
+    def _usage(self, messages: List[BaseMessage], output_tokens: int) -> dict:
+        prompt_tokens = estimate_tokens(self._prompt_text(messages))
+        read, written = self._cache_tokens(messages)
+        return {
+            "input_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens,
+            "input_token_details": {"cache_read": min(read, prompt_tokens), "cache_creation": min(written, prompt_tokens)},
+        }
+
+    def _message(self, messages, reply, tokens) -> AIMessage:
+        usage = self._usage(messages, tokens)
+        if isinstance(reply, dict):
+            call = {"name": ANALYSIS_TOOL["name"], "args": reply, "id": f"toolu_{uuid.uuid4().hex[:12]}"}
+            return AIMessage(content="", tool_calls=[call], usage_metadata=usage)
+        return AIMessage(content=reply, usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply, tokens, ttft = self._plan(messages, kwargs.get("tools"))
+        time.sleep(ttft + tokens / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, reply, tokens))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply, tokens, ttft = self._plan(messages, kwargs.get("tools"))
+        await asyncio.sleep(ttft + tokens / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, reply, tokens))])
+
+    def _chunks(self, reply: str, tokens: int) -> List[str]:
+        size = self.chunk_tokens * 4
+        return [reply[i:i + size] for i in range(0, len(reply), size)] or [""]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        reply, tokens, ttft = self._plan(messages, kwargs.get("tools"))
+        time.sleep(ttft)
+        chunks = self._chunks(reply, tokens)
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(self.chunk_tokens / self.tokens_per_second)
+            usage = self._usage(messages, tokens) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        reply, tokens, ttft = self._plan(messages, kwargs.get("tools"))
+        await asyncio.sleep(ttft)
+        chunks = self._chunks(reply, tokens)
+        for i, text in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.chunk_tokens / self.tokens_per_second)
+            usage = self._usage(messages, tokens) if i == len(chunks) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
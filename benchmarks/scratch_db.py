@@ -0,0 +1,9 @@
+"""Default scratch database for the benchmarks that need one."""
+
+import os
+import tempfile
+
+
+def default_url(name: str) -> str:
+    """SQLite URL of a per-benchmark file in the temp directory, outside the checkout."""
+    return "sqlite:///" + os.path.join(tempfile.gettempdir(), f"bench_{name}.sqlite")
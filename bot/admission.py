@@ -0,0 +1,139 @@
+"""Admission control for incoming dreams: rate limits, dedup, debounce and a global cap."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from agent.cache import normalize_input
+
+
+class TokenBucket:
+    """Per-user token buckets; each dream takes one token."""
+
+    def __init__(self, capacity: float = 3, refill_per_second: float = 0.1, max_users: int = 10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_users = max_users
+        self._buckets: "OrderedDict[int, Tuple[float, float]]" = OrderedDict()
+
+    def allow(self, user_id: int) -> bool:
+        """Take a token if one is available."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(user_id, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+        allowed = tokens >= 1
+        self._buckets[user_id] = (tokens - 1 if allowed else tokens, now)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)  # idle users have full buckets anyway
+        return allowed
+
+    def retry_after(self, user_id: int) -> float:
+        """Seconds until the user has a token again."""
+        tokens, _ = self._buckets.get(user_id, (self.capacity, 0.0))
+        return max(0.0, (1 - tokens) / self.refill_per_second)
+
+
+class Debouncer:
+    """Join messages a user sends in quick succession into one dream.
+
+    Every message restarts the user's quiet period; only the call that
+    sees the period end gets the joined text, the others get None.
+    """
+
+    def __init__(self, delay: float = 1.0, max_chars: int = 8000):
+        self.delay = delay
+        self.max_chars = max_chars
+        self._pending: Dict[int, List] = {}  # user_id -> [generation, parts]
+
+    async def submit(self, user_id: int, text: str) -> Optional[str]:
+        state = self._pending.setdefault(user_id, [0, []])
+        state[0] += 1
+        generation = state[0]
+        state[1].append(text)
+        if self.delay > 0 and sum(len(part) for part in state[1]) < self.max_chars:
+            await asyncio.sleep(self.delay)
+            if self._pending.get(user_id) is not state or state[0] != generation:
+                return None
+        del self._pending[user_id]
+        return "\n".join(state[1])
+
+
+class DedupCache:
+    """Recent analyses keyed by user and normalized dream text.
+
+    The first request for a key owns it; identical requests within the
+    window wait for and reuse the owner's result.
+    """
+
+    def __init__(self, window: float = 600, max_entries: int = 10000):
+        self.window = window
+        self.max_entries = max_entries
+        self.hits = 0
+        self._entries: "OrderedDict[tuple, Tuple[asyncio.Future, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(user_id: int, text: str) -> tuple:
+        return user_id, normalize_input(text)
+
+    def claim(self, user_id: int, text: str) -> Tuple[asyncio.Future, bool]:
+        """The future holding the result for this text and whether the caller must produce it."""
+        key = self.key(user_id, text)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            return entry[0], False
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (future, now + self.window)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return future, True
+
+    def resolve(self, user_id: int, text: str, future: asyncio.Future, result: Optional[str]):
+        """Publish the owner's result; None (failure) is not kept for later requests."""
+        if not future.done():
+            future.set_result(result)
+        if result is None:
+            key = self.key(user_id, text)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is future:
+                del self._entries[key]
+
+
+class AdmissionController:
+    """Everything that decides whether and when a dream reaches the agent.
+
+    All state is in process memory: with N webhook workers each has its own
+    buckets, dedup cache and analysis slots, so the per-user rate limit is
+    up to N times looser and a repeated dream handled by another worker is
+    analyzed again.
+    """
+
+    def __init__(self, rate_capacity: float, rate_per_second: float, dedup_window: float,
+                 debounce: float, max_concurrent: int, max_users: int = 10000):
+        self.rate_limit = TokenBucket(rate_capacity, rate_per_second, max_users)
+        self.debouncer = Debouncer(debounce)
+        self.dedup = DedupCache(dedup_window, max_users)
+        self.max_concurrent = max_concurrent
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def allow(self, user_id: int) -> bool:
+        allowed = self.rate_limit.allow(user_id)
+        if not allowed:
+            self.rejected += 1
+        return allowed
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the global analysis slots."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self._semaphore:
+            yield
+
+    def stats(self) -> dict:
+        return {"rate_limited": self.rejected, "dedup_hits": self.dedup.hits}
@@ -1,35 +1,74 @@
 """Telegram Bot Handler for DreamDiary AI."""
 
+import asyncio
 import logging
+import textwrap
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from agent import DreamDiaryAgent
+from agent import DreamDiaryAgent, FallbackReply
 from config import Config
+from db.database import init_db
+from db.repositories import ClassificationRepository, DreamRepository, UserRepository
+from utils.log_setup import configure_logging
+from utils.metrics import ERRORS, STAGE_SECONDS, start_metrics_server
+from utils.tracing import span
+from .admission import AdmissionController
+from .streaming import StreamingReply, split_message
 
 
 class TelegramBotHandler:
     """Handles Telegram bot interactions."""
 
-    def __init__(self):
+    def __init__(self, updater: bool = True):
+        """Set up the bot; updater=False builds it without polling, for webhook workers."""
         self.token = Config.TELEGRAM_TOKEN
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN not set in .env")
         self.agent = DreamDiaryAgent()
+        self.admission = AdmissionController(
+            rate_capacity=Config.RATE_LIMIT_BURST,
+            rate_per_second=Config.RATE_LIMIT_PER_MINUTE / 60,
+            dedup_window=Config.DEDUP_WINDOW_SECONDS,
+            debounce=Config.DEBOUNCE_SECONDS,
+            max_concurrent=Config.MAX_CONCURRENT_ANALYSES,
+        )
+        builder = Application.builder()
+        if not updater:
+            builder = builder.updater(None)
         self.app = (
-            Application.builder()
+            builder
             .token(self.token)
             .connect_timeout(30.0)
             .read_timeout(30.0)
             .write_timeout(30.0)
+            .concurrent_updates(Config.CONCURRENT_UPDATES)
+            .post_init(self._on_startup)
+            .post_shutdown(self._on_shutdown)
             .build()
         )
         self._setup_handlers()
         self.app.add_error_handler(self.error_handler)
 
+    async def _on_startup(self, application: Application):
+        """Load the LLM stack in the background once polling can start."""
+        start_metrics_server(Config.METRICS_PORT)
+        await self.agent.background.start()
+        application.create_task(asyncio.to_thread(self.agent.warm_up))
+
+    async def _on_shutdown(self, application: Application):
+        """Let pending emotion extraction and DB saves finish."""
+        await self.agent.aclose()
+        logging.info(f"DB writer drained: {self.agent.writer.metrics()}")
+        logging.info(f"LLM token usage: {self.agent.usage.stats()}")
+        logging.info(f"LLM call policy: {self.agent.resilience.stats()}")
+        logging.info(f"Admission: {self.admission.stats()}")
+
     def _setup_handlers(self):
         """Set up command and message handlers."""
         self.app.add_handler(CommandHandler("start", self.start))
         self.app.add_handler(CommandHandler("help", self.help_command))
+        self.app.add_handler(CommandHandler("stats", self.stats_command))
+        self.app.add_handler(CommandHandler("similar", self.similar_command))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_dream))
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -45,11 +84,56 @@ class TelegramBotHandler:
             "DreamDiary AI - Your personal dream analyst.\n\n"
             "Commands:\n"
             "/start - Start the bot\n"
-            "/help - Show this help\n\n"
+            "/help - Show this help\n"
+            "/stats - Emotions of your dreams over the last 30 days\n"
+            "/similar [text] - Your past dreams most like the text, or like your latest dream\n\n"
             "Just send a dream description, and I'll provide analysis, emotions, and meditation suggestions."
         )
         await update.message.reply_text(help_text)
 
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /stats command from the precomputed emotion rollups."""
+        user_id = await UserRepository.afind_id(update.effective_user.id)
+        top, weeks = [], []
+        if user_id is not None:
+            top = await asyncio.to_thread(ClassificationRepository.top_emotions, user_id, 30, 5)
+            weeks = await asyncio.to_thread(ClassificationRepository.trends, user_id, 28, 7)
+        if not top:
+            await update.message.reply_text("No analyzed dreams in the last 30 days yet. Send me a dream first!")
+            return
+        lines = ["Top emotions in your dreams over the last 30 days:"]
+        lines.extend(f"• {emotion}: {count} dream(s), average intensity {avg:.1f}" for emotion, count, avg in top)
+        lines.append("\nWeek by week:")
+        for start, counts in weeks:
+            leading = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:3]
+            summary = ", ".join(f"{emotion} {count}" for emotion, count in leading) or "-"
+            lines.append(f"{start:%b %d}: {summary}")
+        await update.message.reply_text("\n".join(lines))
+
+    async def similar_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /similar command: search the user's saved dreams by meaning."""
+        if not Config.SIMILAR_DREAMS:
+            await update.message.reply_text("Similar dream search is not enabled on this bot.")
+            return
+        telegram_id = update.effective_user.id
+        query, exclude = " ".join(context.args or []), ()
+        if not query:
+            user_id = await UserRepository.afind_id(telegram_id)
+            latest = await asyncio.to_thread(DreamRepository.get_by_user, user_id, 1) if user_id is not None else []
+            if not latest:
+                await update.message.reply_text("Send me a dream first, or use /similar <text>.")
+                return
+            query, exclude = latest[0].text, (latest[0].id,)
+        similar = await asyncio.to_thread(self.agent.similar_dreams, query, telegram_id, 3, exclude)
+        if not similar:
+            await update.message.reply_text("I couldn't find similar dreams in your diary yet.")
+            return
+        lines = ["Your most similar dreams:"]
+        for dream, score in similar:
+            day = f"{dream.created_at:%Y-%m-%d}" if dream.created_at else "?"
+            lines.append(f"• {day} ({score:.0%}): {textwrap.shorten(dream.text, 200, placeholder='...')}")
+        await update.message.reply_text("\n".join(lines))
+
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors in the bot."""
         logging.error(f"Update {update} caused error: {context.error}", exc_info=context.error)
@@ -61,18 +145,56 @@ class TelegramBotHandler:
             except:
                 pass  # If we can't send message, just log
 
+    @staticmethod
+    async def _send(message, text: str):
+        """Reply to a message, timing the Telegram round trip."""
+        with STAGE_SECONDS.time(stage="telegram_send"):
+            return await message.reply_text(text)
+
     async def handle_dream(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle incoming dream text."""
-        dream_text = update.message.text
+        """Handle incoming dream text as one timed and traced update."""
+        with span("telegram.update", user_id=update.effective_user.id), STAGE_SECONDS.time(stage="update"):
+            await self._handle_dream(update)
+
+    async def _handle_dream(self, update: Update):
+        """Admit and analyze one dream message.
+
+        Messages sent in quick succession are joined into one dream, each
+        user is rate limited, a repeated dream gets the earlier reply and
+        the number of analyses running at once is capped.
+        """
         user_id = update.effective_user.id
+        dream_text = await self.admission.debouncer.submit(user_id, update.message.text)
+        if dream_text is None:
+            return  # joined into the user's next message
 
-        await update.message.reply_text("Analyzing your dream... Please wait.")
+        result, owner = self.admission.dedup.claim(user_id, dream_text)
+        if not owner:
+            response = await result
+            if response is None:
+                await self._send(update.message, "Sorry, an error occurred while analyzing your dream. Please try again.")
+                return
+            for part in split_message(response):
+                await self._send(update.message, part)
+            return
 
+        if not self.admission.allow(user_id):
+            self.admission.dedup.resolve(user_id, dream_text, result, None)
+            wait = self.admission.rate_limit.retry_after(user_id)
+            await self._send(
+                update.message,
+                f"You're sending dreams faster than I can analyze them. Please try again in {wait:.0f} seconds."
+            )
+            return
+
+        response = None
         try:
-            response = self.agent.process_dream(dream_text, user_id=user_id)
-            await update.message.reply_text(response)
+            placeholder = await self._send(update.message, "Analyzing your dream... Please wait.")
+            async with self.admission.slot():
+                response = await self._analyze(update, placeholder, dream_text, user_id)
 
         except Exception as e:
+            ERRORS.inc(stage="update")
             logging.error(f"Error processing dream: {e}", exc_info=True)
             try:
                 await update.message.reply_text(
@@ -80,14 +202,37 @@ class TelegramBotHandler:
                 )
             except:
                 pass  # If even error message fails, just log it
+        finally:
+            # A fallback says "send it again later", so a resend must reach the model
+            if isinstance(response, FallbackReply):
+                response = None
+            self.admission.dedup.resolve(user_id, dream_text, result, response)
+
+    async def _analyze(self, update: Update, placeholder, dream_text: str, user_id: int) -> str:
+        """Run the analysis and deliver it; returns the full reply text (a FallbackReply if it is one)."""
+        # Structured analysis arrives as one tool call, so there is nothing to stream
+        if Config.STREAM_REPLIES and not Config.STRUCTURED_ANALYSIS:
+            reply = StreamingReply(placeholder, min_interval=Config.STREAM_EDIT_INTERVAL)
+            parts = []
+            async for chunk in self.agent.astream_dream(dream_text, user_id=user_id):
+                parts.append(chunk)
+                await reply.feed(chunk)
+            await reply.finish()
+            text = "".join(parts)
+            return FallbackReply(text) if any(isinstance(part, FallbackReply) for part in parts) else text
+        response = await self.agent.aprocess_dream(dream_text, user_id=user_id)
+        for part in split_message(response):
+            await self._send(update.message, part)
+        return response
 
     def run(self):
         """Run the bot."""
         logging.info("Starting Telegram bot...")
+        init_db()
         self.app.run_polling()
 
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+    configure_logging()
     bot = TelegramBotHandler()
     bot.run()
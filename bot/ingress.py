@@ -0,0 +1,125 @@
+"""Webhook ingress: accept Telegram updates and put them on the update queue.
+
+The ingress only validates the secret token and inserts one row per
+update, so it answers Telegram in milliseconds. It refuses to start
+without WEBHOOK_SECRET: anyone who can reach the port could otherwise
+queue updates in any user's name. Bodies over MAX_BODY_BYTES are
+rejected unread. The analyses are run by
+``python -m bot.worker`` processes, as many as needed.
+
+Usage:
+    python -m bot.ingress --set-webhook   # register WEBHOOK_URL with Telegram, then serve
+    python -m bot.ingress
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from config import Config
+from db.database import init_db
+from db.update_queue import UpdateQueue
+from utils.log_setup import configure_logging
+from utils.metrics import ERRORS, QUEUE_DEPTH, REGISTRY, STAGE_SECONDS, start_metrics_server
+
+MAX_BODY_BYTES = 1 << 20  # Telegram updates are a few KB
+
+UPDATES_RECEIVED = REGISTRY.counter("dreamdiary_webhook_updates_total", "Updates accepted by the webhook ingress")
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    path_prefix = "/"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header("content-length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.split("?")[0].rstrip("/") != self.path_prefix.rstrip("/"):
+            self._reply(404)
+            return
+        secret = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not Config.WEBHOOK_SECRET or not hmac.compare_digest(secret.encode(), Config.WEBHOOK_SECRET.encode()):
+            self._reply(403)
+            return
+        try:
+            length = int(self.headers.get("content-length", ""))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._reply(400)
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # the body is left unread
+            self._reply(413)
+            return
+        try:
+            payload = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(payload, dict) or not isinstance(payload.get("update_id"), int):
+            self._reply(400)
+            return
+        try:
+            with STAGE_SECONDS.time(stage="enqueue"):
+                if UpdateQueue.enqueue(payload) is None:
+                    logging.info(f"Update {payload['update_id']} is already queued, dropping the redelivery")
+        except Exception as e:
+            ERRORS.inc(stage="enqueue")
+            logging.error(f"Could not queue update {payload.get('update_id')}: {e}", exc_info=True)
+            self._reply(500)  # Telegram retries the delivery
+            return
+        UPDATES_RECEIVED.inc()
+        self._reply(200)
+
+
+async def set_webhook():
+    from telegram import Bot
+
+    async with Bot(Config.TELEGRAM_TOKEN) as bot:
+        await bot.set_webhook(
+            url=Config.WEBHOOK_URL,
+            secret_token=Config.WEBHOOK_SECRET,
+            allowed_updates=["message"],
+            max_connections=100,
+        )
+    logging.info(f"Webhook set to {Config.WEBHOOK_URL}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--set-webhook", action="store_true", help="register WEBHOOK_URL with Telegram first")
+    args = parser.parse_args()
+
+    configure_logging()
+    if not Config.WEBHOOK_URL:
+        raise SystemExit("WEBHOOK_URL not set in .env")
+    if not Config.WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_SECRET not set in .env; without it anyone can post updates to the ingress")
+    init_db()
+    if args.set_webhook:
+        asyncio.run(set_webhook())
+
+    WebhookHandler.path_prefix = urlparse(Config.WEBHOOK_URL).path or "/"
+    QUEUE_DEPTH.set_function(UpdateQueue.depth, queue="updates")
+    start_metrics_server(Config.METRICS_PORT)
+    server = ThreadingHTTPServer((Config.WEBHOOK_LISTEN, Config.WEBHOOK_PORT), WebhookHandler)
+    logging.info(f"Webhook ingress on {Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}{WebhookHandler.path_prefix}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
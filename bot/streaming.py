@@ -0,0 +1,129 @@
+"""Progressive Telegram replies for streamed analyses."""
+
+import asyncio
+import logging
+import re
+import time
+from typing import List
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+from utils.metrics import STAGE_SECONDS
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+SECTION_TITLES = (
+    "Key Elements",
+    "Emotional Analysis",
+    "Psychological Interpretation",
+    "Guided Meditation",
+    "Reflection Tips",
+)
+
+# A line that opens one of the analysis sections, e.g. "**Key Elements**" or "## 2. Emotional Analysis:"
+_SECTION_RE = re.compile(
+    r"^[ \t#*_>\d.)-]*(?:" + "|".join(SECTION_TITLES) + r")\b",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _split_oversized(text: str, limit: int) -> List[str]:
+    """Split a single section at paragraph, line or word boundaries."""
+    parts = []
+    while len(text) > limit:
+        cut = -1
+        for sep in ("\n\n", "\n", " "):
+            cut = text.rfind(sep, 0, limit)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Split text into Telegram-sized messages, preferring section boundaries."""
+    if len(text) <= limit:
+        return [text] if text else []
+
+    starts = [m.start() for m in _SECTION_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+    parts: List[str] = []
+    current = ""
+    for section in sections:
+        if len(current) + len(section) <= limit:
+            current += section
+            continue
+        if current:
+            parts.append(current.rstrip())
+        if len(section) <= limit:
+            current = section
+        else:
+            pieces = _split_oversized(section, limit)
+            parts.extend(piece.rstrip() for piece in pieces[:-1])
+            current = pieces[-1]
+    if current.strip():
+        parts.append(current.rstrip())
+    return parts
+
+
+class StreamingReply:
+    """Render a growing text into one or more Telegram messages.
+
+    Edits are coalesced to at most one per ``min_interval`` seconds to stay
+    under Telegram's per-chat rate limits; text beyond the message limit
+    continues in follow-up messages split on section boundaries.
+    """
+
+    def __init__(self, placeholder: Message, min_interval: float = 1.5, limit: int = TELEGRAM_MESSAGE_LIMIT):
+        self.min_interval = min_interval
+        self.limit = limit
+        self.text = ""
+        self._messages: List[Message] = [placeholder]
+        self._sent: List[str] = [placeholder.text or ""]
+        self._next_edit = 0.0
+
+    async def feed(self, chunk: str):
+        """Append a chunk, editing the reply if the coalescing window has passed."""
+        self.text += chunk
+        if time.monotonic() >= self._next_edit:
+            await self._sync()
+
+    async def finish(self):
+        """Flush the complete text."""
+        await self._sync(final=True)
+
+    async def _sync(self, final: bool = False):
+        parts = split_message(self.text, self.limit)
+        try:
+            for i, part in enumerate(parts):
+                if i < len(self._messages):
+                    if self._sent[i] != part:
+                        with STAGE_SECONDS.time(stage="telegram_send"):
+                            await self._messages[i].edit_text(part)
+                        self._sent[i] = part
+                else:
+                    with STAGE_SECONDS.time(stage="telegram_send"):
+                        self._messages.append(await self._messages[-1].reply_text(part))
+                    self._sent.append(part)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            self._next_edit = time.monotonic() + retry_after
+            if final:
+                time_left = self._next_edit - time.monotonic()
+                logging.warning(f"Telegram flood control, retrying final edit in {time_left:.1f}s")
+                await asyncio.sleep(time_left)
+                await self._sync(final=True)
+            return
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self._next_edit = time.monotonic() + self.min_interval
@@ -0,0 +1,133 @@
+"""Webhook worker: process queued Telegram updates with the usual handlers.
+
+Workers keep no state that another worker needs: sessions are rebuilt
+from chat_history on a miss and everything else is in the database. Run
+as many as the load requires, on one host or several; the queue
+guarantees that each user's updates are handled one at a time and in
+order.
+
+Usage:
+    python -m bot.worker --concurrency 16
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+from typing import Dict, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import Config
+from db.database import init_db
+from db.update_queue import UpdateQueue
+from utils.log_setup import configure_logging
+from utils.metrics import ERRORS, STAGE_SECONDS
+from .bot_handler import TelegramBotHandler
+
+
+class UpdateWorker:
+    """Lease updates from the queue and feed them to the bot application."""
+
+    def __init__(self, handler: TelegramBotHandler, queue: UpdateQueue, concurrency: int, poll_interval: float):
+        self.handler = handler
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self._running = set()
+        self._stopping = asyncio.Event()
+        self._errors: Dict[int, Tuple[BaseException, ContextTypes.DEFAULT_TYPE]] = {}  # update_id -> handler error
+        # The bot's error handler replies to the user; it only runs once the last attempt failed
+        handler.app.remove_error_handler(handler.error_handler)
+        handler.app.add_error_handler(self._record_error)
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _record_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        """Error handler: process_update reports handler errors here instead of raising them."""
+        if isinstance(update, Update):
+            self._errors[update.update_id] = (context.error, context)
+
+    async def _process(self, queued_id: int, payload: dict, attempts: int):
+        app = self.handler.app
+        update = Update.de_json(payload, app.bot)
+        try:
+            with STAGE_SECONDS.time(stage="worker_update"):
+                await app.process_update(update)
+            failed = self._errors.pop(update.update_id, None)
+            if failed is not None:
+                error, context = failed
+                if attempts >= self.queue.max_attempts:
+                    await self.handler.error_handler(update, context)  # tell the user once, when giving up
+                raise error
+        except Exception as e:
+            ERRORS.inc(stage="worker_update")
+            logging.error(f"Update {queued_id} failed (attempt {attempts}): {e}", exc_info=True)
+            await asyncio.to_thread(self.queue.retry, queued_id, attempts)
+            return
+        await asyncio.to_thread(self.queue.complete, queued_id)
+        self.processed += 1
+
+    async def run(self):
+        while not self._stopping.is_set():
+            free = self.concurrency - len(self._running)
+            claimed = await asyncio.to_thread(self.queue.claim, free) if free > 0 else []
+            for queued_id, payload, attempts in claimed:
+                task = asyncio.create_task(self._process(queued_id, payload, attempts))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            if not claimed:
+                # Idle or saturated: wait for a slot, new work or shutdown
+                waiters = [asyncio.create_task(self._stopping.wait())]
+                if self._running:
+                    waiters.append(asyncio.ensure_future(asyncio.wait(set(self._running), return_when=asyncio.FIRST_COMPLETED)))
+                done, pending = await asyncio.wait(waiters, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in pending:
+                    waiter.cancel()
+        if self._running:
+            await asyncio.wait(set(self._running))
+
+
+async def main_async(concurrency: int):
+    handler = TelegramBotHandler(updater=False)
+    # A user's next update is only leased after the previous one finished, so there is nothing to join
+    handler.admission.debouncer.delay = 0
+    worker = UpdateWorker(
+        handler,
+        UpdateQueue(lease_seconds=Config.QUEUE_LEASE_SECONDS, max_attempts=Config.QUEUE_MAX_ATTEMPTS),
+        concurrency=concurrency,
+        poll_interval=Config.QUEUE_POLL_INTERVAL,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    app = handler.app
+    await app.initialize()
+    await handler._on_startup(app)
+    await app.start()
+    logging.info(f"Worker started with concurrency {concurrency}")
+    try:
+        await worker.run()
+    finally:
+        await app.stop()
+        await handler._on_shutdown(app)
+        await app.shutdown()
+        logging.info(f"Worker stopped after {worker.processed} updates")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=Config.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    configure_logging()
+    init_db()
+    asyncio.run(main_async(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -22,12 +22,93 @@ class Config:
     LEARNING_RATE = 2e-5
     EPOCHS = 3
 
+    # Emotion extraction: "claude" (hidden LLM call) or "local" (ml/emotion_classifier.py)
+    EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "claude").lower()
+    EMOTION_MODEL_DIR = os.getenv("EMOTION_MODEL_DIR", os.path.join(MODEL_DIR, "emotions"))
+    EMOTION_BASE_MODEL = os.getenv("EMOTION_BASE_MODEL", "distilroberta-base")
+    EMOTION_THRESHOLD = float(os.getenv("EMOTION_THRESHOLD", "0.5"))  # probability to keep a label
+    EMOTION_BATCH_LINGER_MS = int(os.getenv("EMOTION_BATCH_LINGER_MS", "10"))  # wait for more texts per batch
+
+    # Similar-dream retrieval (ml/dream_index.py, needs numpy)
+    SIMILAR_DREAMS = os.getenv("SIMILAR_DREAMS", "false").lower() == "true"  # /similar and the vector index
+    SIMILAR_INDEX_DIR = os.getenv("SIMILAR_INDEX_DIR", os.path.join(MODEL_DIR, "dream_index"))  # further processes use <dir>-1, <dir>-2, ...
+    SIMILAR_DIM = int(os.getenv("SIMILAR_DIM", "512"))  # embedding size; changing it rebuilds the index
+    SIMILAR_NPROBE = int(os.getenv("SIMILAR_NPROBE", "8"))  # index lists scanned per query
+    SIMILAR_MIN_SCORE = float(os.getenv("SIMILAR_MIN_SCORE", "0.1"))  # cosine similarity below this is unrelated
+    SIMILAR_SYNC_SECONDS = float(os.getenv("SIMILAR_SYNC_SECONDS", "60"))  # pick up dreams saved by other processes
+    SIMILAR_CONTEXT_K = int(os.getenv("SIMILAR_CONTEXT_K", "0"))  # similar past dreams sent instead of recent history; 0 = off
+
+    # Bot settings
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))  # updates handled in parallel
+    STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"  # edit the reply as it is generated
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))  # seconds between message edits
+    BACKGROUND_QUEUE_SIZE = int(os.getenv("BACKGROUND_QUEUE_SIZE", "100"))  # pending emotion/DB jobs
+    BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "4"))
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public URL Telegram posts updates to (webhook mode)
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # checked against X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "16"))  # updates a worker process handles at once
+    QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "0.5"))  # seconds between polls of an empty queue
+    QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))  # crashed worker's updates reappear after this
+    QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "3"))  # dreams a user can send at once
+    RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "6"))  # sustained dreams per user
+    DEDUP_WINDOW_SECONDS = int(os.getenv("DEDUP_WINDOW_SECONDS", "600"))  # identical dream reuses the reply
+    DEBOUNCE_SECONDS = float(os.getenv("DEBOUNCE_SECONDS", "1.0"))  # join messages sent within this gap; delays every polled dream by it, 0 = off (webhook workers never wait)
+    MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "16"))  # across all users
+    STRUCTURED_ANALYSIS = os.getenv("STRUCTURED_ANALYSIS", "false").lower() == "true"  # one tool call: analysis + emotions
+    STRUCTURED_RETRIES = int(os.getenv("STRUCTURED_RETRIES", "2"))  # re-asks after schema validation fails
+
+    # Write-behind DB persistence
+    DB_WRITER_QUEUE_SIZE = int(os.getenv("DB_WRITER_QUEUE_SIZE", "1000"))
+    DB_WRITER_WORKERS = int(os.getenv("DB_WRITER_WORKERS", "2"))
+    DB_WRITER_BATCH_SIZE = int(os.getenv("DB_WRITER_BATCH_SIZE", "50"))  # dreams per multi-row insert
+    DB_WRITER_LINGER_MS = int(os.getenv("DB_WRITER_LINGER_MS", "50"))  # wait for more dreams before flushing
+    USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "100000"))  # telegram_id -> users.id entries
+
+    # Conversation sessions (per telegram user)
+    HISTORY_MAX_MESSAGES = 20
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))  # estimated tokens of verbatim history
+    HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))  # rolling summary of older turns
+    SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "1000"))
+    SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    SESSION_MAX_CHARS = int(os.getenv("SESSION_MAX_CHARS", "5000000"))  # memory cap across sessions
+
+    # Response cache for symbol lookups and emotion analyses
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+    RESPONSE_CACHE_PERSISTENT = os.getenv("RESPONSE_CACHE_PERSISTENT", "true").lower() == "true"
 
     # API keys (set via env vars)
     TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
     HUGGINGFACE_TOKEN = os.getenv("HUGGINGFACE_TOKEN", "")
     ANTHROPIC_TOKEN = os.getenv("ANTHROPIC_API_KEY", "")
     DATABASE_URL = os.getenv("DATABASE_URL", "")
+    ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "")  # e.g. a local fake server for tests
+
+    # LLM call policy
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # seconds per attempt
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))  # on 429/529/5xx/timeouts
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))  # seconds, doubled per retry with jitter
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+    LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))  # send a duplicate request after this many seconds; 0 = off
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # consecutive failures that open the breaker
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # seconds before a probe call
+
+    # Database connection pool
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() == "true"  # asyncpg-backed reads on the event loop
+
+    # Observability
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json"
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # local Prometheus /metrics endpoint; 0 = off
+    OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"  # spans via opentelemetry, if installed
 
     @classmethod
     def get(cls, key: str) -> Any:
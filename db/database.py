@@ -1,6 +1,13 @@
-"""Database configuration and session management."""
+"""Database configuration and session management.
 
-from sqlalchemy import create_engine
+The engine is created on first use, so importing this module neither
+loads the DB driver nor connects.
+"""
+
+import logging
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine, URL, make_url
 from sqlalchemy.orm import sessionmaker, Session
 from config import Config
 from .models import Base
@@ -8,13 +15,93 @@ from .models import Base
 
 DATABASE_URL = Config.get("DATABASE_URL")
 
-print(f"Connecting to DB: {DATABASE_URL}")
+# Async drivers used for the optional AsyncEngine
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _pool_options(url: URL) -> dict:
+    """Pool settings from Config; in-memory SQLite uses a single shared connection."""
+    options = {"pool_pre_ping": Config.DB_POOL_PRE_PING, "pool_recycle": Config.DB_POOL_RECYCLE}
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+def create_db_engine(url: str = None, **overrides) -> Engine:
+    """Create a pooled engine configured from Config; keyword overrides win."""
+    url = make_url(url or DATABASE_URL)
+    options = {"echo": False, **_pool_options(url), **overrides}
+    logging.info(f"Connecting to DB: {url.render_as_string(hide_password=True)}")
+    return create_engine(url, **options)
+
+
+_engine = None
+
+
+def get_engine() -> Engine:
+    """The application engine, created on first use."""
+    global _engine
+    if _engine is None:
+        _engine = create_db_engine()
+    return _engine
+
+
+class _LazySessionmaker(sessionmaker):
+    """sessionmaker that binds to get_engine() when the first session is opened."""
+
+    def __call__(self, **local_kw) -> Session:
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
+
+
+def __getattr__(name: str):
+    # Keep `from db.database import engine` working without an import-time engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-engine = create_engine(DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def init_db(bind: Engine = None):
+    """Create missing tables. Call once at startup, not on import."""
+    Base.metadata.create_all(bind=bind or get_engine())
+
+
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_engine():
+    """Lazily create an AsyncEngine for the same database (asyncpg for PostgreSQL)."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url = make_url(DATABASE_URL)
+        backend = url.get_backend_name()
+        if backend not in ASYNC_DRIVERS:
+            raise ValueError(f"No async driver configured for {backend}")
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+        _async_engine = create_async_engine(url, echo=False, **_pool_options(url))
+    return _async_engine
+
+
+def get_async_sessionmaker():
+    """async_sessionmaker bound to the async engine."""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_sessionmaker = async_sessionmaker(get_async_engine(), expire_on_commit=False)
+    return _async_sessionmaker
 
-Base.metadata.create_all(bind=engine)
 
 def get_db() -> Session:
     """Yield a database session."""
@@ -23,3 +110,21 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def count_round_trips(connection: Connection):
+    """Count statements sent to the database on a connection.
+
+    Yields a one-element list holding the running count.
+    """
+    counter = [0]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    event.listen(connection, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(connection, "before_cursor_execute", before_cursor_execute)
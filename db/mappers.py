@@ -1,8 +1,31 @@
 """Data mappers for transforming DB models."""
 
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, List, Optional, Tuple
 from .models import User, Dream, Classification, ChatHistory
 
+# Emotions the agent extracts, in the fixed order used for emotion vectors
+EMOTION_LABELS = (
+    "joy", "fear", "anger", "sadness", "calm",
+    "anxiety", "excitement", "confusion", "love", "disgust",
+)
+
+# Numeric intensity for the notes the model attaches to each emotion
+INTENSITY_LEVELS = {"none": 0, "low": 1, "moderate": 2, "high": 3}
+
+_LABEL_INDEX = {label: i for i, label in enumerate(EMOTION_LABELS)}
+_MAX_INTENSITY = max(INTENSITY_LEVELS.values())
+_LEVELS = "|".join(INTENSITY_LEVELS)
+_LABELS = "|".join(EMOTION_LABELS)
+# The item format the extraction prompt asks for: "joy:1 (high)"
+_CANONICAL_RE = re.compile(rf"\b({_LABELS}):([01]) \(({_LEVELS})\)")
+# A label, a separator and a number and/or an intensity word in lower-cased text: "joy:1 (high)",
+# '"joy": "high"', "- **joy** - 1 (low)", "joy = 2". Matches "joy" but not "enjoyed" or "enjoy".
+_EMOTION_RE = re.compile(
+    rf"\b({_LABELS})\b[\"'*]*\s*[:=\-\u2013\u2014]\s*[\"']?"
+    rf"(?:(\d+(?:\.\d+)?)[\"']?[ \t]*\(?[ \t]*[\"']?(?:({_LEVELS})\b)?|({_LEVELS})\b)"
+)
+
 
 class UserMapper:
 
@@ -93,18 +116,48 @@ class ChatHistoryMapper:
 class EmotionMapper:
 
     @staticmethod
-    def parse_emotions(emotions_str: str) -> List[Dict[str, Any]]:
-        """Parse '[joy:1 (high), fear:0 (none), ...]' to list."""
-        if not emotions_str or not emotions_str.startswith("["):
+    def parse_vector(emotions_str: str) -> Optional[Tuple[int, ...]]:
+        """Intensities in EMOTION_LABELS order from the emotion extractor's output, or None if it names no emotion.
+
+        One scan of the text finds every "label: value" pair wherever it
+        is, so the bracket list, JSON objects, bullet lines and replies
+        with text around them all parse. The intensity word ("high",
+        "moderate", ...) gives the score; a 0 flag means absent whatever
+        the word, and a bare number is taken as the score. The first
+        value given for a label wins; unnamed labels are 0. Output in the
+        exact format the prompt asks for, naming all ten, takes a
+        cheaper pattern.
+        """
+        if not emotions_str:
+            return None
+        scores = {label: INTENSITY_LEVELS[note] if flag == "1" else 0
+                  for label, flag, note in _CANONICAL_RE.findall(emotions_str)}
+        if len(scores) == len(EMOTION_LABELS):
+            return tuple(scores[label] for label in EMOTION_LABELS)
+        vector = [0] * len(EMOTION_LABELS)
+        seen = 0
+        for label, number, note, word in _EMOTION_RE.findall(emotions_str.lower()):
+            index = _LABEL_INDEX[label]
+            if seen & (1 << index):
+                continue
+            seen |= 1 << index
+            if number and float(number) == 0:
+                continue
+            level = note or word
+            if level:
+                vector[index] = INTENSITY_LEVELS[level.lower()]
+            else:
+                vector[index] = min(_MAX_INTENSITY, max(1, round(float(number))))
+        return tuple(vector) if seen else None
+
+    @staticmethod
+    def to_emotions(vector: Optional[Tuple[int, ...]]) -> List[Dict[str, Any]]:
+        """Emotion vector in the form DreamRecord stores as classifications."""
+        if vector is None:
             return []
-        items = emotions_str.strip("[]").split(", ")
-        result = []
-        for item in items:
-            parts = item.split(":")
-            if len(parts) == 2:
-                emotion, rest = parts
-                intensity_part = rest.split(" ")
-                intensity = int(intensity_part[0]) if intensity_part[0].isdigit() else 0
-                note = intensity_part[1].strip("()") if len(intensity_part) > 1 else ""
-                result.append({"emotion": emotion, "intensity": intensity, "note": note})
-        return result
+        return [{"emotion": label, "intensity": intensity} for label, intensity in zip(EMOTION_LABELS, vector)]
+
+    @staticmethod
+    def parse_emotions(emotions_str: str) -> List[Dict[str, Any]]:
+        """Parse '[joy:1 (high), fear:0 (none), ...]' (or JSON, bullets) to a list of all ten emotions."""
+        return EmotionMapper.to_emotions(EmotionMapper.parse_vector(emotions_str))
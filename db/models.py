@@ -1,6 +1,6 @@
 """Database models for DreamWeaver AI using SQLAlchemy."""
 
-from sqlalchemy import Column, String, Text, Boolean, TIMESTAMP, BigInteger, ForeignKey, JSON
+from sqlalchemy import Column, String, Text, Boolean, TIMESTAMP, BigInteger, Integer, Float, Date, ForeignKey, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base, relationship
 import uuid
@@ -8,10 +8,13 @@ from datetime import datetime
 
 Base = declarative_base()
 
+# SQLite only autoincrements INTEGER PRIMARY KEY columns
+PrimaryKey = BigInteger().with_variant(Integer, "sqlite")
+
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(PrimaryKey, primary_key=True, autoincrement=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False)
     username = Column(String(255))
     language = Column(String(2), default="en")  # 'en' or 'ru'
@@ -23,8 +26,11 @@ class User(Base):
 
 class Dream(Base):
     __tablename__ = "dreams"
+    __table_args__ = (
+        Index("ix_dreams_user_id_id", "user_id", "id"),  # per-user keyset pagination
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(PrimaryKey, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     text = Column(Text, nullable=False)
     language = Column(String(2), default="en")
@@ -38,8 +44,8 @@ class Dream(Base):
 class Classification(Base):
     __tablename__ = "classifications"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    dream_id = Column(BigInteger, ForeignKey("dreams.id"), nullable=False)
+    id = Column(PrimaryKey, primary_key=True, autoincrement=True)
+    dream_id = Column(BigInteger, ForeignKey("dreams.id"), nullable=False, index=True)
     model = Column(String(50), nullable=False)  # e.g., 'roberta-emotions'
     labels = Column(JSON, nullable=False)       # Array of labels
     scores = Column(JSON, nullable=False)       # Dict of scores
@@ -47,13 +53,49 @@ class Classification(Base):
 
     dream = relationship("Dream", back_populates="classifications")
 
+class EmotionDaily(Base):
+    """Per-user, per-day emotion totals, kept in step with classifications on every write."""
+
+    __tablename__ = "emotion_daily"
+
+    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)                   # UTC date of the dream
+    emotion = Column(String(50), primary_key=True)
+    dreams = Column(Integer, nullable=False, default=0)    # classifications with intensity above zero
+    intensity_sum = Column(Float, nullable=False, default=0)
+
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        Index("ix_chat_history_user_id_timestamp_id", "user_id", "timestamp", "id"),  # latest messages per user
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(PrimaryKey, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     message = Column(Text, nullable=False)
     response = Column(Text, nullable=False)
     timestamp = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
 
     user = relationship("User", back_populates="chat_history")
+
+class ResponseCacheEntry(Base):
+    __tablename__ = "response_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256 of model, prompt and normalized input
+    value = Column(Text, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+class UpdateQueueEntry(Base):
+    __tablename__ = "update_queue"
+    __table_args__ = (
+        Index("ix_update_queue_user_id_id", "user_id", "id"),  # oldest pending update per user
+    )
+
+    id = Column(PrimaryKey, primary_key=True, autoincrement=True)
+    update_id = Column(BigInteger, nullable=False, unique=True)  # Telegram's id; redeliveries are dropped
+    user_id = Column(BigInteger, nullable=False)     # Telegram user (or chat) the update belongs to
+    payload = Column(JSON, nullable=False)           # Update as received from the Telegram webhook
+    attempts = Column(Integer, nullable=False, default=0)
+    leased_until = Column(TIMESTAMP(timezone=True))  # set while a worker processes the update
+    created_at = Column(TIMESTAMP(timezone=True), default=datetime.utcnow)
@@ -1,14 +1,131 @@
 """Repository classes for DB operations."""
 
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import delete, func, insert, select, tuple_
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from .models import User, Dream, Classification, ChatHistory
-from .database import SessionLocal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from config import Config
+from .models import User, Dream, Classification, ChatHistory, ResponseCacheEntry, EmotionDaily
+from .database import SessionLocal, count_round_trips, get_async_sessionmaker
+
+
+class UserIdCache:
+    """Size-capped LRU map of telegram_id -> users.id.
+
+    Internal user ids never change, so entries need no expiry; only ids
+    of committed rows may be put here.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._ids: "OrderedDict[int, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, telegram_id: int) -> Optional[int]:
+        with self._lock:
+            user_id = self._ids.get(telegram_id)
+            if user_id is not None:
+                self._ids.move_to_end(telegram_id)
+            return user_id
+
+    def put_many(self, ids: Dict[int, int]):
+        with self._lock:
+            for telegram_id, user_id in ids.items():
+                self._ids[telegram_id] = user_id
+                self._ids.move_to_end(telegram_id)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+user_ids = UserIdCache(max_entries=Config.USER_ID_CACHE_SIZE)
+
+
+def _dialect_insert(session: Session):
+    """The INSERT construct with ON CONFLICT support for the session's database."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return dialect_insert
+
+
+def _upsert_users(session: Session, users: Dict[int, Optional[str]]) -> Dict[int, int]:
+    """Resolve telegram ids to user ids, inserting missing users atomically.
+
+    INSERT ... ON CONFLICT DO NOTHING RETURNING cannot race on the unique
+    telegram_id constraint; rows that already existed (or were inserted by
+    a concurrent transaction) are read back with one SELECT.
+    """
+    if not users:
+        return {}
+    stmt = _dialect_insert(session)(User).on_conflict_do_nothing(index_elements=[User.telegram_id]).returning(User.telegram_id, User.id)
+    resolved = dict(session.execute(
+        stmt, [{"telegram_id": tid, "username": name} for tid, name in users.items()]
+    ).all())
+    existing = [tid for tid in users if tid not in resolved]
+    if existing:
+        resolved.update(session.execute(
+            select(User.telegram_id, User.id).where(User.telegram_id.in_(existing))
+        ).all())
+    return resolved
 
 
 class UserRepository:
     """Repository for User model."""
 
+    @staticmethod
+    def resolve_ids(session: Session, users: Dict[int, Optional[str]]) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """Map telegram ids to user ids inside an open transaction.
+
+        Cached ids need no query at all; the rest are upserted. Returns the
+        ids that were not cached so the caller can cache them after commit.
+        """
+        resolved = {}
+        missing = {}
+        for telegram_id, username in users.items():
+            user_id = user_ids.get(telegram_id)
+            if user_id is None:
+                missing[telegram_id] = username
+            else:
+                resolved[telegram_id] = user_id
+        fetched = _upsert_users(session, missing)
+        resolved.update(fetched)
+        return resolved, fetched
+
+    @staticmethod
+    def get_id(telegram_id: int, username: str = None) -> int:
+        """Internal id of a telegram user, creating the user if needed."""
+        user_id = user_ids.get(telegram_id)
+        if user_id is not None:
+            return user_id
+        with SessionLocal() as session:
+            user_id = _upsert_users(session, {telegram_id: username})[telegram_id]
+            session.commit()
+        user_ids.put_many({telegram_id: user_id})
+        return user_id
+
+    @staticmethod
+    def find_id(telegram_id: int) -> Optional[int]:
+        """Internal id of a telegram user, or None if the user is unknown."""
+        user_id = user_ids.get(telegram_id)
+        if user_id is None:
+            with SessionLocal() as session:
+                user_id = session.execute(select(User.id).where(User.telegram_id == telegram_id)).scalar()
+            if user_id is not None:
+                user_ids.put_many({telegram_id: user_id})
+        return user_id
+
     @staticmethod
     def get_or_create(telegram_id: int, username: str = None) -> User:
         with SessionLocal() as session:
@@ -20,6 +137,26 @@ class UserRepository:
                 session.refresh(user)
             return user
 
+    @staticmethod
+    async def afind_id(telegram_id: int) -> Optional[int]:
+        """Async variant of find_id: on the async engine with DB_ASYNC, else in a worker thread."""
+        user_id = user_ids.get(telegram_id)
+        if user_id is None and not Config.DB_ASYNC:
+            return await asyncio.to_thread(UserRepository.find_id, telegram_id)
+        if user_id is None:
+            async with get_async_sessionmaker()() as session:
+                user_id = (await session.execute(
+                    select(User.id).where(User.telegram_id == telegram_id)
+                )).scalar()
+            if user_id is not None:
+                user_ids.put_many({telegram_id: user_id})
+        return user_id
+
+    @staticmethod
+    def get_by_telegram_id(telegram_id: int) -> Optional[User]:
+        with SessionLocal() as session:
+            return session.query(User).filter_by(telegram_id=telegram_id).first()
+
     @staticmethod
     def get_by_id(user_id: int) -> Optional[User]:
         with SessionLocal() as session:
@@ -32,7 +169,6 @@ class DreamRepository:
     @staticmethod
     def create(user_id: int, text: str, analysis: str = None, language: str = "en") -> Dream:
         try:
-            print(f"[DreamRepository] Creating dream for user_id={user_id}")
             with SessionLocal() as session:
                 dream = Dream(
                     user_id=user_id,
@@ -41,52 +177,177 @@ class DreamRepository:
                     language=language
                 )
                 session.add(dream)
-                print(f"[DreamRepository] Dream added to session, committing...")
                 session.commit()
-                print(f"[DreamRepository] Commit successful, refreshing...")
                 session.refresh(dream)
-                print(f"[DreamRepository] Dream created successfully with id={dream.id}")
+                logging.debug(f"[DreamRepository] Dream created with id={dream.id} for user_id={user_id}")
                 return dream
         except Exception as e:
-            print(f"❌ [DreamRepository] Error creating dream: {e}")
-            import traceback
-            traceback.print_exc()
+            logging.error(f"[DreamRepository] Error creating dream: {e}", exc_info=True)
             return None
 
     @staticmethod
-    def get_by_user(user_id: int) -> List[Dream]:
+    def get_by_user(user_id: int, limit: int = 50, before_id: int = None) -> List[Dream]:
+        """Newest dreams of a user; pass the last id of a page as before_id for the next one."""
         with SessionLocal() as session:
-            return session.query(Dream).filter_by(user_id=user_id).all()
+            query = session.query(Dream).filter(Dream.user_id == user_id)
+            if before_id is not None:
+                query = query.filter(Dream.id < before_id)
+            return query.order_by(Dream.id.desc()).limit(limit).all()
 
     @staticmethod
     def get_by_id(dream_id: int) -> Optional[Dream]:
         with SessionLocal() as session:
             return session.query(Dream).filter_by(id=dream_id).first()
 
+    @staticmethod
+    def get_many(dream_ids: List[int]) -> Dict[int, Dream]:
+        """Dreams by id with one query; missing ids are left out."""
+        if not dream_ids:
+            return {}
+        with SessionLocal() as session:
+            return {dream.id: dream for dream in session.query(Dream).filter(Dream.id.in_(dream_ids))}
+
+    @staticmethod
+    def latest_analysis(telegram_id: int, text: str) -> Optional[str]:
+        """Analysis the user got the last time they sent exactly this dream, if any."""
+        with SessionLocal() as session:
+            raw = session.execute(
+                select(Dream.raw_analysis)
+                .join(User, User.id == Dream.user_id)
+                .where(User.telegram_id == telegram_id, Dream.text == text)
+                .order_by(Dream.id.desc())
+                .limit(1)
+            ).scalar()
+        return (raw or {}).get("content")
+
+    @staticmethod
+    def texts_after(after_id: int, limit: int = 1000) -> List[Tuple[int, int, str]]:
+        """(dream id, owner telegram id, text) of the next dreams after after_id, in id order."""
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(Dream.id, User.telegram_id, Dream.text)
+                .join(User, User.id == Dream.user_id)
+                .where(Dream.id > after_id)
+                .order_by(Dream.id)
+                .limit(limit)
+            ).all()
+        return [tuple(row) for row in rows]
+
+
+# (user_id, day, emotion) -> [dreams, intensity_sum]
+RollupDeltas = Dict[Tuple[int, date, str], List[float]]
+
 
 class ClassificationRepository:
-    """Repository for Classification model."""
+    """Repository for Classification model and the emotion_daily rollups derived from it.
+
+    Every write of classification rows also applies their totals to
+    emotion_daily in the same transaction, so trend and top-emotion
+    queries read a few rollup rows instead of decoding every
+    classification of the user.
+    """
+
+    @staticmethod
+    def rows(dream_id: int, model: str, emotions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert parameters for one classification row per emotion."""
+        return [
+            {
+                "dream_id": dream_id,
+                "model": model,
+                "labels": [emo["emotion"]],
+                "scores": {emo["emotion"]: emo.get("intensity", 0)},
+            }
+            for emo in emotions
+            if emo and emo.get("emotion")
+        ]
+
+    @staticmethod
+    def dream_owners(session: Session, dream_ids: Iterable[int]) -> Dict[int, Tuple[int, date]]:
+        """Map dream ids to the (user_id, day) their rollups are kept under."""
+        rows = session.execute(
+            select(Dream.id, Dream.user_id, Dream.created_at).where(Dream.id.in_(list(dream_ids)))
+        ).all()
+        return {dream_id: (user_id, (created_at or datetime.utcnow()).date()) for dream_id, user_id, created_at in rows}
+
+    @staticmethod
+    def rollup_deltas(rows: Iterable[Dict[str, Any]], owners: Dict[int, Tuple[int, date]], sign: int = 1,
+                      deltas: Optional[RollupDeltas] = None) -> RollupDeltas:
+        """Add (sign=1) or remove (sign=-1) classification rows to the rollup totals in ``deltas``."""
+        deltas = {} if deltas is None else deltas
+        for row in rows:
+            owner = owners.get(row["dream_id"])
+            if owner is None:
+                continue
+            for emotion, intensity in (row["scores"] or {}).items():
+                try:
+                    intensity = float(intensity)
+                except (TypeError, ValueError):
+                    continue
+                if intensity <= 0:
+                    continue
+                delta = deltas.setdefault((owner[0], owner[1], emotion), [0, 0.0])
+                delta[0] += sign
+                delta[1] += sign * intensity
+        return deltas
 
     @staticmethod
-    def create(dream_id: int, emotion: str, intensity: int, symbol: str = None) -> Classification:
+    def apply_rollups(session: Session, deltas: RollupDeltas):
+        """Upsert rollup deltas with one statement inside an open transaction."""
+        params = [
+            {"user_id": user_id, "day": day, "emotion": emotion, "dreams": int(count), "intensity_sum": total}
+            for (user_id, day, emotion), (count, total) in deltas.items()
+            if count or total
+        ]
+        if not params:
+            return
+        stmt = _dialect_insert(session)(EmotionDaily)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[EmotionDaily.user_id, EmotionDaily.day, EmotionDaily.emotion],
+            set_={
+                "dreams": EmotionDaily.dreams + stmt.excluded.dreams,
+                "intensity_sum": EmotionDaily.intensity_sum + stmt.excluded.intensity_sum,
+            },
+        ), params)
+        if any(p["dreams"] < 0 for p in params):
+            session.execute(delete(EmotionDaily).where(
+                EmotionDaily.user_id.in_({p["user_id"] for p in params}), EmotionDaily.dreams <= 0
+            ))
+
+    @staticmethod
+    def create_many(dream_id: int, model: str, emotions: List[Dict[str, Any]]) -> int:
+        """Store the emotions of one dream with a single multi-row insert."""
+        rows = ClassificationRepository.rows(dream_id, model, emotions)
+        if rows:
+            with SessionLocal() as session:
+                session.execute(insert(Classification), rows)
+                owners = ClassificationRepository.dream_owners(session, [dream_id])
+                ClassificationRepository.apply_rollups(session, ClassificationRepository.rollup_deltas(rows, owners))
+                session.commit()
+        return len(rows)
+
+    @staticmethod
+    def create(dream_id: int, emotion: str, intensity: int, symbol: str = None,
+               model: str = "claude-emotions") -> Classification:
         try:
-            print(f"[ClassificationRepository] Creating classification for dream_id={dream_id}, emotion={emotion}")
             with SessionLocal() as session:
                 classification = Classification(
                     dream_id=dream_id,
-                    model="claude-emotions",
+                    model=model,
                     labels=[emotion] if emotion else [],
                     scores={emotion: intensity} if emotion else {}
                 )
                 session.add(classification)
+                session.flush()
+                owners = ClassificationRepository.dream_owners(session, [dream_id])
+                ClassificationRepository.apply_rollups(session, ClassificationRepository.rollup_deltas(
+                    [{"dream_id": dream_id, "scores": classification.scores}], owners
+                ))
                 session.commit()
                 session.refresh(classification)
-                print(f"[ClassificationRepository] Classification created with id={classification.id}")
+                logging.debug(f"[ClassificationRepository] Classification created with id={classification.id}")
                 return classification
         except Exception as e:
-            print(f"[ClassificationRepository] Error: {e}")
-            import traceback
-            traceback.print_exc()
+            logging.error(f"[ClassificationRepository] Error: {e}", exc_info=True)
             return None
 
     @staticmethod
@@ -94,6 +355,37 @@ class ClassificationRepository:
         with SessionLocal() as session:
             return session.query(Classification).filter_by(dream_id=dream_id).all()
 
+    @staticmethod
+    def top_emotions(user_id: int, days: int = 30, limit: int = 3) -> List[Tuple[str, int, float]]:
+        """(emotion, dreams, average intensity) of the user's most frequent emotions over the last days."""
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        dreams = func.sum(EmotionDaily.dreams)
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(EmotionDaily.emotion, dreams, func.sum(EmotionDaily.intensity_sum))
+                .where(EmotionDaily.user_id == user_id, EmotionDaily.day >= since)
+                .group_by(EmotionDaily.emotion)
+                .order_by(dreams.desc(), func.sum(EmotionDaily.intensity_sum).desc(), EmotionDaily.emotion)
+                .limit(limit)
+            ).all()
+        return [(emotion, int(count), total / count) for emotion, count, total in rows if count > 0]
+
+    @staticmethod
+    def trends(user_id: int, days: int = 28, bucket_days: int = 7) -> List[Tuple[date, Dict[str, int]]]:
+        """Dreams per emotion in consecutive buckets of bucket_days, oldest first, ending today."""
+        today = datetime.utcnow().date()
+        since = today - timedelta(days=days - 1)
+        with SessionLocal() as session:
+            rows = session.execute(
+                select(EmotionDaily.day, EmotionDaily.emotion, EmotionDaily.dreams)
+                .where(EmotionDaily.user_id == user_id, EmotionDaily.day.between(since, today))
+            ).all()
+        buckets = [(since + timedelta(days=start), {}) for start in range(0, days, bucket_days)]
+        for day, emotion, count in rows:
+            counts = buckets[(day - since).days // bucket_days][1]
+            counts[emotion] = counts.get(emotion, 0) + count
+        return buckets
+
 
 class ChatHistoryRepository:
     """Repository for ChatHistory model."""
@@ -101,21 +393,164 @@ class ChatHistoryRepository:
     @staticmethod
     def add_message(user_id: int, message: str, response: str) -> ChatHistory:
         try:
-            print(f"[ChatHistoryRepository] Adding message for user_id={user_id}")
             with SessionLocal() as session:
                 chat = ChatHistory(user_id=user_id, message=message, response=response)
                 session.add(chat)
                 session.commit()
                 session.refresh(chat)
-                print(f"[ChatHistoryRepository] Chat history created with id={chat.id}")
+                logging.debug(f"[ChatHistoryRepository] Chat history created with id={chat.id}")
                 return chat
         except Exception as e:
-            print(f"[ChatHistoryRepository] Error: {e}")
-            import traceback
-            traceback.print_exc()
+            logging.error(f"[ChatHistoryRepository] Error: {e}", exc_info=True)
             return None
 
     @staticmethod
-    def get_by_user(user_id: int, limit: int = 20) -> List[ChatHistory]:
+    def get_by_user(user_id: int, limit: int = 20, before: Tuple[datetime, int] = None) -> List[ChatHistory]:
+        """Newest messages of a user; pass (timestamp, id) of the last row as before for the next page."""
+        with SessionLocal() as session:
+            query = session.query(ChatHistory).filter(ChatHistory.user_id == user_id)
+            if before is not None:
+                query = query.filter(tuple_(ChatHistory.timestamp, ChatHistory.id) < tuple_(*before))
+            return query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit).all()
+
+    @staticmethod
+    async def aget_by_user(user_id: int, limit: int = 20, before: Tuple[datetime, int] = None) -> List[ChatHistory]:
+        """Async variant of get_by_user on the async engine."""
+        query = select(ChatHistory).where(ChatHistory.user_id == user_id)
+        if before is not None:
+            query = query.where(tuple_(ChatHistory.timestamp, ChatHistory.id) < tuple_(*before))
+        query = query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit)
+        async with get_async_sessionmaker()() as session:
+            return list((await session.execute(query)).scalars().all())
+
+
+class ResponseCacheRepository:
+    """Repository for persisted LLM responses."""
+
+    @staticmethod
+    def get(key: str) -> Optional[str]:
+        with SessionLocal() as session:
+            entry = session.query(ResponseCacheEntry).filter(
+                ResponseCacheEntry.key == key,
+                ResponseCacheEntry.expires_at > datetime.utcnow()
+            ).first()
+            return entry.value if entry else None
+
+    @staticmethod
+    def set(key: str, value: str, ttl: float) -> None:
+        with SessionLocal() as session:
+            session.merge(ResponseCacheEntry(
+                key=key,
+                value=value,
+                created_at=datetime.utcnow(),
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+            ))
+            session.commit()
+
+    @staticmethod
+    def purge_expired() -> int:
         with SessionLocal() as session:
-            return session.query(ChatHistory).filter_by(user_id=user_id).order_by(ChatHistory.timestamp.desc()).limit(limit).all()
+            deleted = session.query(ResponseCacheEntry).filter(
+                ResponseCacheEntry.expires_at <= datetime.utcnow()
+            ).delete()
+            session.commit()
+            return deleted
+
+
+class DreamRecord:
+    """A processed dream waiting to be persisted."""
+
+    def __init__(self, telegram_id: int, text: str, analysis: str, emotions: List[Dict[str, Any]] = None,
+                 username: str = None, language: str = "en", model: str = "claude-emotions"):
+        self.telegram_id = telegram_id
+        self.text = text
+        self.analysis = analysis
+        self.emotions = emotions or []
+        self.username = username
+        self.language = language
+        self.model = model
+
+
+class SaveResult:
+    """Outcome of a unit-of-work save."""
+
+    def __init__(self, dream_ids: List[int], round_trips: int):
+        self.dream_ids = dream_ids
+        self.round_trips = round_trips
+
+    @property
+    def dream_id(self) -> Optional[int]:
+        return self.dream_ids[0] if self.dream_ids else None
+
+
+class DreamUnitOfWork:
+    """Persist processed dreams and everything derived from them in one transaction."""
+
+    @staticmethod
+    def save(telegram_id: int, text: str, analysis: str, emotions: List[Dict[str, Any]] = None,
+             username: str = None, language: str = "en",
+             model: str = "claude-emotions") -> Optional[SaveResult]:
+        """Write user, dream, classifications and chat entry with a single commit."""
+        return DreamUnitOfWork.save_batch([DreamRecord(
+            telegram_id=telegram_id, text=text, analysis=analysis, emotions=emotions,
+            username=username, language=language, model=model
+        )])
+
+    @staticmethod
+    def save_batch(records: List[DreamRecord]) -> Optional[SaveResult]:
+        """Write a batch of dreams with one multi-row insert per table and a single commit.
+
+        Inserts use RETURNING instead of refresh. The result carries the
+        dream ids in record order and the number of statements sent plus
+        the commit.
+        """
+        if not records:
+            return SaveResult(dream_ids=[], round_trips=0)
+        try:
+            with SessionLocal() as session:
+                with count_round_trips(session.connection()) as round_trips:
+                    ids, fetched = UserRepository.resolve_ids(
+                        session, {r.telegram_id: r.username for r in records}
+                    )
+
+                    now = datetime.utcnow()
+                    dream_ids = session.execute(
+                        insert(Dream).returning(Dream.id, sort_by_parameter_order=True),
+                        [
+                            {
+                                "user_id": ids[r.telegram_id],
+                                "created_at": now,
+                                "text": r.text,
+                                "raw_analysis": {"content": r.analysis} if r.analysis else {},
+                                "language": r.language,
+                                "processed": bool(r.emotions),  # classified at save time
+                            }
+                            for r in records
+                        ]
+                    ).scalars().all()
+
+                    rows = [
+                        row
+                        for r, dream_id in zip(records, dream_ids)
+                        for row in ClassificationRepository.rows(dream_id, r.model, r.emotions)
+                    ]
+                    if rows:
+                        session.execute(insert(Classification), rows)
+                        owners = {
+                            dream_id: (ids[r.telegram_id], now.date())
+                            for r, dream_id in zip(records, dream_ids)
+                        }
+                        ClassificationRepository.apply_rollups(
+                            session, ClassificationRepository.rollup_deltas(rows, owners)
+                        )
+
+                    session.execute(insert(ChatHistory), [
+                        {"user_id": ids[r.telegram_id], "message": r.text, "response": r.analysis}
+                        for r in records
+                    ])
+                    session.commit()
+                user_ids.put_many(fetched)
+                return SaveResult(dream_ids=list(dream_ids), round_trips=round_trips[0] + 1)
+        except Exception as e:
+            logging.error(f"[DreamUnitOfWork] Error saving {len(records)} dream(s): {e}", exc_info=True)
+            return None
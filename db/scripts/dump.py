@@ -0,0 +1,304 @@
+"""Script to export and import diaries as JSONL or Parquet, streaming in chunks.
+
+Export reads each table through a server-side cursor and writes one file
+per table plus manifest.json, one chunk at a time, so memory stays
+bounded by the chunk size whatever the table size. Export either whole
+tables or the diary of one Telegram user.
+
+Import loads a dump in table order within a single transaction. On
+PostgreSQL it uses COPY FROM STDIN, elsewhere chunked multi-row INSERTs.
+Ids are kept, so import into an empty database (restore) or one without
+those ids. The emotion_daily rollups are updated for the imported
+classifications and id sequences are moved past the imported ids.
+
+Parquet needs pyarrow (requirements-ml.txt).
+
+Usage:
+    python -m db.scripts.dump export backup/ --format parquet
+    python -m db.scripts.dump export gdpr_123/ --user 123456789 --format jsonl
+    python -m db.scripts.dump import backup/
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import JSON, Boolean, Date, DateTime, Float, Integer, String, Table, Text, insert, select
+from sqlalchemy.engine import Connection
+
+from db.database import get_engine, init_db
+from db.models import Base, ChatHistory, Classification, Dream, User
+from db.repositories import ClassificationRepository
+
+MANIFEST_FILE = "manifest.json"
+# Dependency order: parents are imported before the rows that reference them
+TABLES = ("users", "dreams", "classifications", "chat_history")
+FORMATS = {"jsonl": ".jsonl", "parquet": ".parquet"}
+
+
+def _user_filters(telegram_id: int, user_id: int) -> Dict[str, Any]:
+    """WHERE clause per table selecting one user's diary."""
+    return {
+        "users": User.telegram_id == telegram_id,
+        "dreams": Dream.user_id == user_id,
+        "classifications": Classification.dream_id.in_(select(Dream.id).where(Dream.user_id == user_id)),
+        "chat_history": ChatHistory.user_id == user_id,
+    }
+
+
+def _plain(value: Any) -> Any:
+    """JSON-friendly value: timestamps as ISO strings in UTC."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _parse(column, value: Any) -> Any:
+    """Inverse of _plain and of the Parquet encoding for one column."""
+    if value is None:
+        return None
+    if isinstance(column.type, JSON) and isinstance(value, str):
+        return json.loads(value)
+    if isinstance(column.type, DateTime) and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Date) and isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+class JsonlWriter:
+    def __init__(self, path: str, table: Table):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self._file.writelines(
+            json.dumps({k: _plain(v) for k, v in row.items()}, ensure_ascii=False) + "\n" for row in rows
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """One row group per chunk; JSON columns are stored as JSON strings."""
+
+    def __init__(self, path: str, table: Table):
+        pa, pq = _pyarrow()
+        self._pa = pa
+        self._columns = list(table.columns)
+        self._schema = pa.schema([(column.name, self._arrow_type(column)) for column in self._columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def _arrow_type(self, column):
+        pa = self._pa
+        kind = column.type
+        if isinstance(kind, JSON) or isinstance(kind, (String, Text)):
+            return pa.string()
+        if isinstance(kind, Boolean):
+            return pa.bool_()
+        if isinstance(kind, DateTime):
+            return pa.timestamp("us")
+        if isinstance(kind, Date):
+            return pa.date32()
+        if isinstance(kind, Float):
+            return pa.float64()
+        if isinstance(kind, Integer):
+            return pa.int64()
+        raise TypeError(f"No Parquet type for {column.table.name}.{column.name} ({kind})")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        arrays = {}
+        for column in self._columns:
+            values = [row[column.name] for row in rows]
+            if isinstance(column.type, JSON):
+                values = [None if v is None else json.dumps(v, ensure_ascii=False) for v in values]
+            elif isinstance(column.type, DateTime):
+                values = [
+                    v.astimezone(timezone.utc).replace(tzinfo=None) if v is not None and v.tzinfo else v
+                    for v in values
+                ]
+            arrays[column.name] = values
+        self._writer.write_table(self._pa.table(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet needs pyarrow: pip install -r requirements-ml.txt (or use --format jsonl)")
+    return pa, pq
+
+
+def export(out_dir: str, fmt: str = "jsonl", telegram_id: Optional[int] = None,
+           chunk_size: int = 10_000, tables=TABLES) -> Dict[str, int]:
+    """Write the selected tables to out_dir; returns rows written per table."""
+    os.makedirs(out_dir, exist_ok=True)
+    writer_class = ParquetWriter if fmt == "parquet" else JsonlWriter
+    counts = {}
+    with get_engine().connect() as conn:
+        filters = {}
+        if telegram_id is not None:
+            user_id = conn.execute(select(User.id).where(User.telegram_id == telegram_id)).scalar()
+            if user_id is None:
+                raise SystemExit(f"No user with telegram id {telegram_id}")
+            filters = _user_filters(telegram_id, user_id)
+        for name in tables:
+            table = Base.metadata.tables[name]
+            query = select(table).order_by(*table.primary_key.columns)
+            if name in filters:
+                query = query.where(filters[name])
+            started = time.perf_counter()
+            writer = writer_class(os.path.join(out_dir, name + FORMATS[fmt]), table)
+            counts[name] = 0
+            try:
+                result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query)
+                for chunk in result.mappings().partitions():
+                    writer.write([dict(row) for row in chunk])
+                    counts[name] += len(chunk)
+            finally:
+                writer.close()
+            print(f"{name}: {counts[name]} rows in {time.perf_counter() - started:.1f}s")
+        conn.rollback()
+    manifest = {
+        "format": fmt,
+        "tables": counts,
+        "telegram_id": telegram_id,
+        "exported_at": datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return counts
+
+
+def _read_chunks(path: str, fmt: str, table: Table, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    columns = {column.name: column for column in table.columns}
+    if fmt == "parquet":
+        _, pq = _pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield [{k: _parse(columns[k], v) for k, v in row.items() if k in columns} for row in batch.to_pylist()]
+        return
+    chunk = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                chunk.append({k: _parse(columns[k], v) for k, v in json.loads(line).items() if k in columns})
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _copy_value(value: Any) -> str:
+    """One field in PostgreSQL COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_rows(conn: Connection, table: Table, rows: List[Dict[str, Any]]):
+    """Load rows with COPY FROM STDIN on PostgreSQL, multi-row INSERT elsewhere."""
+    if conn.dialect.name != "postgresql":
+        conn.execute(insert(table), rows)
+        return
+    names = [column.name for column in table.columns]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row.get(name)) for name in names))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(names)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def _reset_sequences(conn: Connection, tables):
+    """Move PostgreSQL id sequences past the imported ids."""
+    if conn.dialect.name != "postgresql":
+        return
+    for name in tables:
+        conn.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+            f"GREATEST((SELECT COALESCE(MAX(id), 0) FROM {name}), 1))"
+        )
+
+
+def import_dump(in_dir: str, chunk_size: int = 10_000) -> Dict[str, int]:
+    """Load a dump written by export(); returns rows loaded per table."""
+    with open(os.path.join(in_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    fmt = manifest["format"]
+    engine = get_engine()
+    init_db(engine)
+    counts = {}
+    with engine.begin() as conn:
+        for name in TABLES:
+            path = os.path.join(in_dir, name + FORMATS[fmt])
+            if name not in manifest["tables"] or not os.path.exists(path):
+                continue
+            table = Base.metadata.tables[name]
+            started = time.perf_counter()
+            counts[name] = 0
+            for rows in _read_chunks(path, fmt, table, chunk_size):
+                _copy_rows(conn, table, rows)
+                if name == "classifications":
+                    _apply_rollups(conn, rows)
+                counts[name] += len(rows)
+            print(f"{name}: {counts[name]} rows in {time.perf_counter() - started:.1f}s")
+        _reset_sequences(conn, counts)
+    return counts
+
+
+def _apply_rollups(conn: Connection, rows: List[Dict[str, Any]]):
+    from sqlalchemy.orm import Session
+
+    with Session(bind=conn) as session:
+        owners = ClassificationRepository.dream_owners(session, {row["dream_id"] for row in rows})
+        ClassificationRepository.apply_rollups(session, ClassificationRepository.rollup_deltas(rows, owners))
+        session.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    exporter = commands.add_parser("export", help="write tables to a directory")
+    exporter.add_argument("out_dir")
+    exporter.add_argument("--format", choices=sorted(FORMATS), default="jsonl")
+    exporter.add_argument("--user", type=int, default=None, help="only this Telegram user's diary")
+    exporter.add_argument("--tables", nargs="+", choices=TABLES, default=list(TABLES))
+    exporter.add_argument("--chunk-size", type=int, default=10_000)
+    importer = commands.add_parser("import", help="load a directory written by export")
+    importer.add_argument("in_dir")
+    importer.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        counts = export(args.out_dir, args.format, args.user, args.chunk_size, args.tables)
+    else:
+        counts = import_dump(args.in_dir, args.chunk_size)
+    print(f"{args.command.capitalize()}ed {sum(counts.values())} rows in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
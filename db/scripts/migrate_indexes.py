@@ -0,0 +1,36 @@
+"""Script to add the per-user read indexes to an existing database.
+
+create_all only creates missing tables, so databases created before the
+indexes were declared in db/models.py need this one-off migration. On
+PostgreSQL the indexes are built CONCURRENTLY so writes are not blocked.
+"""
+
+from sqlalchemy.engine import Engine
+from db.models import Base
+
+INDEXED_TABLES = ("dreams", "classifications", "chat_history")
+
+
+def apply_indexes(engine: Engine):
+    """Create every index declared on the per-user tables if it is missing."""
+    indexes = [index for name in INDEXED_TABLES for index in Base.metadata.tables[name].indexes]
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for index in indexes:
+                columns = ", ".join(column.name for column in index.columns)
+                conn.exec_driver_sql(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} "
+                    f"ON {index.table.name} ({columns})"
+                )
+                print(f"Index {index.name} ready.")
+            for name in INDEXED_TABLES:
+                conn.exec_driver_sql(f"ANALYZE {name}")
+    else:
+        for index in indexes:
+            index.create(bind=engine, checkfirst=True)
+            print(f"Index {index.name} ready.")
+
+
+if __name__ == "__main__":
+    from db.database import engine
+    apply_indexes(engine)
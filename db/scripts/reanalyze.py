@@ -0,0 +1,159 @@
+"""Script to classify (and optionally re-analyze) dreams not yet processed.
+
+Dreams with processed = false are read in id order, one chunk at a time.
+A chunk is read in a short transaction and sent to the configured
+emotion backend with bounded concurrency, with no transaction or row
+locks held during the model calls. The results are written in a second
+transaction: the dreams' classifications (from whatever model) are
+replaced with one multi-row insert, the emotion_daily rollups are
+corrected by the difference, and the dreams are marked processed. Dreams
+another run processed in the meantime are skipped. A crash loses at
+most the current chunk; running the script again picks up where it
+stopped. Several runs share the work with --shard.
+
+Usage:
+    python -m db.scripts.reanalyze --chunk-size 200 --concurrency 8 --backend local
+    python -m db.scripts.reanalyze --reanalyze --limit 1000
+    python -m db.scripts.reanalyze --reset   # mark every dream unprocessed first
+    python -m db.scripts.reanalyze --shard 0/4   # and 1/4, 2/4, 3/4 in other terminals
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+
+from config import Config
+from db.database import SessionLocal
+from db.models import Classification, Dream
+from db.repositories import ClassificationRepository
+
+
+def _read_chunk(after_id: int, chunk_size: int, shard: Tuple[int, int] = (0, 1)) -> List[Tuple[int, str]]:
+    """Next chunk of unprocessed dreams of this shard, read in its own short transaction."""
+    index, count = shard
+    query = (
+        select(Dream.id, Dream.text)
+        .where(Dream.processed.is_(False), Dream.id > after_id)
+        .order_by(Dream.id)
+        .limit(chunk_size)
+    )
+    if count > 1:
+        query = query.where(Dream.id % count == index)
+    with SessionLocal() as session:
+        return [tuple(row) for row in session.execute(query)]
+
+
+async def _process_chunk(agent, dreams: List[Tuple[int, str]], concurrency: int, reanalyze: bool) -> Dict[int, tuple]:
+    """(emotions, model, analysis) per dream id; dreams that failed are left out."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(dream_id: int, text: str):
+        async with semaphore:
+            try:
+                return dream_id, await agent.aclassify_dream(text, reanalyze)
+            except Exception as e:
+                print(f"Dream {dream_id} failed, left unprocessed: {e}")
+                return dream_id, None
+
+    results = await asyncio.gather(*(one(dream_id, text) for dream_id, text in dreams))
+    return {dream_id: result for dream_id, result in results if result is not None}
+
+
+def _write_chunk(results: Dict[int, tuple]) -> int:
+    """Replace the dreams' classifications, update rollups, store analyses and mark the dreams processed.
+
+    Runs in one transaction; returns how many dreams were written.
+    """
+    with SessionLocal() as session:
+        pending = select(Dream.id).where(Dream.id.in_(list(results)), Dream.processed.is_(False))
+        if session.get_bind().dialect.name == "postgresql":
+            pending = pending.with_for_update()
+        dream_ids = session.execute(pending).scalars().all()  # skip dreams another run wrote meanwhile
+        if not dream_ids:
+            return 0
+        rows = []
+        for dream_id in dream_ids:
+            emotions, model, analysis = results[dream_id]
+            rows.extend(ClassificationRepository.rows(dream_id, model, emotions))
+            if analysis is not None:
+                session.execute(
+                    update(Dream).where(Dream.id == dream_id).values(raw_analysis={"content": analysis})
+                )
+        owners = ClassificationRepository.dream_owners(session, dream_ids)
+        replaced = session.execute(
+            delete(Classification)
+            .where(Classification.dream_id.in_(dream_ids))
+            .returning(Classification.dream_id, Classification.scores)
+        ).mappings().all()
+        deltas = ClassificationRepository.rollup_deltas(replaced, owners, sign=-1)
+        if rows:
+            session.execute(insert(Classification), rows)
+            ClassificationRepository.rollup_deltas(rows, owners, deltas=deltas)
+        ClassificationRepository.apply_rollups(session, deltas)
+        session.execute(update(Dream).where(Dream.id.in_(dream_ids)).values(processed=True))
+        session.commit()
+        return len(dream_ids)
+
+
+async def run(chunk_size: int, concurrency: int, reanalyze: bool, limit: Optional[int] = None,
+              shard: Tuple[int, int] = (0, 1)) -> int:
+    from agent.dream_agent import DreamDiaryAgent
+
+    agent = DreamDiaryAgent()
+    after_id, done, failed = 0, 0, 0
+    started = time.perf_counter()
+    try:
+        while limit is None or done + failed < limit:
+            size = chunk_size if limit is None else min(chunk_size, limit - done - failed)
+            dreams = await asyncio.to_thread(_read_chunk, after_id, size, shard)
+            if not dreams:
+                break
+            chunk_started = time.perf_counter()
+            results = await _process_chunk(agent, dreams, concurrency, reanalyze)
+            written = await asyncio.to_thread(_write_chunk, results) if results else 0
+            after_id = dreams[-1][0]
+            done += written
+            failed += len(dreams) - len(results)
+            elapsed = time.perf_counter() - started
+            print(f"chunk up to id {after_id}: {written}/{len(dreams)} dreams in "
+                  f"{time.perf_counter() - chunk_started:.2f}s | total {done} ({done / elapsed:.1f} dreams/s)")
+    finally:
+        await agent.aclose()
+    elapsed = time.perf_counter() - started
+    print(f"Processed {done} dreams ({failed} failed) in {elapsed:.1f}s: {done / max(elapsed, 1e-9):.1f} dreams/s")
+    return done
+
+
+def reset_processed() -> int:
+    """Mark every dream unprocessed, e.g. before re-running with a new model."""
+    with SessionLocal() as session:
+        count = session.execute(update(Dream).values(processed=False)).rowcount
+        session.commit()
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="dreams classified at once")
+    parser.add_argument("--backend", choices=("claude", "local"), default=Config.EMOTION_BACKEND)
+    parser.add_argument("--reanalyze", action="store_true", help="also regenerate the stored analysis text")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many dreams")
+    parser.add_argument("--reset", action="store_true", help="mark every dream unprocessed before starting")
+    parser.add_argument("--shard", default="0/1", help="I/N: only dreams with id %% N == I, to split work across runs")
+    args = parser.parse_args()
+
+    index, count = (int(part) for part in args.shard.split("/"))
+    if not 0 <= index < count:
+        parser.error("--shard must be I/N with 0 <= I < N")
+    Config.EMOTION_BACKEND = args.backend
+    if args.reset:
+        print(f"Marked {reset_processed()} dreams unprocessed.")
+    asyncio.run(run(args.chunk_size, args.concurrency, args.reanalyze, args.limit, (index, count)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Script to rebuild the emotion_daily rollups from the classifications table.
+
+Rollups are maintained on every write, so this is only needed once for
+databases that had classifications before the table existed, or after
+classifications were changed by hand. Classifications are read through a
+server-side cursor and the rollups are replaced in one transaction.
+
+Usage:
+    python -m db.scripts.rebuild_rollups
+"""
+
+import time
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from db.database import SessionLocal
+from db.models import Classification, Dream, EmotionDaily
+from db.repositories import ClassificationRepository, RollupDeltas
+
+
+def aggregate_classifications(session, user_id: Optional[int] = None, since: Optional[date] = None,
+                              batch_size: int = 5000) -> RollupDeltas:
+    """Per-user, per-day emotion totals computed from the classification rows themselves."""
+    query = (
+        select(Classification.dream_id, Classification.scores, Dream.user_id, Dream.created_at)
+        .join(Dream, Dream.id == Classification.dream_id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    if user_id is not None:
+        query = query.where(Dream.user_id == user_id)
+    if since is not None:
+        query = query.where(Dream.created_at >= since)
+    deltas: RollupDeltas = {}
+    for dream_id, scores, owner, created_at in session.execute(query):
+        day = (created_at or datetime.utcnow()).date()  # as ClassificationRepository.dream_owners does
+        ClassificationRepository.rollup_deltas(
+            [{"dream_id": dream_id, "scores": scores}], {dream_id: (owner, day)}, deltas=deltas
+        )
+    return deltas
+
+
+def rebuild() -> int:
+    """Replace every rollup row; returns the number of rows written."""
+    with SessionLocal() as session:
+        deltas = aggregate_classifications(session)
+        session.execute(delete(EmotionDaily))
+        ClassificationRepository.apply_rollups(session, deltas)
+        session.commit()
+    return len(deltas)
+
+
+if __name__ == "__main__":
+    from db.database import init_db
+
+    init_db()
+    started = time.perf_counter()
+    print(f"Rebuilt {rebuild()} rollup rows in {time.perf_counter() - started:.1f}s.")
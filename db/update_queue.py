@@ -0,0 +1,125 @@
+"""Durable Telegram update queue in the update_queue table.
+
+Workers lease updates with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of processes can pull from the same table without handing out an
+update twice. Only the oldest update of each user can be leased, and it
+stays in the table until it is completed. A user's updates are therefore
+processed one at a time, in the order they arrived. A lease that is not
+completed, e.g. because the worker crashed, expires and the update is
+handed out again. Lease times come from the database clock, so workers
+with skewed clocks or a non-UTC session time zone agree on them.
+
+update_id is unique, so an update Telegram delivers again while the
+first copy is still queued is dropped. Completed updates are deleted;
+a redelivery after that would be queued again, but Telegram only
+redelivers updates the webhook did not answer with 2xx.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, exists, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from .database import SessionLocal
+from .repositories import _dialect_insert
+from .models import UpdateQueueEntry
+
+
+def update_user_id(payload: Dict[str, Any]) -> int:
+    """User an update belongs to: the sender, else the chat, else 0."""
+    for key in ("message", "edited_message", "callback_query", "inline_query", "my_chat_member"):
+        item = payload.get(key)
+        if isinstance(item, dict):
+            sender = item.get("from") or item.get("chat") or {}
+            if "id" in sender:
+                return int(sender["id"])
+    return 0
+
+
+def _server_time(session: Session, seconds: float = 0):
+    """Database clock plus ``seconds``, as an SQL expression."""
+    if session.get_bind().dialect.name == "sqlite":
+        # UTC with milliseconds, like the naive values SQLite stores
+        return func.strftime("%Y-%m-%d %H:%M:%f", "now", f"{seconds:+} seconds")
+    return func.now() + timedelta(seconds=seconds) if seconds else func.now()
+
+
+class UpdateQueue:
+    """Enqueue, lease, complete and retry queued updates."""
+
+    def __init__(self, lease_seconds: float = 300, max_attempts: int = 3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def enqueue(payload: Dict[str, Any]) -> Optional[int]:
+        """Queue an update; returns its queue id, or None if the update_id is already queued."""
+        with SessionLocal() as session:
+            queued_id = session.execute(
+                _dialect_insert(session)(UpdateQueueEntry)
+                .on_conflict_do_nothing(index_elements=[UpdateQueueEntry.update_id])
+                .returning(UpdateQueueEntry.id),
+                {
+                    "update_id": payload["update_id"],
+                    "user_id": update_user_id(payload),
+                    "payload": payload,
+                    "attempts": 0,
+                },
+            ).scalar()
+            session.commit()
+            return queued_id
+
+    def claim(self, limit: int) -> List[Tuple[int, Dict[str, Any], int]]:
+        """Lease up to ``limit`` updates; returns (id, payload, attempts) in queue order."""
+        earlier = aliased(UpdateQueueEntry)
+        with SessionLocal() as session:
+            now = _server_time(session)
+            candidates = (
+                select(UpdateQueueEntry.id)
+                .where(or_(UpdateQueueEntry.leased_until.is_(None), UpdateQueueEntry.leased_until < now))
+                .where(~exists().where(earlier.user_id == UpdateQueueEntry.user_id, earlier.id < UpdateQueueEntry.id))
+                .order_by(UpdateQueueEntry.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True, of=UpdateQueueEntry)
+            )
+            ids = session.execute(candidates).scalars().all()
+            if not ids:
+                session.rollback()
+                return []
+            rows = session.execute(
+                update(UpdateQueueEntry)
+                .where(UpdateQueueEntry.id.in_(ids))
+                .values(leased_until=_server_time(session, self.lease_seconds), attempts=UpdateQueueEntry.attempts + 1)
+                .returning(UpdateQueueEntry.id, UpdateQueueEntry.payload, UpdateQueueEntry.attempts)
+            ).all()
+            session.commit()
+        return sorted((tuple(row) for row in rows), key=lambda row: row[0])
+
+    @staticmethod
+    def complete(queued_id: int):
+        """Remove a processed update, releasing the user's next one."""
+        with SessionLocal() as session:
+            session.execute(delete(UpdateQueueEntry).where(UpdateQueueEntry.id == queued_id))
+            session.commit()
+
+    def retry(self, queued_id: int, attempts: int, delay: float = 5.0) -> bool:
+        """Hand a failed update out again after ``delay``; drops it once attempts run out."""
+        if attempts >= self.max_attempts:
+            logging.error(f"Dropping update {queued_id} after {attempts} attempts")
+            self.complete(queued_id)
+            return False
+        with SessionLocal() as session:
+            session.execute(
+                update(UpdateQueueEntry)
+                .where(UpdateQueueEntry.id == queued_id)
+                .values(leased_until=_server_time(session, delay))
+            )
+            session.commit()
+        return True
+
+    @staticmethod
+    def depth() -> int:
+        with SessionLocal() as session:
+            return session.query(UpdateQueueEntry).count()
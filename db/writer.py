@@ -0,0 +1,134 @@
+"""Write-behind persistence pipeline for processed dreams."""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+from utils.metrics import ERRORS, QUEUE_DEPTH, STAGE_SECONDS
+from .repositories import DreamRecord, DreamUnitOfWork
+
+_STOP = object()
+
+
+class DreamWriter:
+    """Bounded queue drained by a fixed pool of writer threads.
+
+    Each worker groups whatever is pending (up to ``batch_size`` records,
+    waiting at most ``linger`` seconds for more) into one multi-row
+    transaction. ``submit`` blocks while the queue is full and ``close``
+    flushes everything that was accepted before stopping the workers; it
+    is also registered with atexit so queued writes survive a normal exit.
+    ``on_saved(records, dream_ids)`` is called after each successful commit.
+    """
+
+    def __init__(self, maxsize: int = 1000, workers: int = 2, batch_size: int = 50, linger: float = 0.05,
+                 on_saved: Optional[Callable[[List[DreamRecord], List[int]], None]] = None):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.on_saved = on_saved
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._workers = [
+            threading.Thread(target=self._run, name=f"dream-writer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._lock = threading.Lock()
+        self._closed = False
+        self.saved = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+        QUEUE_DEPTH.set_function(self._queue.qsize, queue="db_writer")
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+
+    def submit(self, record: DreamRecord, timeout: float = None):
+        """Queue a record, blocking while the queue is full."""
+        if self._closed:
+            raise RuntimeError("DreamWriter is closed")
+        self._queue.put(record, timeout=timeout)
+
+    def _next_batch(self) -> List:
+        batch = [self._queue.get()]
+        if batch[0] is _STOP:
+            return batch
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            records = [r for r in batch if r is not _STOP]
+            if records:
+                self._flush(records)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _flush(self, records: List[DreamRecord]):
+        started = time.perf_counter()
+        result = DreamUnitOfWork.save_batch(records)
+        if result is None and len(records) > 1:
+            # Retry one by one so a single bad record does not drop the batch
+            results = [DreamUnitOfWork.save_batch([r]) for r in records]
+            committed = [(r, res.dream_id) for r, res in zip(records, results) if res is not None]
+        else:
+            committed = list(zip(records, result.dream_ids)) if result is not None else []
+        saved = len(committed)
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage="db_commit")
+        if committed and self.on_saved is not None:
+            try:
+                self.on_saved([r for r, _ in committed], [dream_id for _, dream_id in committed])
+            except Exception as e:
+                ERRORS.inc(stage="on_saved")
+                logging.warning(f"on_saved callback failed for {saved} dream(s): {e}")
+        if saved < len(records):
+            ERRORS.inc(len(records) - saved, stage="db_commit")
+        with self._lock:
+            self.saved += saved
+            self.failed += len(records) - saved
+            self.batches += 1
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            self.last_flush_seconds = elapsed
+
+    def metrics(self) -> dict:
+        """Queue depth, throughput and flush latency counters."""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "saved": self.saved,
+                "failed": self.failed,
+                "batches": self.batches,
+                "avg_batch_size": (self.saved + self.failed) / self.batches if self.batches else 0.0,
+                "last_flush_ms": self.last_flush_seconds * 1000,
+                "avg_flush_ms": self.flush_seconds_total / self.batches * 1000 if self.batches else 0.0,
+                "max_flush_ms": self.flush_seconds_max * 1000,
+            }
+
+    def close(self, timeout: float = None):
+        """Flush accepted records and stop the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout)
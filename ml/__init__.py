@@ -0,0 +1 @@
+"""Local ML models for DreamDiary AI (requires requirements-ml.txt)."""
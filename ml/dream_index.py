@@ -0,0 +1,316 @@
+"""Similar-dream retrieval over dream texts with a local vector index.
+
+Embeddings are computed on CPU by feature hashing (word unigrams and
+character n-grams, so inflected Russian words still match), which needs
+nothing but numpy and no model download. Vectors are L2-normalized
+float32 rows, so a dot product is the cosine similarity.
+
+The index is an IVF (inverted file) index: once enough dreams are
+indexed, a spherical k-means quantizer splits the rows into lists and a
+query only scores the rows of the ``nprobe`` closest lists. Searches
+restricted to one user scan that user's rows exactly unless they are
+many, which is both faster and exact for typical diaries.
+
+Rows are appended to flat files (vectors.f32, ids.i64, owners.i64,
+lists.i32) that are memory-mapped on load, so startup does not read the
+vectors into memory. meta.json, written last, records how many rows are
+valid; a crash mid-append only loses the rows it was writing. A process
+holds an exclusive lock on the directory while the index is open, so a
+second process cannot write the same files.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no directory locking
+    fcntl = None
+
+META_FILE = "meta.json"
+LOCK_FILE = "lock"
+FORMAT_VERSION = 1
+_FILES = {"vectors": ("vectors.f32", np.float32), "ids": ("ids.i64", np.int64),
+          "owners": ("owners.i64", np.int64), "lists": ("lists.i32", np.int32)}
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class IndexLockedError(RuntimeError):
+    """Another process has the index directory open."""
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and character n-grams into ``dim`` floats."""
+
+    def __init__(self, dim: int = 512, ngram: int = 4):
+        self.dim = dim
+        self.ngram = ngram
+
+    @property
+    def name(self) -> str:
+        return f"hashing-{self.dim}-{self.ngram}"
+
+    def _features(self, text: str) -> Iterable[str]:
+        for token in _TOKEN_RE.findall(text.lower()):
+            yield "w" + token
+            if len(token) > self.ngram:
+                padded = f"<{token}>"
+                for i in range(len(padded) - self.ngram + 1):
+                    yield "c" + padded[i:i + self.ngram]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """One normalized float32 row per text; empty texts give a zero row."""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text or ""):
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        np.copysign(np.log1p(np.abs(vectors)), vectors, out=vectors)  # damp repeated words
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class DreamIndex:
+    """Append-only IVF index of dream vectors, keyed by dream id and owner (telegram id).
+
+    Thread-safe. Opening a directory another process holds raises
+    IndexLockedError.
+    """
+
+    def __init__(self, path: str, embedder: Optional[HashingEmbedder] = None, nprobe: int = 8,
+                 exact_below: int = 2048, train_at: int = 4096, max_lists: int = 256):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self.nprobe = nprobe
+        self.exact_below = exact_below
+        self.train_at = train_at
+        self.max_lists = max_lists
+        self.count = 0
+        self.synced_id = 0  # dreams up to this id have been read from the database
+        self.trained_count = 0
+        self.centroids: Optional[np.ndarray] = None
+        self._capacity = 0
+        self._arrays: Dict[str, np.memmap] = {}
+        self._positions: Dict[int, int] = {}
+        self._by_owner: Dict[int, List[int]] = {}
+        self._lists: Dict[int, List[int]] = {}
+        self._lock = threading.RLock()
+        self._last_sync: Optional[float] = None
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = self._acquire_lock()
+        self._load()
+
+    def _acquire_lock(self):
+        lock_file = open(self._file(LOCK_FILE), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                raise IndexLockedError(f"Dream index at {self.path} is open in another process")
+        return lock_file
+
+    def close(self):
+        """Release the directory for other processes."""
+        with self._lock:
+            self._arrays.clear()
+            self._lock_file.close()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        meta = {}
+        if os.path.exists(self._file(META_FILE)):
+            with open(self._file(META_FILE)) as f:
+                meta = json.load(f)
+        if meta and (meta.get("version") != FORMAT_VERSION or meta.get("embedder") != self.embedder.name):
+            logging.warning(f"Dream index at {self.path} was built with {meta.get('embedder')}; starting over")
+            meta = {}
+        self.count = meta.get("count", 0)
+        self.synced_id = meta.get("synced_id", 0)
+        self.trained_count = meta.get("trained_count", 0)
+        if not meta:
+            for filename, _ in _FILES.values():
+                if os.path.exists(self._file(filename)):
+                    os.remove(self._file(filename))
+        self._open(max(self.count, self._stored_capacity()))
+        if self.trained_count and os.path.exists(self._file("centroids.npy")):
+            self.centroids = np.load(self._file("centroids.npy"), mmap_mode="r")
+        ids, owners, lists = (self._arrays[name][:self.count] for name in ("ids", "owners", "lists"))
+        for row, (dream_id, owner, list_id) in enumerate(zip(ids.tolist(), owners.tolist(), lists.tolist())):
+            self._positions[dream_id] = row
+            self._by_owner.setdefault(owner, []).append(row)
+            self._lists.setdefault(list_id, []).append(row)
+        logging.info(f"Dream index loaded from {self.path}: {self.count} dreams, "
+                     f"{len(self._lists)} lists")
+
+    def _stored_capacity(self) -> int:
+        filename, dtype = _FILES["ids"]
+        if not os.path.exists(self._file(filename)):
+            return 0
+        return os.path.getsize(self._file(filename)) // np.dtype(dtype).itemsize
+
+    def _open(self, capacity: int):
+        """(Re)map every row file with room for ``capacity`` rows."""
+        capacity = max(capacity, 1024)
+        for name, (filename, dtype) in _FILES.items():
+            self._arrays.pop(name, None)
+            row_size = np.dtype(dtype).itemsize * (self.dim if name == "vectors" else 1)
+            with open(self._file(filename), "ab") as f:
+                if f.tell() < capacity * row_size:
+                    f.truncate(capacity * row_size)
+            shape = (capacity, self.dim) if name == "vectors" else (capacity,)
+            self._arrays[name] = np.memmap(self._file(filename), dtype=dtype, mode="r+", shape=shape)
+        self._capacity = capacity
+
+    def _write_meta(self):
+        meta = {"version": FORMAT_VERSION, "embedder": self.embedder.name, "count": self.count,
+                "synced_id": self.synced_id, "trained_count": self.trained_count}
+        tmp = self._file(META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file(META_FILE))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, dream_id: int) -> bool:
+        return dream_id in self._positions
+
+    def add(self, items: Iterable[Tuple[int, int, str]]) -> int:
+        """Index (dream_id, owner, text) triples; dreams already present are skipped."""
+        with self._lock:
+            seen = set()
+            fresh = []
+            for dream_id, owner, text in items:
+                if dream_id not in self._positions and dream_id not in seen:
+                    seen.add(dream_id)
+                    fresh.append((dream_id, owner, text))
+            if not fresh:
+                return 0
+            vectors = self.embedder.embed([text for _, _, text in fresh])
+            start, end = self.count, self.count + len(fresh)
+            if end > self._capacity:
+                self._open(max(end, self._capacity * 2))
+            lists = self._assign(vectors)
+            self._arrays["vectors"][start:end] = vectors
+            self._arrays["ids"][start:end] = [dream_id for dream_id, _, _ in fresh]
+            self._arrays["owners"][start:end] = [owner for _, owner, _ in fresh]
+            self._arrays["lists"][start:end] = lists
+            for array in self._arrays.values():
+                array.flush()
+            for row, ((dream_id, owner, _), list_id) in enumerate(zip(fresh, lists.tolist()), start):
+                self._positions[dream_id] = row
+                self._by_owner.setdefault(owner, []).append(row)
+                self._lists.setdefault(list_id, []).append(row)
+            self.count = end
+            if self.count >= self.train_at and self.count >= 4 * self.trained_count:
+                self._train()
+            self._write_meta()
+            return len(fresh)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _train(self, iterations: int = 10, sample_size: int = 50_000):
+        """Fit the quantizer on a sample of the rows and reassign every row to a list."""
+        started = time.perf_counter()
+        vectors = self._arrays["vectors"][:self.count]
+        nlist = min(self.max_lists, max(2, int(math.sqrt(self.count))))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(self.count, min(self.count, sample_size), replace=False))])
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assigned = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(nlist):
+                members = sample[assigned == list_id]
+                if len(members):
+                    center = members.sum(axis=0)
+                    centroids[list_id] = center / max(np.linalg.norm(center), 1e-12)
+        np.save(self._file("centroids.tmp.npy"), centroids)
+        os.replace(self._file("centroids.tmp.npy"), self._file("centroids.npy"))
+        self.centroids = np.load(self._file("centroids.npy"), mmap_mode="r")
+        self._lists = {}
+        for start in range(0, self.count, 65_536):
+            lists = self._assign(np.asarray(vectors[start:start + 65_536]))
+            self._arrays["lists"][start:start + len(lists)] = lists
+            for row, list_id in enumerate(lists.tolist(), start):
+                self._lists.setdefault(list_id, []).append(row)
+        self._arrays["lists"].flush()
+        self.trained_count = self.count
+        logging.info(f"Dream index trained: {nlist} lists over {self.count} dreams "
+                     f"in {time.perf_counter() - started:.2f}s")
+
+    def _candidates(self, query: np.ndarray, owner: Optional[int]) -> np.ndarray:
+        owned = self._by_owner.get(owner, []) if owner is not None else None
+        if owned is not None and (len(owned) <= self.exact_below or self.centroids is None):
+            return np.asarray(owned, dtype=np.int64)
+        if self.centroids is None or self.count <= self.exact_below:
+            return np.arange(self.count)
+        probed = np.argsort(-(np.asarray(self.centroids) @ query))[:self.nprobe]
+        rows = np.fromiter((row for list_id in probed.tolist() for row in self._lists.get(list_id, ())), dtype=np.int64)
+        if owner is not None:
+            rows = rows[self._arrays["owners"][rows] == owner]
+        return rows
+
+    def search(self, text: str, k: int = 3, owner: Optional[int] = None,
+               exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """(dream_id, cosine similarity) of the k nearest dreams, best first."""
+        query = self.embedder.embed([text])[0]
+        exclude = set(exclude)
+        with self._lock:
+            rows = self._candidates(query, owner)
+            if owner is not None and len(rows) < k + len(exclude) and len(rows) < len(self._by_owner.get(owner, ())):
+                rows = np.asarray(self._by_owner[owner], dtype=np.int64)  # probed lists missed this user's dreams
+            if not len(rows):
+                return []
+            scores = self._arrays["vectors"][rows] @ query
+            ids = self._arrays["ids"][rows]
+        wanted = min(len(rows), k + len(exclude))
+        top = np.argpartition(-scores, wanted - 1)[:wanted]
+        top = top[np.argsort(-scores[top])]
+        results = [(int(ids[i]), float(scores[i])) for i in top if int(ids[i]) not in exclude]
+        return results[:k]
+
+    def catch_up(self, batch_size: int = 1000, min_interval: float = 0.0, lag: int = 1000) -> int:
+        """Index dreams saved since the last sync, e.g. by other processes; returns how many were added.
+
+        Ids are assigned before commit, so a dream may become visible after
+        dreams with higher ids were read. Every sync therefore re-reads the
+        last ``lag`` ids below the high-water mark; rows already indexed
+        are skipped by add().
+        """
+        from db.repositories import DreamRepository
+
+        if self._last_sync is not None and time.monotonic() - self._last_sync < min_interval:
+            return 0
+        self._last_sync = time.monotonic()
+        added = 0
+        after = max(0, self.synced_id - lag)
+        while True:
+            rows = DreamRepository.texts_after(after, batch_size)
+            if not rows:
+                break
+            after = rows[-1][0]
+            with self._lock:
+                added += self.add(rows)
+                self.synced_id = max(self.synced_id, rows[-1][0])
+                self._write_meta()
+            if len(rows) < batch_size:
+                break
+        if added:
+            logging.info(f"Dream index caught up: {added} dreams added, {self.count} total")
+        return added
@@ -0,0 +1,171 @@
+"""Local multi-label emotion classifier over the agent's ten emotions.
+
+The model is produced by ml/train_emotions.py. Inference runs on CPU with
+onnxruntime when an exported model is present and falls back to torch
+otherwise; torch, transformers and onnxruntime are imported on first use.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from db.mappers import EMOTION_LABELS, INTENSITY_LEVELS
+
+META_FILE = "emotions_meta.json"
+ONNX_FILES = ("model.int8.onnx", "model.onnx")  # preferred first
+
+
+def to_level(probability: float, threshold: float) -> int:
+    """Intensity on the INTENSITY_LEVELS scale the other backends store.
+
+    Below threshold the emotion is absent (0); the range from threshold
+    to 1 is split evenly into low, moderate and high.
+    """
+    if probability < threshold:
+        return 0
+    top = max(INTENSITY_LEVELS.values())
+    share = (probability - threshold) / (1.0 - threshold) if threshold < 1.0 else 1.0
+    return min(top, 1 + int(share * top))
+
+
+def to_emotions(scores: Dict[str, float], threshold: float) -> List[Dict[str, Any]]:
+    """Labels scoring at least threshold, with their level, in the form DreamRecord stores."""
+    return [
+        {"emotion": label, "intensity": to_level(scores[label], threshold)}
+        for label in EMOTION_LABELS
+        if scores.get(label, 0.0) >= threshold
+    ]
+
+
+class EmotionClassifier:
+    """Sigmoid multi-label classifier loaded from a trained model directory."""
+
+    def __init__(self, model_dir: str, max_length: int = 512, prefer_onnx: bool = True):
+        self.model_dir = model_dir
+        self.max_length = max_length
+        with open(os.path.join(model_dir, META_FILE)) as f:
+            meta = json.load(f)
+        self.labels: Tuple[str, ...] = tuple(meta["labels"])
+        self.model_name: str = meta["name"]
+
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._session = None
+        self._model = None
+        onnx_path = next(
+            (os.path.join(model_dir, name) for name in ONNX_FILES
+             if os.path.exists(os.path.join(model_dir, name))),
+            None,
+        )
+        if prefer_onnx and onnx_path:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self._session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+            if onnx_path.endswith(".int8.onnx"):
+                self.model_name += "-int8"
+        else:
+            from transformers import AutoModelForSequenceClassification
+
+            self._model = AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+        logging.info(f"Emotion classifier {self.model_name} loaded from {model_dir}")
+
+    def predict(self, texts: Sequence[str]) -> List[Dict[str, float]]:
+        """Per-label probabilities for each text, in one forward pass."""
+        import numpy as np
+
+        if not texts:
+            return []
+        if self._session is not None:
+            encoded = self.tokenizer(
+                list(texts), padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            inputs = {i.name: encoded[i.name].astype(np.int64) for i in self._session.get_inputs()}
+            logits = self._session.run(None, inputs)[0]
+        else:
+            import torch
+
+            encoded = self.tokenizer(
+                list(texts), padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+            )
+            with torch.inference_mode():
+                logits = self._model(**encoded).logits.numpy()
+        probs = 1.0 / (1.0 + np.exp(-logits))
+        return [dict(zip(self.labels, map(float, row))) for row in probs]
+
+
+class MicroBatcher:
+    """Group concurrent classify() calls into batched predict() runs.
+
+    A batch is flushed when it reaches ``max_batch`` texts or ``linger``
+    seconds after its first text arrived; inference runs in a thread so
+    the event loop keeps serving updates.
+    """
+
+    def __init__(self, classifier: EmotionClassifier, max_batch: int = 16, linger: float = 0.01):
+        self.classifier = classifier
+        self.max_batch = max_batch
+        self.linger = linger
+        self.batches = 0
+        self.texts = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def model_name(self) -> str:
+        return self.classifier.model_name
+
+    def _ensure_started(self):
+        """Create the queue and the batching task on the running event loop."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.linger
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await asyncio.to_thread(self.classifier.predict, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), scores in zip(batch, results):
+                    if not future.done():
+                        future.set_result(scores)
+            self.batches += 1
+            self.texts += len(batch)
+
+    async def classify(self, text: str) -> Dict[str, float]:
+        """Probabilities for one text, batched with concurrent callers."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def classify_sync(self, text: str) -> Dict[str, float]:
+        """Unbatched prediction for callers outside the event loop."""
+        return self.classifier.predict([text])[0]
+
+    async def close(self):
+        """Stop the batching task; pending callers are cancelled."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._queue = None
+        self._task = None
@@ -0,0 +1,150 @@
+"""Train the local emotion classifier on stored dreams and classifications.
+
+Labels come from the classifications written by the Claude emotion
+extraction: an emotion is positive for a dream when its score is above 0.
+The fine-tuned model, tokenizer and emotions_meta.json are saved to
+--out; --onnx also exports model.onnx and a dynamically quantized int8
+model.int8.onnx for CPU inference.
+
+Usage:
+    python -m ml.train_emotions --out model/emotions --onnx
+"""
+
+import argparse
+import json
+import os
+import random
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select
+
+from config import Config
+from db.database import SessionLocal
+from db.mappers import EMOTION_LABELS
+from db.models import Classification, Dream
+from ml.emotion_classifier import META_FILE
+
+
+def load_examples(source_model: str) -> List[Tuple[str, List[float]]]:
+    """(dream text, multi-hot label vector) for every dream classified by source_model."""
+    positives: Dict[int, set] = defaultdict(set)
+    texts: Dict[int, str] = {}
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(Dream.id, Dream.text, Classification.scores)
+            .join(Classification, Classification.dream_id == Dream.id)
+            .where(Classification.model == source_model)
+            .execution_options(yield_per=1000)
+        )
+        for dream_id, text, scores in rows:
+            texts[dream_id] = text
+            positives[dream_id].update(label for label, score in (scores or {}).items() if score and score > 0)
+    return [
+        (texts[dream_id], [1.0 if label in positives[dream_id] else 0.0 for label in EMOTION_LABELS])
+        for dream_id in sorted(texts)
+    ]
+
+
+def train(examples, base_model: str, out_dir: str, epochs: int, batch_size: int, lr: float, max_length: int):
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        base_model,
+        num_labels=len(EMOTION_LABELS),
+        problem_type="multi_label_classification",
+        id2label=dict(enumerate(EMOTION_LABELS)),
+        label2id={label: i for i, label in enumerate(EMOTION_LABELS)},
+    )
+    optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+
+    random.Random(42).shuffle(examples)
+    split = max(1, len(examples) // 10)
+    valid, train_set = examples[:split], examples[split:]
+
+    def batches(items):
+        for i in range(0, len(items), batch_size):
+            chunk = items[i:i + batch_size]
+            encoded = tokenizer([t for t, _ in chunk], padding=True, truncation=True,
+                                max_length=max_length, return_tensors="pt")
+            yield encoded, torch.tensor([y for _, y in chunk])
+
+    for epoch in range(epochs):
+        model.train()
+        random.shuffle(train_set)
+        total = 0.0
+        for encoded, labels in batches(train_set):
+            loss = model(**encoded, labels=labels).loss
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            total += loss.item()
+        model.eval()
+        correct = count = 0
+        with torch.no_grad():
+            for encoded, labels in batches(valid):
+                predicted = (torch.sigmoid(model(**encoded).logits) >= 0.5).float()
+                correct += (predicted == labels).sum().item()
+                count += labels.numel()
+        print(f"epoch {epoch + 1}: train loss {total:.3f}, valid label accuracy {correct / max(1, count):.3f}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    model.save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+    name = f"{os.path.basename(base_model.rstrip('/'))}-emotions"
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump({"name": name, "labels": list(EMOTION_LABELS), "base_model": base_model,
+                   "examples": len(examples)}, f, indent=2)
+    return model, tokenizer
+
+
+def export_onnx(model, tokenizer, out_dir: str, quantize: bool = True):
+    """Export model.onnx and, optionally, an int8 dynamically quantized copy."""
+    import torch
+
+    model.eval()
+    sample = tokenizer(["a dream about the sea"], return_tensors="pt")
+    path = os.path.join(out_dir, "model.onnx")
+    names = [name for name in ("input_ids", "attention_mask") if name in sample]
+    dynamic = {"batch": 0, "sequence": 1}
+    torch.onnx.export(
+        model, tuple(sample[name] for name in names), path,
+        input_names=names, output_names=["logits"],
+        dynamic_axes={**{name: dynamic for name in names}, "logits": {0: "batch"}},
+        opset_version=17,
+    )
+    print(f"Exported {path}")
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized = os.path.join(out_dir, "model.int8.onnx")
+        quantize_dynamic(path, quantized, weight_type=QuantType.QInt8)
+        print(f"Quantized {quantized}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=Config.EMOTION_MODEL_DIR)
+    parser.add_argument("--base-model", default=Config.EMOTION_BASE_MODEL)
+    parser.add_argument("--source-model", default="claude-emotions", help="classifications.model used as labels")
+    parser.add_argument("--epochs", type=int, default=Config.EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=Config.BATCH_SIZE)
+    parser.add_argument("--lr", type=float, default=Config.LEARNING_RATE)
+    parser.add_argument("--max-length", type=int, default=Config.MAX_SEQ_LEN)
+    parser.add_argument("--onnx", action="store_true", help="export ONNX and int8 models")
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    examples = load_examples(args.source_model)
+    if len(examples) < 10:
+        raise SystemExit(f"Only {len(examples)} labelled dreams found; need at least 10 to train")
+    print(f"Training on {len(examples)} dreams labelled by {args.source_model}")
+    model, tokenizer = train(examples, args.base_model, args.out, args.epochs, args.batch_size, args.lr, args.max_length)
+    if args.onnx:
+        export_onnx(model, tokenizer, args.out, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
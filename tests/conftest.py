@@ -0,0 +1,28 @@
+"""Shared fixtures: the repository root on sys.path and a scratch SQLite database."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Fresh SQLite database bound to SessionLocal for one test."""
+    from db import database
+    from db.models import Base
+    from db.repositories import user_ids
+
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'test.sqlite'}")
+    Base.metadata.create_all(engine)
+    previous = database._engine
+    database._engine = engine
+    database.SessionLocal.configure(bind=engine)
+    user_ids.clear()
+    yield engine
+    database._engine = previous
+    database.SessionLocal.configure(bind=previous)
+    user_ids.clear()
+    engine.dispose()
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from bot import admission
+from bot.admission import DedupCache, Debouncer, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the admission module."""
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket(capacity=2, refill_per_second=0.5)
+    assert bucket.allow(1) and bucket.allow(1)
+    assert not bucket.allow(1)
+    assert bucket.allow(2)  # buckets are per user
+    assert bucket.retry_after(1) == pytest.approx(2.0)
+    clock[0] += 2.0
+    assert bucket.allow(1)
+    assert not bucket.allow(1)
+
+
+def test_token_bucket_forgets_the_least_recent_user(clock):
+    bucket = TokenBucket(capacity=1, refill_per_second=0.01, max_users=2)
+    for user_id in (1, 2, 3):
+        assert bucket.allow(user_id)
+    assert bucket.allow(1)  # evicted, so it starts with a full bucket again
+    assert not bucket.allow(3)
+
+
+def test_debouncer_joins_messages_sent_in_quick_succession():
+    debouncer = Debouncer(delay=0.05)
+
+    async def main():
+        first = asyncio.ensure_future(debouncer.submit(1, "I was in a house"))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(debouncer.submit(1, "and it was flooding"))
+        other = asyncio.ensure_future(debouncer.submit(2, "another user"))
+        return await asyncio.gather(first, second, other)
+
+    assert asyncio.run(main()) == [None, "I was in a house\nand it was flooding", "another user"]
+
+
+def test_debouncer_without_delay_and_over_the_size_limit_passes_through():
+    async def main():
+        immediate = await Debouncer(delay=0).submit(1, "dream")
+        long = await Debouncer(delay=10, max_chars=5).submit(1, "a long dream")
+        return immediate, long
+
+    assert asyncio.run(main()) == ("dream", "a long dream")
+
+
+def test_dedup_shares_the_owners_result_within_the_window(clock):
+    cache = DedupCache(window=60)
+
+    async def main():
+        future, owner = cache.claim(1, "Flying  over the SEA")
+        again, second_owner = cache.claim(1, "flying over the sea")
+        assert owner and not second_owner and again is future
+        assert cache.claim(2, "flying over the sea")[1]  # other users analyze their own
+        cache.resolve(1, "flying over the sea", future, "analysis")
+        assert await again == "analysis"
+        clock[0] += 61
+        assert cache.claim(1, "flying over the sea")[1]
+
+    asyncio.run(main())
+    assert cache.hits == 1
+
+
+def test_dedup_does_not_keep_failures(clock):
+    cache = DedupCache(window=60)
+
+    async def main():
+        future, _ = cache.claim(1, "dream")
+        waiter, _ = cache.claim(1, "dream")
+        cache.resolve(1, "dream", future, None)
+        assert await waiter is None
+        assert cache.claim(1, "dream")[1]
+
+    asyncio.run(main())
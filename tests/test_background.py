@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+
+from agent.background import BackgroundQueue
+
+request = contextvars.ContextVar("request", default=None)
+
+
+def test_waiting_on_a_result_does_not_hold_a_worker():
+    queue = BackgroundQueue(workers=1)
+    done = []
+
+    async def main():
+        pending = asyncio.get_running_loop().create_future()
+
+        async def first():
+            queue.after(pending, lambda: asyncio.sleep(0, done.append("saved")))
+
+        async def second():
+            done.append("second")
+
+        await queue.submit(first)
+        await queue.submit(second)
+        await asyncio.sleep(0.01)
+        assert done == ["second"]  # the only worker was free while the result was pending
+        pending.set_result("analysis")
+        await queue.close()
+
+    asyncio.run(main())
+    assert done == ["second", "saved"]
+
+
+def test_cancelled_result_skips_the_deferred_job():
+    queue = BackgroundQueue(workers=1)
+    done = []
+
+    async def main():
+        pending = asyncio.get_running_loop().create_future()
+        queue.after(pending, lambda: asyncio.sleep(0, done.append("saved")))
+        pending.cancel()
+        await queue.close()
+
+    asyncio.run(main())
+    assert done == []
+
+
+def test_workers_do_not_inherit_the_first_submitters_context():
+    queue = BackgroundQueue(workers=1)
+    seen = []
+
+    async def job():
+        seen.append(request.get())
+
+    async def main():
+        request.set("update 1")
+        await queue.submit(job)
+        await queue.close()
+
+    asyncio.run(main())
+    assert seen == [None]
+
+
+def test_failed_emotion_extraction_skips_the_save(db):
+    from agent.dream_agent import DreamDiaryAgent
+
+    agent = DreamDiaryAgent(anthropic_api_key="fake")
+    saved = []
+
+    async def broken(dream_text):
+        raise ValueError("unexpected model output")
+
+    agent._aextract_emotions = broken
+    agent.writer.submit = saved.append
+
+    async def main():
+        analysis = asyncio.get_running_loop().create_future()
+        analysis.set_result("analysis")
+        await agent._aextract_and_save("a dream", analysis, user_id=42)
+        await agent.aclose()
+
+    asyncio.run(main())
+    assert saved == []
@@ -0,0 +1,72 @@
+import time
+
+from langchain_core.messages import AIMessage
+
+from agent.cache import DatabaseCacheBackend, MemoryCacheBackend, ResponseCache, normalize_input
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        return AIMessage(content=f"answer {self.calls}")
+
+
+class Broken:
+    def get(self, key):
+        raise RuntimeError("database is down")
+
+    def set(self, key, value):
+        raise RuntimeError("database is down")
+
+
+def test_inputs_differing_in_case_and_whitespace_share_an_entry():
+    from agent.dream_agent import DreamDiaryAgent
+
+    assert normalize_input("  Falling\tOFF a\n cliff ") == "falling off a cliff"
+    agent = DreamDiaryAgent(anthropic_api_key="fake")
+    model = CountingModel()
+    agent.llm = model
+    agent.response_cache = ResponseCache(MemoryCacheBackend())
+    try:
+        assert agent.explain_symbol("Snake") == "answer 1"
+        assert agent.explain_symbol("  snake ") == "answer 1"
+        assert agent.explain_symbol("snakes") == "answer 2"
+        assert agent.analyze_emotions("snake") == {"emotions": "answer 3"}  # prompts are part of the key
+        assert model.calls == 3
+        assert agent.response_cache.stats()["hits"] == 1
+    finally:
+        agent.close()
+
+
+def test_memory_entries_expire_and_evict_least_recently_used():
+    memory = MemoryCacheBackend(max_entries=2, ttl=0.05)
+    memory.set("a", "1")
+    memory.set("b", "2")
+    assert memory.get("a") == "1"
+    memory.set("c", "3")
+    assert memory.get("b") is None and len(memory) == 2
+    time.sleep(0.1)
+    assert memory.get("a") is None and memory.get("c") is None
+
+
+def test_persistent_hits_are_promoted_and_expired_rows_ignored(db):
+    cache = ResponseCache(MemoryCacheBackend(), DatabaseCacheBackend(ttl=60))
+    cache.set("key", "value")
+
+    fresh = ResponseCache(MemoryCacheBackend(), DatabaseCacheBackend(ttl=60))
+    assert fresh.get("key") == "value"
+    assert fresh.memory.get("key") == "value"
+
+    DatabaseCacheBackend(ttl=-1).set("stale", "value")
+    assert fresh.get("stale") is None
+    assert fresh.stats()["hits"] == 1 and fresh.stats()["misses"] == 1
+
+
+def test_persistent_failures_degrade_to_a_miss():
+    cache = ResponseCache(MemoryCacheBackend(), Broken())
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert cache.get("other") is None
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = (
+    "import sys\n"
+    "import bot.bot_handler\n"
+    "bot.bot_handler.TelegramBotHandler()\n"
+    "print(sorted(name for name in ('langchain_anthropic', 'langchain_core', 'torch', 'numpy') if name in sys.modules))\n"
+)
+
+
+def test_building_the_bot_loads_no_llm_or_ml_stack():
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN="123456:test", DATABASE_URL="sqlite:///:memory:")
+    proc = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert proc.stdout.strip().splitlines()[-1] == "[]"
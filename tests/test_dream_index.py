@@ -0,0 +1,123 @@
+import os
+import random
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from config import Config
+from ml.dream_index import DreamIndex, HashingEmbedder, IndexLockedError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = ("sea flying house mother school exam teeth falling forest wolf train late door key snow fire "
+         "river bridge dog cat mirror stairs church garden storm night voice child ship island").split()
+
+
+def _texts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(4, 12))) for _ in range(count)]
+
+
+@pytest.fixture
+def index(tmp_path):
+    opened = []
+
+    def open_index(**kwargs):
+        kwargs.setdefault("embedder", HashingEmbedder(dim=128))
+        opened.append(DreamIndex(str(tmp_path / "index"), **kwargs))
+        return opened[-1]
+
+    yield open_index
+    for idx in opened:
+        idx.close()
+
+
+def test_ivf_search_recall_against_brute_force(index):
+    texts = _texts(3000)
+    idx = index(train_at=1000, exact_below=0, nprobe=8)
+    idx.add((n + 1, n % 50, text) for n, text in enumerate(texts))
+    assert idx.centroids is not None and len(set(idx._arrays["lists"][:len(texts)].tolist())) > 1
+
+    vectors = idx.embedder.embed(texts)
+    hits = 0
+    for query in _texts(50, seed=1):
+        exact = np.argsort(-(vectors @ idx.embedder.embed([query])[0]))[:10] + 1
+        found = [dream_id for dream_id, _ in idx.search(query, k=10)]
+        hits += len(set(found) & set(exact.tolist()))
+    assert hits / 500 >= 0.8
+
+    owned = idx.search(texts[7], k=5, owner=7)
+    assert owned[0] == (8, pytest.approx(1.0)) and all((dream_id - 1) % 50 == 7 for dream_id, _ in owned)
+    assert 8 not in [dream_id for dream_id, _ in idx.search(texts[7], k=5, owner=7, exclude=[8])]
+
+
+def test_reopens_after_growing_past_capacity(index):
+    texts = _texts(2500)
+    idx = index(train_at=2000)
+    for start in range(0, len(texts), 700):
+        idx.add((n + 1, 1, texts[n]) for n in range(start, min(start + 700, len(texts))))
+    assert idx.add([(1, 1, "already indexed")]) == 0
+    before, trained = idx.search(texts[100], k=3), idx.trained_count
+    idx.close()
+
+    reopened = index(train_at=2000)
+    assert len(reopened) == 2500 and reopened.trained_count == trained >= 2000 and reopened.centroids is not None
+    assert reopened.search(texts[100], k=3) == before
+
+
+def test_rebuilds_when_the_embedder_changes(index):
+    idx = index()
+    idx.add([(1, 1, "a dream")])
+    idx.close()
+    assert len(index(embedder=HashingEmbedder(dim=64))) == 0
+
+
+HOLD = (
+    "import sys\n"
+    "from ml.dream_index import DreamIndex, HashingEmbedder\n"
+    "index = DreamIndex(sys.argv[1], HashingEmbedder(dim=64))\n"
+    "print('ready', flush=True)\n"
+    "sys.stdin.read()\n"
+)
+
+
+def test_second_process_falls_back_to_the_next_directory(tmp_path, monkeypatch):
+    from agent.dream_agent import DreamDiaryAgent
+
+    path = str(tmp_path / "index")
+    holder = subprocess.Popen([sys.executable, "-c", HOLD, path], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                              text=True, cwd=ROOT)
+    try:
+        assert holder.stdout.readline().strip() == "ready"
+        with pytest.raises(IndexLockedError):
+            DreamIndex(path, HashingEmbedder(dim=64))
+        monkeypatch.setattr(Config, "SIMILAR_INDEX_DIR", path)
+        monkeypatch.setattr(Config, "SIMILAR_DIM", 64)
+        fallback = DreamDiaryAgent._open_dream_index(slots=3)
+        assert fallback.path == path + "-1"
+        fallback.close()
+    finally:
+        holder.communicate("")
+    DreamIndex(path, HashingEmbedder(dim=64)).close()  # released when the holder exits
+
+
+def test_catch_up_indexes_dreams_committed_late(db, index):
+    from db.database import SessionLocal
+    from db.models import Dream
+    from db.repositories import DreamRepository, UserRepository
+
+    user_id = UserRepository.get_id(42)
+    ids = [DreamRepository.create(user_id, f"dream about the {word}").id for word in ("sea", "forest", "train")]
+    with SessionLocal() as session:
+        late = session.get(Dream, ids[1])
+        session.delete(late)
+        session.commit()  # as if its transaction had not committed yet
+
+    idx = index()
+    assert idx.catch_up() == 2 and idx.synced_id == ids[2]
+    with SessionLocal() as session:
+        session.add(Dream(id=ids[1], user_id=user_id, text="dream about the forest"))
+        session.commit()
+    assert idx.catch_up() == 1
+    assert idx.search("forest", k=1, owner=42)[0][0] == ids[1]
@@ -0,0 +1,54 @@
+from sqlalchemy import func, select
+
+from db import database
+from db.database import SessionLocal
+from db.models import Base, ChatHistory, Classification, Dream, EmotionDaily, User
+from db.repositories import DreamRecord, DreamUnitOfWork
+from db.scripts import dump
+
+
+def _counts():
+    with SessionLocal() as session:
+        return {model.__tablename__: session.scalar(select(func.count()).select_from(model))
+                for model in (User, Dream, Classification, ChatHistory, EmotionDaily)}
+
+
+def _rows():
+    with SessionLocal() as session:
+        dreams = session.execute(select(Dream.id, Dream.user_id, Dream.text, Dream.raw_analysis)).all()
+        rollups = session.execute(select(EmotionDaily.emotion, EmotionDaily.dreams, EmotionDaily.intensity_sum)).all()
+    return dreams, sorted(rollups)
+
+
+def test_jsonl_round_trip(db, tmp_path):
+    DreamUnitOfWork.save_batch([
+        DreamRecord(10, "first", "analysis", [{"emotion": "joy", "intensity": 3}]),
+        DreamRecord(20, "second", "analysis", [{"emotion": "fear", "intensity": 2}]),
+    ])
+    counts, rows = _counts(), _rows()
+    assert dump.export(str(tmp_path / "dump")) == {
+        "users": 2, "dreams": 2, "classifications": 2, "chat_history": 2,
+    }
+
+    restored = database.create_db_engine(f"sqlite:///{tmp_path / 'restored.sqlite'}")
+    Base.metadata.create_all(restored)
+    database._engine = restored  # the db fixture puts the original engine back
+    database.SessionLocal.configure(bind=restored)
+    try:
+        dump.import_dump(str(tmp_path / "dump"))
+        assert _counts() == counts and _rows() == rows
+        new_id = DreamUnitOfWork.save(30, "after restore", "analysis").dream_id
+        assert new_id > max(dream_id for dream_id, *_ in rows[0])  # sequences moved past the imported ids
+    finally:
+        restored.dispose()
+
+
+def test_export_of_one_user(db, tmp_path):
+    DreamUnitOfWork.save_batch([
+        DreamRecord(10, "first", "analysis", [{"emotion": "joy", "intensity": 3}]),
+        DreamRecord(20, "second", "analysis", [{"emotion": "fear", "intensity": 2}]),
+    ])
+    counts = dump.export(str(tmp_path / "user"), telegram_id=20)
+    assert counts == {"users": 1, "dreams": 1, "classifications": 1, "chat_history": 1}
+    with open(tmp_path / "user" / "dreams.jsonl") as f:
+        assert '"second"' in f.read()
@@ -0,0 +1,11 @@
+from ml.emotion_classifier import to_emotions, to_level
+
+
+def test_probabilities_map_onto_intensity_levels():
+    assert [to_level(p, 0.5) for p in (0.0, 0.49, 0.5, 0.66, 0.67, 0.83, 0.84, 1.0)] == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert to_level(1.0, 1.0) == 3
+
+
+def test_to_emotions_keeps_labels_above_threshold_as_levels():
+    scores = {"joy": 0.95, "fear": 0.7, "anger": 0.2}
+    assert to_emotions(scores, 0.5) == [{"emotion": "joy", "intensity": 3}, {"emotion": "fear", "intensity": 2}]
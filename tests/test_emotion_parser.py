@@ -0,0 +1,26 @@
+import pytest
+
+from benchmarks.emotion_parser import fuzz
+from db.mappers import EMOTION_LABELS, EmotionMapper
+
+
+def _vector(**levels):
+    return tuple(levels.get(label, 0) for label in EMOTION_LABELS)
+
+
+@pytest.mark.parametrize("seed", [7, 11])
+def test_fuzz_recovers_every_format_and_survives_junk(seed):
+    assert fuzz(2000, seed) == 0
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("[joy:1 (high), fear:0 (none)]", _vector(joy=3)),
+    ('{"fear": "moderate", "joy": 0}', _vector(fear=2)),
+    ("- **Sadness** - 1 (low)\n- **Anger**: 2", _vector(sadness=1, anger=2)),
+    ("joy: 2.6, joy: 1", _vector(joy=3)),
+    ("I enjoy: 1 thing", None),
+    ("overjoyed: 3, fearless = 2", None),
+    ("no emotions here", None),
+])
+def test_parse_vector(text, expected):
+    assert EmotionMapper.parse_vector(text) == expected
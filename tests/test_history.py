@@ -0,0 +1,54 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.history import HistoryManager, estimate_tokens
+from agent.sessions import ConversationSession
+
+
+def _session(manager: HistoryManager, turns: int, length: int = 40) -> ConversationSession:
+    session = ConversationSession()
+    for n in range(turns):
+        message, response = f"dream {n} " + "x" * length, f"analysis {n} " + "y" * length
+        session.messages += [HumanMessage(content=message), AIMessage(content=response)]
+        manager.record_turn(session, message, response)
+    return session
+
+
+def test_fold_keeps_the_newest_turns_within_budget():
+    manager = HistoryManager(token_budget=60, summary_budget=10_000, max_messages=20)
+    session = _session(manager, turns=5)
+    manager.fold(session)
+    assert sum(estimate_tokens(m.content) for m in session.messages) <= manager.token_budget
+    assert session.messages[-1].content.startswith("analysis 4")
+    kept = len(session.messages) // 2
+    assert len(session.summary_lines) == 5 - kept
+    assert session.summary_lines[0].startswith("- Dream: dream 0")
+
+
+def test_fold_caps_message_count_and_never_drops_the_last_turn():
+    manager = HistoryManager(token_budget=10, max_messages=4)
+    session = _session(manager, turns=3, length=400)
+    manager.fold(session)
+    assert [m.content.split()[:2] for m in session.messages] == [["dream", "2"], ["analysis", "2"]]
+
+
+def test_summary_uses_the_interpretation_and_drops_oldest_lines():
+    manager = HistoryManager(token_budget=10, summary_budget=15)
+    session = ConversationSession()
+    for n in range(4):
+        response = f"**Key Elements**\nstuff\n\n**Psychological Interpretation**\ninsight {n}\n\nmore"
+        session.messages += [HumanMessage(content=f"dream {n}"), AIMessage(content=response)]
+    manager.fold(session)
+    assert session.summary_lines == ["- Dream: dream 2 | Insight: insight 2"]
+
+
+def test_build_reports_tokens_saved_against_the_verbatim_window():
+    manager = HistoryManager(token_budget=300, max_messages=20)
+    session = _session(manager, turns=5, length=400)
+    full = sum(session.turn_tokens)
+    manager.fold(session)
+    window = manager.build(session)
+    assert window.messages == session.messages and window.messages is not session.messages
+    assert window.summary == "\n".join(session.summary_lines)
+    assert window.tokens_used == (sum(estimate_tokens(m.content) for m in session.messages)
+                                  + estimate_tokens(window.summary))
+    assert window.tokens_saved == full - window.tokens_used > 0
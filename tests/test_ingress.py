@@ -0,0 +1,62 @@
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from bot.ingress import MAX_BODY_BYTES, WebhookHandler
+from config import Config
+from db.update_queue import UpdateQueue
+
+
+@pytest.fixture
+def post(db, monkeypatch):
+    monkeypatch.setattr(Config, "WEBHOOK_SECRET", "s3cret")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def post(body: bytes, secret: str = "s3cret", headers: dict = None) -> int:
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        try:
+            conn.putrequest("POST", "/")
+            for name, value in {"X-Telegram-Bot-Api-Secret-Token": secret, "Content-Length": str(len(body)),
+                                **(headers or {})}.items():
+                conn.putheader(name, value)
+            conn.endheaders()
+            conn.send(body)
+            return conn.getresponse().status
+        finally:
+            conn.close()
+
+    yield post
+    server.shutdown()
+    server.server_close()
+
+
+def _update(update_id: int) -> bytes:
+    return json.dumps({"update_id": update_id, "message": {
+        "message_id": 1, "date": 0, "text": "a dream", "chat": {"id": 10, "type": "private"},
+        "from": {"id": 10, "is_bot": False, "first_name": "Test"},
+    }}).encode()
+
+
+def test_queues_each_update_once(post):
+    assert post(_update(1)) == 200
+    assert post(_update(1)) == 200  # Telegram's redelivery is acknowledged but not queued again
+    assert UpdateQueue.depth() == 1
+
+
+def test_rejects_wrong_or_unconfigured_secret(post, monkeypatch):
+    assert post(_update(1), secret="guess") == 403
+    monkeypatch.setattr(Config, "WEBHOOK_SECRET", "")
+    assert post(_update(1), secret="") == 403
+    assert UpdateQueue.depth() == 0
+
+
+def test_rejects_oversized_and_malformed_bodies(post):
+    assert post(b"", headers={"Content-Length": str(MAX_BODY_BYTES + 1)}) == 413
+    assert post(b"", headers={"Content-Length": "lots"}) == 400
+    assert post(b"not json") == 400
+    assert post(b'{"message": {}}') == 400
+    assert UpdateQueue.depth() == 0
@@ -0,0 +1,45 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.dream_agent import DreamDiaryAgent
+from agent.history import HistoryWindow
+from benchmarks.fake_chat_model import FakeChatModel
+
+
+def _window(turns: int) -> HistoryWindow:
+    messages = []
+    for n in range(turns):
+        messages += [HumanMessage(content=f"dream {n} " + "x" * 2000), AIMessage(content="analysis " + "y" * 2000)]
+    return HistoryWindow(messages=messages, summary="", tokens_used=0, tokens_saved=0)
+
+
+def _breakpoints(messages):
+    return [
+        index for index, message in enumerate(messages) if isinstance(message.content, list)
+        for block in message.content if isinstance(block, dict) and "cache_control" in block
+    ]
+
+
+def test_breakpoint_only_once_the_prefix_can_be_cached():
+    agent = DreamDiaryAgent(anthropic_api_key="fake")
+    try:
+        assert _breakpoints(agent._build_dream_messages("a dream", _window(1))) == []
+        messages = agent._build_dream_messages("a dream", _window(3))
+        assert _breakpoints(messages) == [len(messages) - 2]  # the last history message
+    finally:
+        agent.close()
+
+
+def test_fake_model_writes_then_reads_only_cacheable_prefixes():
+    agent = DreamDiaryAgent(anthropic_api_key="fake")
+    model = FakeChatModel(ttft_median=0.0, tokens_per_second=1e9, seed=1)
+    try:
+        short = agent._build_dream_messages("a dream", _window(1))
+        details = [model.invoke(short).usage_metadata["input_token_details"] for _ in range(2)]
+        assert details == [{"cache_read": 0, "cache_creation": 0}] * 2
+
+        long = agent._build_dream_messages("a dream", _window(3))
+        first, second = (model.invoke(long).usage_metadata["input_token_details"] for _ in range(2))
+        assert first["cache_read"] == 0 and first["cache_creation"] >= DreamDiaryAgent.MIN_CACHEABLE_TOKENS
+        assert second == {"cache_read": first["cache_creation"], "cache_creation": 0}
+    finally:
+        agent.close()
@@ -0,0 +1,52 @@
+import asyncio
+
+from sqlalchemy import select
+
+from db.database import SessionLocal
+from db.models import Classification, Dream, EmotionDaily
+from db.repositories import ClassificationRepository, DreamRepository, UserRepository
+from db.scripts import reanalyze
+
+
+class StubAgent:
+    """aclassify_dream stand-in: the local model finds fear in every dream but the broken one."""
+
+    async def aclassify_dream(self, dream_text, reanalyze=False):
+        if dream_text == "broken":
+            raise RuntimeError("classifier failed")
+        return [{"emotion": "fear", "intensity": 2}], "local-emotions", "New analysis" if reanalyze else None
+
+
+def _rollups():
+    with SessionLocal() as session:
+        return {(row.emotion, row.dreams, row.intensity_sum) for row in session.scalars(select(EmotionDaily))}
+
+
+def test_reclassifying_replaces_the_rows_of_every_model(db):
+    user_id = UserRepository.get_id(42)
+    dream = DreamRepository.create(user_id, "a dark forest")
+    broken = DreamRepository.create(user_id, "broken")
+    ClassificationRepository.create_many(dream.id, "claude-emotions", [{"emotion": "joy", "intensity": 3}])
+    ClassificationRepository.create_many(broken.id, "claude-emotions", [{"emotion": "joy", "intensity": 1}])
+
+    dreams = reanalyze._read_chunk(0, 10)
+    results = asyncio.run(reanalyze._process_chunk(StubAgent(), dreams, concurrency=2, reanalyze=True))
+    assert list(results) == [dream.id]
+    assert reanalyze._write_chunk(results) == 1
+    assert reanalyze._write_chunk(results) == 0  # already written, e.g. by another run
+
+    with SessionLocal() as session:
+        rows = session.execute(select(Classification.dream_id, Classification.model)).all()
+        stored = session.get(Dream, dream.id)
+        assert stored.processed and stored.raw_analysis == {"content": "New analysis"}
+        assert not session.get(Dream, broken.id).processed
+    assert sorted(rows) == [(dream.id, "local-emotions"), (broken.id, "claude-emotions")]
+    assert _rollups() == {("fear", 1, 2.0), ("joy", 1, 1.0)}
+
+
+def test_shards_split_the_dreams(db):
+    user_id = UserRepository.get_id(42)
+    ids = [DreamRepository.create(user_id, f"dream {n}").id for n in range(6)]
+    shards = [[dream_id for dream_id, _ in reanalyze._read_chunk(0, 10, (index, 3))] for index in range(3)]
+    assert sorted(sum(shards, [])) == ids
+    assert all(len(shard) == 2 for shard in shards)
@@ -0,0 +1,245 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.resilience import CircuitBreaker, LLMUnavailableError, ResilientCaller
+
+
+class Overloaded(Exception):
+    status_code = 529
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class ScriptedModel:
+    """Chat model stand-in that raises or answers from a script, one entry per call."""
+
+    def __init__(self, *outcomes, delay: float = 0.0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def invoke(self, messages):
+        return self._next()
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.delay)
+        return self._next()
+
+    async def astream(self, messages):
+        await asyncio.sleep(self.delay)
+        first = self._next()
+        for part in (first, "b", "c"):
+            yield part
+
+
+def _caller(threshold=2, cooldown=0.05, **kwargs):
+    kwargs.setdefault("backoff_base", 0.0)
+    return ResilientCaller(breaker=CircuitBreaker(threshold, cooldown), **kwargs)
+
+
+def _open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.failure()
+    assert breaker.state == "open"
+
+
+def test_breaker_opens_then_probes_once_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    assert breaker.state == "closed" and breaker.allow()
+    _open(breaker)
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_retries_retryable_errors_then_succeeds():
+    caller = _caller(threshold=5, max_retries=3)
+    model = ScriptedModel(Overloaded(), Overloaded(), "answer")
+    assert caller.invoke(model, []) == "answer"
+    assert model.calls == 3 and caller.retries == 2
+    assert caller.breaker.failures == 0
+
+
+def test_bad_request_is_not_retried_and_does_not_open_the_breaker():
+    caller = _caller(threshold=1, max_retries=3)
+    model = ScriptedModel(BadRequest())
+    with pytest.raises(BadRequest):
+        caller.invoke(model, [])
+    assert model.calls == 1 and caller.breaker.state == "closed"
+
+
+def test_open_breaker_fails_fast_or_serves_fallback():
+    caller = _caller(threshold=1, cooldown=60, max_retries=0)
+    model = ScriptedModel(Overloaded())
+    with pytest.raises(LLMUnavailableError):
+        caller.invoke(model, [])
+    assert caller.invoke(model, [], fallback=lambda: "fallback") == "fallback"
+    assert model.calls == 1 and caller.fallbacks == 1
+
+
+def test_deadline_counts_as_a_retryable_failure():
+    caller = _caller(threshold=5, max_retries=1, timeout=0.01)
+    model = ScriptedModel(delay=0.5)
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(caller.ainvoke(model, []))
+    assert model.calls == 0 and caller.breaker.failures == 2
+
+
+def test_hedged_request_wins_over_a_slow_one():
+    caller = _caller(hedge_after=0.01)
+
+    class SlowFirst(ScriptedModel):
+        async def ainvoke(self, messages):
+            self.calls += 1
+            await asyncio.sleep(1.0 if self.calls == 1 else 0.0)
+            return f"answer {self.calls}"
+
+    started = time.monotonic()
+    assert asyncio.run(caller.ainvoke(SlowFirst(), [])) == "answer 2"
+    assert caller.hedges == 1 and time.monotonic() - started < 0.5
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    caller = _caller(threshold=1, cooldown=0.01)
+    _open(caller.breaker)
+    time.sleep(0.02)
+
+    async def main():
+        task = asyncio.ensure_future(caller.ainvoke(ScriptedModel(delay=10), []))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await caller.ainvoke(ScriptedModel(), [])
+
+    assert asyncio.run(main()) == "ok"
+    assert caller.breaker.state == "closed"
+
+
+def test_stream_closed_early_by_the_consumer_releases_the_probe():
+    caller = _caller(threshold=1, cooldown=0.01)
+    _open(caller.breaker)
+    time.sleep(0.02)
+
+    async def main():
+        stream = caller.astream(ScriptedModel(), [])
+        assert await stream.__anext__() == "ok"
+        await stream.aclose()  # e.g. the Telegram edit failed
+        return [chunk async for chunk in caller.astream(ScriptedModel(), [])]
+
+    assert asyncio.run(main()) == ["ok", "b", "c"]
+    assert caller.breaker.state == "closed"
+
+
+def test_against_the_fake_anthropic_server():
+    from langchain_anthropic import ChatAnthropic
+    from langchain_core.messages import HumanMessage
+
+    from benchmarks.fake_anthropic_server import FakeAnthropicHandler, REPLY, serve
+
+    server = serve(port=0, latency=0.0, fail_rate=1.0, fail_statuses=(529,))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        llm = ChatAnthropic(
+            model="claude-3-haiku-20240307", anthropic_api_key="fake", max_retries=0,
+            base_url=f"http://127.0.0.1:{server.server_address[1]}",
+        )
+        caller = _caller(threshold=2, cooldown=0.2, max_retries=3)
+        with pytest.raises(LLMUnavailableError):
+            caller.invoke(llm, [HumanMessage(content="dream")])
+        assert caller.breaker.state == "open"
+
+        FakeAnthropicHandler.fail_rate = 0.0
+        time.sleep(0.25)
+        assert caller.invoke(llm, [HumanMessage(content="dream")]).content == REPLY
+        assert caller.breaker.state == "closed"
+    finally:
+        server.shutdown()
+        server.server_close()
+        FakeAnthropicHandler.fail_rate = 0.0
+
+
+def test_agent_serves_the_earlier_analysis_of_the_same_dream_while_unavailable(db):
+    from agent.dream_agent import DreamDiaryAgent
+    from db.repositories import DreamRepository, UserRepository
+
+    DreamRepository.create(UserRepository.get_id(42), "flying over the sea", analysis="Earlier analysis")
+    agent = DreamDiaryAgent(anthropic_api_key="fake")
+    agent.llm = ScriptedModel(*[Overloaded()] * 4)
+    agent.resilience = _caller(threshold=1, cooldown=60, max_retries=0)
+    try:
+        reply = agent.process_dream("flying over the sea", user_id=42)
+        assert reply == agent.CACHED_FALLBACK_PREFIX + "Earlier analysis"
+        assert agent.process_dream("a new dream", user_id=42) == agent.FALLBACK_REPLY
+    finally:
+        agent.close()
+
+
+def test_fallback_reply_is_not_deduplicated(db, monkeypatch):
+    from types import SimpleNamespace
+
+    from langchain_core.messages import AIMessage
+
+    from bot.bot_handler import TelegramBotHandler
+    from config import Config
+
+    monkeypatch.setattr(Config, "TELEGRAM_TOKEN", "123456:test")
+    monkeypatch.setattr(Config, "STREAM_REPLIES", False)
+    handler = TelegramBotHandler(updater=False)
+    handler.admission.debouncer.delay = 0
+    agent = handler.agent
+    class Recovering(ScriptedModel):
+        down = True
+
+        def _next(self):
+            self.calls += 1
+            if self.down:
+                raise Overloaded()
+            return AIMessage(content="Fresh analysis")
+
+    agent.llm = Recovering()
+    agent.resilience = _caller(threshold=1, cooldown=0.05, max_retries=0)
+    replies = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    def update():
+        message = SimpleNamespace(text="flying over the sea", reply_text=reply_text)
+        return SimpleNamespace(effective_user=SimpleNamespace(id=42), message=message)
+
+    async def main():
+        await handler._handle_dream(update())
+        agent.llm.down = False
+        await asyncio.sleep(0.06)  # the user sends it again once the service is back
+        await handler._handle_dream(update())
+        await agent.aclose()
+
+    asyncio.run(main())
+    assert replies[1] == agent.FALLBACK_REPLY
+    assert replies[-1] == "Fresh analysis"
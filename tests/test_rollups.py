@@ -0,0 +1,51 @@
+from sqlalchemy import select
+
+from db.database import SessionLocal
+from db.models import EmotionDaily
+from db.repositories import ClassificationRepository, DreamRecord, DreamUnitOfWork, UserRepository
+from db.scripts.rebuild_rollups import aggregate_classifications, rebuild
+
+
+def _save(telegram_id: int, text: str, emotions=None):
+    return DreamUnitOfWork.save_batch([DreamRecord(telegram_id=telegram_id, text=text, analysis="analysis",
+                                                   emotions=emotions)])
+
+
+def _rollups():
+    with SessionLocal() as session:
+        return {
+            (row.user_id, row.day, row.emotion): (row.dreams, row.intensity_sum)
+            for row in session.scalars(select(EmotionDaily))
+        }
+
+
+def _expected():
+    with SessionLocal() as session:
+        totals = aggregate_classifications(session)
+    return {key: (count, total) for key, (count, total) in totals.items() if count or total}
+
+
+def test_rollups_follow_every_write_path(db):
+    _save(10, "first", [{"emotion": "joy", "intensity": 3}, {"emotion": "fear", "intensity": 0}])
+    _save(20, "second", [{"emotion": "fear", "intensity": 2}])
+    dream = _save(10, "third").dream_id
+    ClassificationRepository.create_many(dream, "local-emotions", [{"emotion": "joy", "intensity": 1}])
+    ClassificationRepository.create(dream, "calm", 2)
+
+    expected = _expected()
+    assert _rollups() == expected
+    assert {(emotion, count, total) for (_, _, emotion), (count, total) in expected.items()} == {
+        ("joy", 2, 4.0), ("fear", 1, 2.0), ("calm", 1, 2.0),
+    }
+
+
+def test_rebuild_restores_drifted_rollups_and_top_emotions_read_them(db):
+    _save(10, "first", [{"emotion": "joy", "intensity": 3}])
+    _save(10, "second", [{"emotion": "joy", "intensity": 1}, {"emotion": "fear", "intensity": 2}])
+    with SessionLocal() as session:
+        session.query(EmotionDaily).update({"dreams": 99})
+        session.commit()
+
+    rebuild()
+    assert _rollups() == _expected()
+    assert ClassificationRepository.top_emotions(UserRepository.find_id(10)) == [("joy", 2, 2.0), ("fear", 1, 2.0)]
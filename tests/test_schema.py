@@ -0,0 +1,57 @@
+import pytest
+from langchain_core.messages import AIMessage
+
+from agent.schema import (
+    ANALYSIS_TOOL, SECTIONS, AnalysisValidationError, analysis_from_message, validate_analysis,
+)
+from db.mappers import EMOTION_LABELS
+
+
+def _args(**overrides):
+    data = {key: f"  {title} text " for key, title in SECTIONS}
+    data["emotions"] = {label: 0 for label in EMOTION_LABELS}
+    data.update(overrides)
+    return data
+
+
+def test_valid_input_is_stripped_and_coerced():
+    emotions = {label: 0 for label in EMOTION_LABELS}
+    emotions.update(joy="high", fear="2", sadness=1.0)
+    analysis = validate_analysis(_args(emotions=emotions))
+    assert analysis.sections["key_elements"] == "Key Elements text"
+    assert analysis.render().startswith("Key Elements\nKey Elements text\n\nEmotional Analysis\n")
+    levels = {e["emotion"]: e["intensity"] for e in analysis.emotion_list()}
+    assert (levels["joy"], levels["fear"], levels["sadness"]) == (3, 2, 1)
+    assert [e["emotion"] for e in analysis.emotion_list()] == list(EMOTION_LABELS)
+
+
+@pytest.mark.parametrize("value", [4, -1, 1.5, True, "often", None])
+def test_out_of_range_intensity_is_rejected(value):
+    emotions = {label: 0 for label in EMOTION_LABELS}
+    emotions["anger"] = value
+    with pytest.raises(AnalysisValidationError, match="emotion 'anger' must be an integer"):
+        validate_analysis(_args(emotions=emotions))
+
+
+def test_every_problem_is_reported_at_once():
+    emotions = {label: 0 for label in EMOTION_LABELS[1:]}
+    with pytest.raises(AnalysisValidationError) as error:
+        validate_analysis(_args(key_elements="  ", reflection_tips=None, emotions=emotions))
+    problems = str(error.value).split("; ")
+    assert problems == [
+        "'key_elements' must be a non-empty string",
+        "'reflection_tips' must be a non-empty string",
+        f"emotion '{EMOTION_LABELS[0]}' is missing",
+    ]
+    with pytest.raises(AnalysisValidationError, match="'emotions' must be an object"):
+        validate_analysis(_args(emotions=[0] * len(EMOTION_LABELS)))
+    with pytest.raises(AnalysisValidationError, match="tool input must be an object"):
+        validate_analysis("not a dict")
+
+
+def test_analysis_is_read_from_the_tool_call():
+    call = {"name": ANALYSIS_TOOL["name"], "args": _args(), "id": "call_1"}
+    message = AIMessage(content="", tool_calls=[{"name": "other", "args": {}, "id": "call_0"}, call])
+    assert analysis_from_message(message).sections["reflection_tips"] == "Reflection Tips text"
+    with pytest.raises(AnalysisValidationError, match="did not call"):
+        analysis_from_message(AIMessage(content="plain text"))
@@ -0,0 +1,76 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agent.history import HistoryManager
+from agent.sessions import SessionStore
+
+
+class Loader:
+    def __init__(self, turns: int = 1):
+        self.turns = turns
+        self.calls = []
+
+    def __call__(self, telegram_id, limit):
+        self.calls.append(telegram_id)
+        messages = []
+        for n in range(min(self.turns, limit)):
+            messages += [HumanMessage(content=f"dream {n}"), AIMessage(content=f"analysis {n}")]
+        return messages
+
+
+def test_miss_loads_once_then_serves_from_memory():
+    loader = Loader(turns=2)
+    store = SessionStore(loader=loader)
+    session = store.get(1)
+    assert [m.content for m in session.messages] == ["dream 0", "analysis 0", "dream 1", "analysis 1"]
+    assert store.get(1) is session
+    assert loader.calls == [1]
+    assert store.total_chars == session.size()
+
+
+def test_least_recently_used_session_is_evicted():
+    loader = Loader()
+    store = SessionStore(max_sessions=2, loader=loader)
+    store.get(1), store.get(2)
+    store.get(1)  # 2 is now the oldest
+    store.get(3)
+    assert len(store) == 2
+    store.get(1)
+    assert loader.calls == [1, 2, 3]
+    store.get(2)
+    assert loader.calls == [1, 2, 3, 2]
+
+
+def test_character_budget_evicts_but_keeps_the_current_session():
+    store = SessionStore(max_chars=30, loader=Loader())
+    store.get(1)
+    store.append(1, "x" * 40, "y" * 40)
+    assert len(store) == 1 and store.total_chars > store.max_chars  # never evicts the session in use
+    store.get(2)
+    assert len(store) == 1
+    assert store.total_chars == store.get(2).size()
+
+
+def test_expired_session_is_reloaded():
+    loader = Loader()
+    store = SessionStore(ttl=0.05, loader=loader)
+    first = store.get(1)
+    time.sleep(0.1)
+    assert store.get(1) is not first
+    assert loader.calls == [1, 1]
+
+
+def test_append_folds_history_and_skips_evicted_sessions():
+    store = SessionStore(max_sessions=1, loader=Loader(turns=0),
+                         history=HistoryManager(token_budget=10_000, max_messages=4))
+    session = store.get(1)
+    for n in range(3):
+        store.append(1, f"dream {n}", f"analysis {n}")
+    assert [m.content for m in session.messages] == ["dream 1", "analysis 1", "dream 2", "analysis 2"]
+    assert len(session.summary_lines) == 1 and "dream 0" in session.summary_lines[0]
+
+    store.get(2)  # evicts 1
+    store.append(1, "late dream", "late analysis")
+    assert "late dream" not in [m.content for m in session.messages]
+    assert len(store) == 1
@@ -0,0 +1,32 @@
+from bot.streaming import split_message
+
+
+def _analysis(section_length: int) -> str:
+    return "".join(
+        f"**{title}**\n" + "word " * (section_length // 5) + "\n\n"
+        for title in ("Key Elements", "Emotional Analysis", "Psychological Interpretation")
+    )
+
+
+def test_short_text_is_one_message():
+    assert split_message("a short analysis") == ["a short analysis"]
+    assert split_message("") == []
+
+
+def test_splits_at_section_boundaries():
+    parts = split_message(_analysis(300), limit=700)
+    assert len(parts) == 2
+    assert parts[0].startswith("**Key Elements**") and "Emotional Analysis" in parts[0]
+    assert parts[1].startswith("**Psychological Interpretation**")
+
+
+def test_oversized_section_is_split_at_words_and_nothing_is_lost():
+    text = _analysis(3000)
+    parts = split_message(text, limit=1000)
+    assert all(len(part) <= 1000 for part in parts)
+    assert all(not part.endswith("wor") for part in parts)
+    assert " ".join(parts).split() == text.split()
+
+
+def test_text_without_separators_is_cut_at_the_limit():
+    assert split_message("x" * 2500, limit=1000) == ["x" * 1000, "x" * 1000, "x" * 500]
@@ -0,0 +1,48 @@
+from sqlalchemy import func, select
+
+from db.database import SessionLocal
+from db.models import ChatHistory, Classification, Dream, EmotionDaily, User
+from db.repositories import DreamRecord, DreamUnitOfWork, UserRepository, user_ids
+
+
+def _record(telegram_id: int, text: str, emotions=None) -> DreamRecord:
+    return DreamRecord(telegram_id=telegram_id, text=text, analysis=f"analysis of {text}",
+                       emotions=emotions, username=f"user_{telegram_id}")
+
+
+def _counts():
+    with SessionLocal() as session:
+        return {model.__tablename__: session.scalar(select(func.count()).select_from(model))
+                for model in (User, Dream, Classification, ChatHistory, EmotionDaily)}
+
+
+def test_save_batch_upserts_users_and_returns_ids_in_record_order(db):
+    existing = UserRepository.get_id(10, "user_10")
+    result = DreamUnitOfWork.save_batch([
+        _record(10, "first", [{"emotion": "joy", "intensity": 3}]),
+        _record(20, "second"),
+        _record(10, "third", [{"emotion": "fear", "intensity": 1}, {"emotion": "joy", "intensity": 1}]),
+    ])
+
+    with SessionLocal() as session:
+        texts = [session.get(Dream, dream_id).text for dream_id in result.dream_ids]
+        users = session.execute(select(User.telegram_id, User.id).order_by(User.telegram_id)).all()
+        processed = [session.get(Dream, dream_id).processed for dream_id in result.dream_ids]
+    assert texts == ["first", "second", "third"]
+    assert users[0] == (10, existing) and [telegram_id for telegram_id, _ in users] == [10, 20]
+    assert processed == [True, False, True]
+    assert user_ids.get(20) == users[1][1]
+    assert _counts() == {"users": 2, "dreams": 3, "classifications": 3, "chat_history": 3, "emotion_daily": 2}
+
+
+def test_statements_per_batch_not_per_dream(db):
+    joy = [{"emotion": "joy", "intensity": 2}]
+    one = DreamUnitOfWork.save_batch([_record(100, "alone", joy)])
+    many = DreamUnitOfWork.save_batch([_record(200 + n, f"dream {n}", joy) for n in range(20)])
+    # One statement per table, except that SQLite cannot batch the ordered RETURNING of the dream ids
+    assert many.round_trips - one.round_trips == (0 if db.dialect.name == "postgresql" else 19)
+
+
+def test_failed_save_writes_nothing(db):
+    assert DreamUnitOfWork.save_batch([_record(10, "ok"), _record(20, None)]) is None  # dreams.text is NOT NULL
+    assert _counts() == {"users": 0, "dreams": 0, "classifications": 0, "chat_history": 0, "emotion_daily": 0}
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+from telegram.ext import MessageHandler, filters
+
+from config import Config
+from db.update_queue import UpdateQueue
+
+
+def _payload(update_id: int, user_id: int, text: str = "a dream") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        },
+    }
+
+
+def test_one_update_per_user_in_order(db):
+    queue = UpdateQueue(lease_seconds=60)
+    first = queue.enqueue(_payload(1, 10))
+    second = queue.enqueue(_payload(2, 10))
+    other = queue.enqueue(_payload(3, 20))
+
+    assert [row[0] for row in queue.claim(10)] == [first, other]
+    assert queue.claim(10) == []  # leased, and user 10's next update waits for the first
+    queue.complete(first)
+    assert [(row[0], row[2]) for row in queue.claim(10)] == [(second, 1)]
+
+
+def test_redelivered_update_is_queued_once(db):
+    queue = UpdateQueue()
+    assert queue.enqueue(_payload(1, 10)) is not None
+    assert queue.enqueue(_payload(1, 10)) is None
+    assert queue.depth() == 1
+
+
+def test_expired_lease_is_handed_out_again(db):
+    queue = UpdateQueue(lease_seconds=0.05)
+    queued_id = queue.enqueue(_payload(1, 10))
+    assert [row[0] for row in queue.claim(1)] == [queued_id]
+    time.sleep(0.1)
+    assert [(row[0], row[2]) for row in queue.claim(1)] == [(queued_id, 2)]
+
+
+@pytest.fixture
+def worker(db, monkeypatch):
+    from bot.bot_handler import TelegramBotHandler
+    from bot.worker import UpdateWorker
+
+    monkeypatch.setattr(Config, "TELEGRAM_TOKEN", "123456:test")
+    handler = TelegramBotHandler(updater=False)
+    handler.app.handlers.clear()
+    handler.app._initialized = True  # process_update without Telegram's getMe
+    worker = UpdateWorker(handler, UpdateQueue(lease_seconds=60, max_attempts=2), concurrency=4, poll_interval=0.01)
+    yield worker
+    handler.agent.close()
+
+
+def test_handler_error_is_retried_then_dropped(worker, monkeypatch):
+    calls = []
+
+    async def failing(update, context):
+        calls.append(update.update_id)
+        raise RuntimeError("handler failed")
+
+    async def error_reply(update, context):
+        replies.append(context.error)
+
+    replies = []
+    worker.handler.app.add_handler(MessageHandler(filters.ALL, failing))
+    monkeypatch.setattr(worker.handler, "error_handler", error_reply)  # it would reply through Telegram
+    queue = worker.queue
+    monkeypatch.setattr(queue, "retry", lambda queued_id, attempts, delay=0.0: UpdateQueue.retry(queue, queued_id, attempts, delay))
+    queue.enqueue(_payload(1, 10))
+
+    async def run_twice():
+        for _ in range(2):
+            for claimed in queue.claim(4):
+                await worker._process(*claimed)
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run_twice())
+    assert calls == [1, 1]
+    assert len(replies) == 1  # one error message for the user, after the last attempt
+    assert queue.depth() == 0 and worker.processed == 0
+
+
+def test_handled_update_is_completed(worker):
+    worker.handler.app.add_handler(MessageHandler(filters.ALL, lambda update, context: asyncio.sleep(0)))
+    worker.queue.enqueue(_payload(1, 10))
+
+    async def run_once():
+        for claimed in worker.queue.claim(4):
+            await worker._process(*claimed)
+
+    asyncio.run(run_once())
+    assert worker.queue.depth() == 0 and worker.processed == 1
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import select
+
+from db.database import SessionLocal
+from db.models import Dream
+from db.repositories import DreamRecord
+from db.writer import DreamWriter
+
+
+def _record(text) -> DreamRecord:
+    return DreamRecord(telegram_id=7, text=text, analysis=f"analysis of {text}", username="user_7")
+
+
+def _texts():
+    with SessionLocal() as session:
+        return session.scalars(select(Dream.text).order_by(Dream.id)).all()
+
+
+def test_close_flushes_everything_accepted_in_one_batch(db):
+    saved = []
+    writer = DreamWriter(workers=1, linger=5.0, on_saved=lambda records, ids: saved.append((records, ids)))
+    for n in range(5):
+        writer.submit(_record(f"dream {n}"))
+    writer.close()  # returns before the linger would have expired
+
+    assert _texts() == [f"dream {n}" for n in range(5)]
+    assert len(saved) == 1 and [r.text for r in saved[0][0]] == _texts()
+    assert writer.metrics()["batches"] == 1 and writer.metrics()["saved"] == 5
+    with pytest.raises(RuntimeError):
+        writer.submit(_record("too late"))
+
+
+def test_bad_record_does_not_drop_its_batch(db):
+    saved_ids = []
+    writer = DreamWriter(workers=1, linger=5.0, on_saved=lambda records, ids: saved_ids.extend(ids))
+    for text in ("before", None, "after"):
+        writer.submit(_record(text))
+    writer.close()
+
+    assert _texts() == ["before", "after"]
+    assert len(saved_ids) == 2
+    assert writer.metrics()["saved"] == 2 and writer.metrics()["failed"] == 1
+
+
+def test_failing_callback_keeps_the_commit(db):
+    def broken(records, ids):
+        raise RuntimeError("index is down")
+
+    writer = DreamWriter(workers=2, on_saved=broken)
+    writer.submit(_record("kept"))
+    writer.close()
+    assert _texts() == ["kept"]
+    assert writer.metrics()["saved"] == 1
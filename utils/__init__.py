@@ -0,0 +1 @@
+"""Shared helpers for DreamDiary AI: logging setup, metrics and tracing."""
@@ -0,0 +1,39 @@
+"""Logging configuration: plain text for development, JSON lines for production."""
+
+import json
+import logging
+import time
+
+from config import Config
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any ``extra`` fields."""
+
+    _RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self._RESERVED})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level: str = None, fmt: str = None):
+    """Set up the root logger from LOG_LEVEL and LOG_FORMAT ("text" or "json")."""
+    handler = logging.StreamHandler()
+    if (fmt or Config.LOG_FORMAT) == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel((level or Config.LOG_LEVEL).upper())
+    # Every getUpdates poll would otherwise be logged at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
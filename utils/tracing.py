@@ -0,0 +1,39 @@
+"""Optional OpenTelemetry spans.
+
+With OTEL_ENABLED=true and opentelemetry installed, span() opens a real
+span, and asyncio context propagation links the spans of one Telegram
+update end to end. Otherwise span() does nothing.
+"""
+
+import logging
+from contextlib import contextmanager
+
+from config import Config
+
+_tracer = None
+_checked = False
+
+
+def _get_tracer():
+    global _tracer, _checked
+    if not _checked:
+        _checked = True
+        if Config.OTEL_ENABLED:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                logging.warning("OTEL_ENABLED is set but opentelemetry is not installed; tracing is off")
+            else:
+                _tracer = trace.get_tracer("dreamdiary")
+    return _tracer
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """A span named ``name`` as a child of the current one, if tracing is enabled."""
+    tracer = _get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None}) as current:
+        yield current